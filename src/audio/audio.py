@@ -1,20 +1,19 @@
-from dotenv import load_dotenv
-from elevenlabs import ElevenLabs, VoiceSettings
-from elevenlabs.play import play
-import tempfile
-import os
 import time
 from pathlib import Path
-from pydub import AudioSegment
 import soundfile as sf
-import pyrubberband as pyrb
 from consts.test_consts import AUDIO_FILE
-import fal_client
-import requests
-from typing import List
+from typing import List, Tuple
+import concurrent.futures
+import numpy as np
+from cache.cache import get_cache, make_key
+from fetch.fetcher import get_fetcher
+from limits.limiter import get_limiter
+from providers.providers import get_fal_client
 
 
-load_dotenv()
+TTS_MODEL = "fal-ai/orpheus-tts"
+ROOT_SRC = Path(__file__).resolve().parent.parent
+DATA_PATH = ROOT_SRC / "data"
 
 
 class FalClient:
@@ -25,49 +24,185 @@ class FalClient:
         """
             Returnes url with data
         """
-        handler = fal_client.submit(
-            "fal-ai/orpheus-tts",
-            arguments={
-                "text": text_to_read
-            },
-            webhook_url="https://optional.webhook.url/for/results",
-        )
-
-        request_id = handler.request_id
-        return fal_client.result("fal-ai/orpheus-tts", request_id)
-
-    def text_to_speech_convert(self, text_to_read: str) -> str:
+        fal_client = get_fal_client()
+        with get_limiter("fal-orpheus-tts").slot():
+            handler = fal_client.submit(
+                TTS_MODEL,
+                arguments={
+                    "text": text_to_read
+                },
+                webhook_url="https://optional.webhook.url/for/results",
+            )
+
+            request_id = handler.request_id
+            return fal_client.result(TTS_MODEL, request_id)
+
+    def text_to_speech_convert(self, text_to_read: str, refresh: bool = False) -> str:
         """
             Generator function returning stream for audio processing.
+            refresh skips the cached link (e.g. it no longer downloads) and generates a new one.
         """
-        url = self.__submit(text_to_read).get("audio", None).get("url", None)
+        cache = get_cache()
+        key = make_key(provider="fal", model=TTS_MODEL, inputs={"text": text_to_read})
+        if not refresh:
+            cached_url = cache.get(key)
+            if cached_url:
+                return cached_url
+
+        result = self.__submit(text_to_read)
+        audio = result.get("audio") if isinstance(result, dict) else None
+        url = audio.get("url") if isinstance(audio, dict) else None
 
         if not url:
-            raise Exception("No audio generated")
+            raise Exception(f"No audio generated: {result}")
+        cache.set(key, url)
         return url
 
 
 
+def download_audio(url: str) -> Path:
+    """
+        Downloads generated audio into the asset store, returns its path there.
+    """
+    return get_fetcher().fetch_asset(url)
+
+
+def generate_audio_chunk(text: str, attempts: int = 3) -> Path:
+    """
+        Generates a single chunk of narration, returns the downloaded file
+        (checked to be readable audio). Only this chunk is retried on failure,
+        retries generate a new link instead of downloading the cached one again.
+    """
+    client = FalClient()
+    for attempt in range(1, attempts + 1):
+        try:
+            url = client.text_to_speech_convert(text, refresh=attempt > 1)
+            path = download_audio(url)
+            sf.info(str(path))
+            return path
+        except Exception as exc:
+            if attempt == attempts:
+                raise
+            print(f"Audio chunk failed (attempt {attempt}/{attempts}): {exc}")
+            time.sleep(2 ** attempt)
+
+
+class NarrationWriter:
+    """
+        Stitches chunk files sample-accurately (no padding between them) into one wav,
+        in order, while chunks still arrive out of order: a chunk is appended as soon as
+        all chunks before it were, and copied in blocks, so memory doesn't grow with
+        the narration length.
+    """
+
+    def __init__(self, output_path: Path, chunks: int, block_frames: int = 65536):
+        self.output_path = output_path
+        self.tmp_path = output_path.with_suffix(".tmp.wav")
+        self.block_frames = block_frames
+        self._paths: List[Path | None] = [None] * chunks
+        self._next = 0
+        self._out: sf.SoundFile | None = None
+        self._position = 0
+        # start of every chunk in seconds
+        self.offsets: List[float] = []
+
+    def add(self, index: int, path: Path):
+        self._paths[index] = path
+        while self._next < len(self._paths) and self._paths[self._next] is not None:
+            self.__append(self._paths[self._next])
+            self._paths[self._next] = None
+            self._next += 1
+
+    def __append(self, path: Path):
+        with sf.SoundFile(str(path)) as chunk:
+            if self._out is None:
+                self.output_path.parent.mkdir(parents=True, exist_ok=True)
+                self._out = sf.SoundFile(self.tmp_path, mode="w", samplerate=chunk.samplerate,
+                                         channels=chunk.channels, format="WAV")
+            if chunk.samplerate != self._out.samplerate:
+                raise Exception(f"Audio chunks have different sample rates: "
+                                f"{chunk.samplerate} and {self._out.samplerate}")
+            channels = self._out.channels
+            self.offsets.append(self._position / self._out.samplerate)
+            for block in chunk.blocks(blocksize=self.block_frames, dtype="float32", always_2d=True):
+                if block.shape[1] != channels:
+                    # mono chunk in a stereo file or the other way round
+                    block = np.repeat(block.mean(axis=1, keepdims=True), channels, axis=1)
+                self._out.write(block)
+                self._position += block.shape[0]
+
+    def close(self) -> List[float]:
+        """
+            Finishes the file, returns start offset of every chunk in seconds.
+        """
+        if self._next != len(self._paths):
+            self.abort()
+            raise Exception(f"Only {self._next} out of {len(self._paths)} audio chunks were generated")
+        if self._out is not None:
+            self._out.close()
+            self._out = None
+            self.tmp_path.replace(self.output_path)
+        return self.offsets
+
+    def abort(self):
+        if self._out is not None:
+            self._out.close()
+            self._out = None
+        self.tmp_path.unlink(missing_ok=True)
+
+
+def concat_audio_chunks(chunks: List[Path], output_path: Path) -> List[float]:
+    """
+        Stitches chunk files in order into one wav.
+        Returns start offset of every chunk in seconds.
+    """
+    writer = NarrationWriter(output_path, len(chunks))
+    for i, path in enumerate(chunks):
+        writer.add(i, path)
+    return writer.close()
+
+
 def generate_audio(text_to_read: List[str],
-                    test=False) -> Path:
+                    story_slug: str = "audio",
+                    test=False,
+                    max_workers: int | None = None) -> Tuple[Path, List[float] | None]:
     
     """
-        Generates audio in audio provider, returns link to the resource.
+        Generates audio for every chunk of text concurrently, and stitches them in order
+        into data/"story_slug"/audio/narration.wav as they arrive.
+
+        Returns the local path of the narration and start offset (in seconds) of every chunk.
     """
     if test:
-        return AUDIO_FILE
-    
-    # concurrenlty generate audio for each image, then concat the file
-    # FALAI CLIENT
-    fal_client = FalClient()
-    return fal_client.text_to_speech_convert(text_to_read)
-
-
+        return AUDIO_FILE, None
     
+    if isinstance(text_to_read, str):
+        text_to_read = [text_to_read]
+
+    # the provider limiter decides how many requests actually run at once
+    max_workers = max_workers or get_limiter("fal-orpheus-tts").max_concurrency
+    output_path = DATA_PATH / story_slug / "audio" / "narration.wav"
+    writer = NarrationWriter(output_path, len(text_to_read))
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            future_to_index = {
+                executor.submit(generate_audio_chunk, text): i
+                for i, text in enumerate(text_to_read)
+            }
+
+            for future in concurrent.futures.as_completed(future_to_index):
+                # a chunk that failed all of its retries fails the whole narration,
+                # successful ones stay cached for the next attempt
+                writer.add(future_to_index[future], future.result())
+    except BaseException:
+        writer.abort()
+        raise
+
+    return output_path, writer.close()
 
 
 if __name__ == "__main__":
-    print(generate_audio(text_to_read="Before I adopted Buster, my evenings were quiet. I'd come home from work, make dinner, watch some TV, and maybe read a book. My apartment was always spotless, and my schedule was entirely my own. Then came Buster, a scruffy terrier mix with the biggest, most soulful eyes I'd ever seen. He was a rescue, a bit timid at first, but full of an energy I hadn't anticipated.",
+    print(generate_audio(text_to_read=["Before I adopted Buster, my evenings were quiet. I'd come home from work, make dinner, watch some TV, and maybe read a book. My apartment was always spotless, and my schedule was entirely my own. Then came Buster, a scruffy terrier mix with the biggest, most soulful eyes I'd ever seen. He was a rescue, a bit timid at first, but full of an energy I hadn't anticipated."],
                 ))
 # speed_up_audio(Path("audio_original_1762291021.9402099.mp3"), speed_factor=2.0)
 
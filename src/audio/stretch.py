@@ -0,0 +1,59 @@
+import imageio_ffmpeg
+import subprocess
+from pathlib import Path
+from typing import List
+
+# atempo accepts factors in [0.5, 2.0] (larger ranges need a chain of filters)
+ATEMPO_MIN = 0.5
+ATEMPO_MAX = 2.0
+
+
+def atempo_factors(speed: float) -> List[float]:
+    if speed <= 0:
+        raise Exception(f"Playback speed has to be positive, got {speed}")
+    factors = []
+    while speed > ATEMPO_MAX:
+        factors.append(ATEMPO_MAX)
+        speed /= ATEMPO_MAX
+    while speed < ATEMPO_MIN:
+        factors.append(ATEMPO_MIN)
+        speed /= ATEMPO_MIN
+    factors.append(speed)
+    return factors
+
+
+def tempo_filter(speed: float, method: str = "atempo") -> str:
+    """
+        ffmpeg audio filter changing tempo without changing pitch.
+
+        method:
+            - "atempo": built into every ffmpeg build
+            - "rubberband": same algorithm as pyrubberband, needs ffmpeg built with librubberband
+    """
+    if method == "rubberband":
+        return f"rubberband=tempo={speed}"
+    if method == "atempo":
+        return ",".join(f"atempo={factor:.6f}" for factor in atempo_factors(speed))
+    raise Exception(f"Unknown time stretch method: {method}")
+
+
+def stretch_audio(source: Path, output_path: Path, speed: float, method: str = "atempo") -> Path:
+    """
+        Speeds audio up (or slows it down) keeping the pitch.
+
+        ffmpeg decodes, filters and encodes block by block, so peak memory stays
+        constant no matter how long the narration is (no full-file arrays, no temp files).
+    """
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    cmd = [
+        imageio_ffmpeg.get_ffmpeg_exe(), "-y", "-loglevel", "error",
+        "-i", str(source),
+        "-filter:a", tempo_filter(speed, method),
+        "-c:a", "pcm_s16le",
+        str(output_path),
+    ]
+    result = subprocess.run(cmd, capture_output=True)
+    if result.returncode != 0:
+        raise Exception(f"Time stretch failed: {result.stderr.decode('utf-8', errors='replace')}")
+    return output_path
@@ -0,0 +1,235 @@
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+ROOT_SRC = Path(__file__).resolve().parent.parent
+QUEUE_PATH = ROOT_SRC / "data" / "batch" / "queue.sqlite"
+
+# job lifecycle
+QUEUED = "queued"
+GENERATING = "generating"
+GENERATED = "generated"
+RENDERING = "rendering"
+DONE = "done"
+FAILED = "failed"
+# a second unfinished job of the same topic, found in a queue created before slugs were unique
+DUPLICATE = "duplicate"
+
+# jobs that are not finished yet, a topic is only queued once among them
+PENDING = (QUEUED, GENERATING, GENERATED, RENDERING, FAILED)
+
+
+def story_slug(topic: str) -> str:
+    """
+        Slug the pipeline derives from a topic (Pipeline.story_slug), it names the
+        checkpoint thread and the output paths of the job.
+    """
+    return topic.replace(" ", "_").lower()
+
+
+class JobQueue:
+    """
+        Persistent queue of topics to turn into videos, with per-job status.
+        Every call opens its own connection, so the queue can be used from many threads.
+    """
+
+    def __init__(self, path: Path = QUEUE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.__connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    topic TEXT NOT NULL,
+                    options TEXT NOT NULL DEFAULT '{}',
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    state_path TEXT,
+                    video_path TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+            """)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "slug" not in columns:
+                self.__add_slugs(conn)
+            placeholders = ",".join(f"'{status}'" for status in PENDING)
+            # sqlite itself rejects a second unfinished job of a topic
+            conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS jobs_pending_slug ON jobs (slug) "
+                         f"WHERE status IN ({placeholders})")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_slug ON jobs (slug, id)")
+
+    def __add_slugs(self, conn: sqlite3.Connection):
+        """
+            Queues created before the slug column: fills it in, older duplicates of
+            an unfinished topic are kept, later ones are marked DUPLICATE.
+        """
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("ALTER TABLE jobs ADD COLUMN slug TEXT")
+            pending = set()
+            for row in conn.execute("SELECT id, topic, status FROM jobs ORDER BY id").fetchall():
+                slug = story_slug(row["topic"])
+                status = row["status"]
+                if status in PENDING:
+                    if slug in pending:
+                        status = DUPLICATE
+                    pending.add(slug)
+                conn.execute("UPDATE jobs SET slug = ?, status = ? WHERE id = ?", (slug, status, row["id"]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    @contextmanager
+    def __connect(self):
+        # autocommit, transactions are opened explicitly where needed
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def __row(self, row: sqlite3.Row | None) -> Optional[Dict]:
+        if row is None:
+            return None
+        job = dict(row)
+        job["options"] = json.loads(job["options"] or "{}")
+        return job
+
+    def __enqueue(self, topic: str, options: Dict) -> Tuple[int, bool]:
+        """
+            (job id, whether it was added). Two jobs with the same slug would share the
+            checkpoint thread and output paths, so a topic that already has an unfinished job
+            isn't added again: a queued or running job is kept as it is, a failed one is
+            queued again with fresh attempts and the new options.
+        """
+        slug = story_slug(topic)
+        now = time.time()
+        with self.__connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                try:
+                    job_id = conn.execute(
+                        "INSERT INTO jobs (topic, slug, options, status, created_at, updated_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (topic, slug, json.dumps(options), QUEUED, now, now),
+                    ).lastrowid
+                    added = True
+                except sqlite3.IntegrityError:
+                    # rejected by jobs_pending_slug, the same index finds the job
+                    placeholders = ",".join("?" * len(PENDING))
+                    existing = conn.execute(f"SELECT id, status FROM jobs WHERE slug = ? AND status IN ({placeholders})",
+                                            (slug, *PENDING)).fetchone()
+                    job_id = existing["id"]
+                    added = existing["status"] == FAILED
+                    if added:
+                        conn.execute("UPDATE jobs SET status = ?, options = ?, attempts = 0, updated_at = ? "
+                                     "WHERE id = ?", (QUEUED, json.dumps(options), now, job_id))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return job_id, added
+
+    def enqueue(self, topic: str, **options) -> int:
+        """
+            Id of the new job, or of the unfinished job already queued for the same topic.
+        """
+        return self.__enqueue(topic, options)[0]
+
+    def import_jsonl(self, jsonl_path: Path) -> List[int]:
+        """
+            Enqueues topics from a file with one json object per line:
+            {"topic": "...", "test": false, "playback_speed": 1.5, "reuse_images": false}
+            Returns ids of the jobs that were queued; topics already queued or running are skipped.
+        """
+        ids = []
+        with open(jsonl_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                entry = json.loads(line)
+                topic = entry.pop("topic")
+                job_id, queued = self.__enqueue(topic, entry)
+                if queued:
+                    ids.append(job_id)
+                else:
+                    print(f"---SKIPPING '{topic}', ALREADY QUEUED AS JOB {job_id}---")
+        return ids
+
+    def claim(self, from_status: str, to_status: str) -> Optional[Dict]:
+        """
+            Atomically moves the oldest job in from_status to to_status and returns it.
+        """
+        with self.__connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? ORDER BY id LIMIT 1", (from_status,)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + ?, updated_at = ? WHERE id = ?",
+                    (to_status, 1 if to_status == GENERATING else 0, time.time(), row["id"]),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        job = self.__row(row)
+        job["status"] = to_status
+        if to_status == GENERATING:
+            job["attempts"] += 1
+        return job
+
+    def update(self, job_id: int, status: str, **fields):
+        allowed = {"error", "state_path", "video_path"}
+        columns = {k: v for k, v in fields.items() if k in allowed}
+        assignments = ", ".join(["status = ?", "updated_at = ?"] + [f"{k} = ?" for k in columns])
+        with self.__connect() as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?",
+                         (status, time.time(), *[str(v) if v is not None else None for v in columns.values()], job_id))
+
+    def requeue_failed(self, max_attempts: int = 3) -> int:
+        """
+            Puts failed jobs that still have attempts left back in the queue.
+        """
+        with self.__connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ? AND attempts < ?",
+                (QUEUED, time.time(), FAILED, max_attempts),
+            )
+            return cursor.rowcount
+
+    def recover_interrupted(self) -> int:
+        """
+            Jobs left in progress by a killed runner: generation restarts (it resumes from
+            the pipeline checkpoint), rendering restarts from the generated state.
+        """
+        with self.__connect() as conn:
+            now = time.time()
+            generating = conn.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE status = ?",
+                                      (QUEUED, now, GENERATING)).rowcount
+            rendering = conn.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE status = ?",
+                                     (GENERATED, now, RENDERING)).rowcount
+            return generating + rendering
+
+    def get(self, job_id: int) -> Optional[Dict]:
+        with self.__connect() as conn:
+            return self.__row(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def counts(self) -> Dict[str, int]:
+        with self.__connect() as conn:
+            return {row["status"]: row["n"] for row in
+                    conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")}
@@ -0,0 +1,142 @@
+import concurrent.futures
+import json
+import traceback
+from typing import Dict
+
+from batch.queue import JobQueue, QUEUED, GENERATING, GENERATED, RENDERING, DONE, FAILED
+from schemas.schemas import GraphState
+from catalog.similarity import PROMPT_REUSE_THRESHOLD
+from providers.providers import init_providers
+
+
+def generate_job(job: Dict) -> str:
+    """
+        Generation stage (I/O bound, runs in a thread): story, prompts, images, audio.
+        Returns path to the saved final state.
+    """
+    from pipeline.pipeline import Pipeline
+
+    options = job["options"]
+    pipeline = Pipeline(job["topic"],
+                        test=options.get("test", False),
+                        reuse_images=options.get("reuse_images", True),
+                        reuse_threshold=options.get("reuse_threshold", PROMPT_REUSE_THRESHOLD))
+    # continues from the last checkpoint when the job was attempted before
+    final_state = pipeline.resume()
+    if not final_state.photo_links or final_state.audio_path is None:
+        raise Exception("Pipeline didn't produce images and audio")
+    return str(Pipeline.ROOT_DATA / pipeline.story_slug / f"{pipeline.story_slug}.json")
+
+
+def render_job(job: Dict) -> str:
+    """
+        Render stage (CPU bound, runs in a worker process).
+        Returns path to the rendered video.
+    """
+    from video.editor import Editor
+
+    with open(job["state_path"], "r", encoding="utf-8") as f:
+        state = GraphState(**json.load(f))
+
+    options = job["options"]
+    editor = Editor(title=state.topic,
+                    playback_speed=options.get("playback_speed", 1.5),
+                    scenes=[prompt.model_dump() for prompt in state.image_prompts],
+                    audio_url=str(state.audio_path),
+                    audio_offsets=state.audio_offsets,
+                    image_urls=state.photo_links,
+                    render_workers=options.get("render_workers", 1),
+                    preview=options.get("preview", False),
+                    in_memory=options.get("in_memory", False))
+    return str(editor.create_video())
+
+
+class BatchRunner:
+    """
+        Turns queued topics into videos with two independent worker pools:
+        generation (threads, waits on providers) and rendering (processes, uses CPU).
+
+        As soon as a job finishes generation it is handed to the render pool, so
+        generation of the next jobs overlaps rendering of the previous ones.
+        Job status is kept in the JobQueue.
+    """
+
+    def __init__(self,
+                 queue: JobQueue,
+                 generation_workers: int = 4,
+                 render_workers: int = 1,
+                 max_attempts: int = 3,
+                 poll_interval: float = 0.5):
+
+        self.queue = queue
+        self.generation_workers = generation_workers
+        self.render_workers = render_workers
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+
+    def __fail(self, job: Dict, stage: str, exc: BaseException):
+        print(f"---JOB {job['id']} ({job['topic']}) FAILED IN {stage}: {exc}---")
+        self.queue.update(job["id"], FAILED, error=f"{stage}: {exc}\n{traceback.format_exc()}")
+
+    def run(self):
+        """
+            Processes jobs until the queue is drained (failed jobs are retried up to max_attempts).
+        """
+        recovered = self.queue.recover_interrupted()
+        if recovered:
+            print(f"---RECOVERED {recovered} INTERRUPTED JOBS---")
+
+        generating: Dict[concurrent.futures.Future, Dict] = {}
+        rendering: Dict[concurrent.futures.Future, Dict] = {}
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.generation_workers) as generation_pool, \
+             concurrent.futures.ProcessPoolExecutor(max_workers=self.render_workers) as render_pool:
+
+            while True:
+                # keep both pools saturated, but don't claim more than they can run
+                while len(generating) < self.generation_workers:
+                    job = self.queue.claim(QUEUED, GENERATING)
+                    if job is None:
+                        break
+                    if not job["options"].get("test", False):
+                        # dspy settings belong to the thread that configured them, this one,
+                        # not the generation threads (no-op once configured)
+                        init_providers()
+                    print(f"---JOB {job['id']}: GENERATING '{job['topic']}'---")
+                    generating[generation_pool.submit(generate_job, job)] = job
+
+                while len(rendering) < self.render_workers:
+                    job = self.queue.claim(GENERATED, RENDERING)
+                    if job is None:
+                        break
+                    print(f"---JOB {job['id']}: RENDERING '{job['topic']}'---")
+                    rendering[render_pool.submit(render_job, job)] = job
+
+                if not generating and not rendering:
+                    if self.queue.requeue_failed(self.max_attempts):
+                        continue
+                    break
+
+                done, _ = concurrent.futures.wait(list(generating) + list(rendering),
+                                                  timeout=self.poll_interval,
+                                                  return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    if future in generating:
+                        job = generating.pop(future)
+                        try:
+                            state_path = future.result()
+                            self.queue.update(job["id"], GENERATED, state_path=state_path, error=None)
+                        except Exception as exc:
+                            self.__fail(job, "generation", exc)
+                    else:
+                        job = rendering.pop(future)
+                        try:
+                            video_path = future.result()
+                            self.queue.update(job["id"], DONE, video_path=video_path, error=None)
+                            print(f"---JOB {job['id']} DONE: {video_path}---")
+                        except Exception as exc:
+                            self.__fail(job, "render", exc)
+
+        counts = self.queue.counts()
+        print(f"---BATCH FINISHED: {counts}---")
+        return counts
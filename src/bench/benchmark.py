@@ -0,0 +1,286 @@
+import argparse
+import concurrent.futures
+import functools
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from pydantic import BaseModel
+
+from bench.fakes import FakeDspy, FakeFal, FakeProviders, FakeWhisperModel, Latency, WORDS_PER_SECOND
+from bench.server import AssetServer
+
+ROOT_SRC = Path(__file__).resolve().parent.parent
+RESULTS_PATH = ROOT_SRC / "data" / "bench" / "results.jsonl"
+
+
+class Scenario(BaseModel):
+    name: str
+    scenes: int
+    audio_seconds: float  # narration length before the playback speed up
+    resolution: Tuple[int, int] = (1080, 1920)
+    fps: int = 24
+    playback_speed: float = 1.5
+    render_workers: int = 1
+    stream: bool = False  # hand images/audio to the editor while generating (see main.run_streaming)
+    in_memory: bool = False  # assets decoded in memory, shared with render workers (see Editor.in_memory)
+    llm: Latency = Latency(mean=2.0, spread=0.4)
+    image: Latency = Latency(mean=4.0, spread=0.5)
+    tts: Latency = Latency(mean=3.0, spread=0.5)
+    whisper: Latency = Latency(distribution="constant", mean=0.0)
+    download_latency: float = 0.05  # per request, on the asset server
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    scenario.name: scenario for scenario in [
+        Scenario(name="small", scenes=3, audio_seconds=20, resolution=(540, 960)),
+        Scenario(name="medium", scenes=8, audio_seconds=60),
+        Scenario(name="long", scenes=20, audio_seconds=180),
+        Scenario(name="many_scenes", scenes=40, audio_seconds=60),
+        Scenario(name="medium_streaming", scenes=8, audio_seconds=60, stream=True),
+        Scenario(name="parallel_render", scenes=8, audio_seconds=60, render_workers=4),
+        Scenario(name="parallel_render_in_memory", scenes=8, audio_seconds=60, render_workers=4, in_memory=True),
+        Scenario(name="flaky_providers", scenes=8, audio_seconds=60,
+                 image=Latency(mean=4.0, spread=1.0, failure_rate=0.1, throttle_rate=0.1),
+                 tts=Latency(mean=3.0, spread=1.0, failure_rate=0.1, throttle_rate=0.1)),
+    ]
+}
+
+
+class StageTimer:
+    """
+        Wraps functions/methods to record when each stage ran.
+        A stage called many times (possibly concurrently) reports the span from its
+        first start to its last end as wall time, and the summed call time as busy.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Dict[str, float]] = {}
+        self._saved: List[Tuple[object, str, object]] = []
+
+    def __record(self, label: str, start: float, end: float):
+        with self._lock:
+            stage = self._stages.setdefault(label, {"first_start": start, "last_end": end, "busy": 0.0, "calls": 0})
+            stage["first_start"] = min(stage["first_start"], start)
+            stage["last_end"] = max(stage["last_end"], end)
+            stage["busy"] += end - start
+            stage["calls"] += 1
+
+    def instrument(self, target, name: str, label: str):
+        original = vars(target)[name]
+        self._saved.append((target, name, original))
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.__record(label, start, time.perf_counter())
+
+        setattr(target, name, timed)
+
+    def restore(self):
+        while self._saved:
+            target, name, value = self._saved.pop()
+            setattr(target, name, value)
+
+    def wall(self, label: str) -> float:
+        stage = self._stages.get(label)
+        return stage["last_end"] - stage["first_start"] if stage else 0.0
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        return {
+            label: {"wall": round(stage["last_end"] - stage["first_start"], 4),
+                    "busy": round(stage["busy"], 4),
+                    "calls": stage["calls"]}
+            for label, stage in sorted(self._stages.items(), key=lambda item: item[1]["first_start"])
+        }
+
+
+def peak_rss_mb() -> Tuple[float, float]:
+    """
+        Peak resident memory of this process and of its largest child (ffmpeg, render workers), in MB.
+    """
+    # ru_maxrss is in kilobytes on linux
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return round(self_rss, 1), round(children_rss, 1)
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_SRC,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_scenario(scenario: Scenario, server_url: str, seed: int = 0) -> Dict:
+    """
+        Runs the whole pipeline + render of one scenario against fake providers,
+        with cold caches in a temporary directory. Meant to run in a fresh process,
+        so peak RSS belongs to this scenario only.
+    """
+    workdir = Path(tempfile.mkdtemp(prefix=f"bench_{scenario.name}_"))
+    # process wide caches pick these up on first use
+    os.environ["CONTENT_GEN_CACHE_DIR"] = str(workdir / "cache")
+    os.environ["CONTENT_GEN_ASSETS_DIR"] = str(workdir / "assets")
+    os.environ["CONTENT_GEN_SPANS_PATH"] = str(workdir / "spans.jsonl")
+    # an empty catalog, nothing is reused from earlier runs
+    os.environ["CONTENT_GEN_CATALOG_PATH"] = str(workdir / "catalog.sqlite")
+
+    import audio.audio
+    import pipeline.pipeline
+    import video.editor
+    from fetch.fetcher import get_fetcher
+    from imageio_ffmpeg import count_frames_and_secs
+    from pipeline.pipeline import Pipeline
+    from schemas.schemas import EncoderProfile
+    from video.editor import Editor
+
+    font_path = video.editor.DATA_PATH / "fonts" / "TikTokSans_28pt-Medium.ttf"
+    Pipeline.ROOT_DATA = workdir / "final_states"
+    Pipeline.CHECKPOINTS_PATH = workdir / "checkpoints" / "pipeline.sqlite"
+    audio.audio.DATA_PATH = workdir
+    video.editor.DATA_PATH = workdir
+
+    providers = FakeProviders(
+        dspy=FakeDspy(scenario.llm,
+                      story_words=int(scenario.audio_seconds * WORDS_PER_SECOND),
+                      scenes=scenario.scenes,
+                      seed=seed),
+        fal=FakeFal(server_url, scenario.image, scenario.tts, image_size=scenario.resolution, seed=seed),
+        whisper=FakeWhisperModel(scenario.whisper, seed=seed),
+    )
+
+    timer = StageTimer()
+    timer.instrument(pipeline.pipeline, "generate_story", "story")
+    timer.instrument(pipeline.pipeline, "generate_images_prompts", "image_prompts")
+    timer.instrument(pipeline.pipeline, "generate_image", "images")
+    timer.instrument(pipeline.pipeline, "generate_audio", "audio")
+    timer.instrument(Editor, "fetch_images", "fetch_images")
+    timer.instrument(video.editor, "preprocess_images", "preprocess_images")
+    # streamed images are preprocessed one by one, as they arrive
+    timer.instrument(video.editor, "resize_and_crop", "preprocess_images")
+    timer.instrument(Editor, "fetch_audio", "fetch_audio")
+    timer.instrument(Editor, "generate_subtitles", "subtitles")
+    timer.instrument(Editor, "determine_time", "determine_time")
+    timer.instrument(video.editor, "compose_timeline", "compose")
+    timer.instrument(Editor, "write_video", "encode")
+    timer.instrument(Editor, "write_video_parallel", "encode")
+
+    result = {"error": None}
+    started = time.perf_counter()
+    try:
+        with providers:
+            topic = f"bench {scenario.name}"
+            editor = Editor(title=topic,
+                            playback_speed=scenario.playback_speed,
+                            encoder_profile=EncoderProfile(),
+                            render_workers=scenario.render_workers,
+                            in_memory=scenario.in_memory)
+            editor.video_size = scenario.resolution
+            editor.fps = scenario.fps
+            editor.font_path = font_path
+
+            if scenario.stream:
+                pipeline_run = Pipeline(topic, on_image_ready=editor.prefetch_image,
+                                        on_audio_ready=editor.prefetch_audio)
+            else:
+                pipeline_run = Pipeline(topic)
+            state = pipeline_run.workflow_compile_and_run()
+            generation_wall = time.perf_counter() - started
+
+            editor.scenes = [prompt.model_dump() for prompt in state.image_prompts]
+            editor.image_urls = state.photo_links
+            editor.audio_url = str(state.audio_path)
+            editor.audio_offsets = state.audio_offsets
+
+            render_started = time.perf_counter()
+            video_path = editor.create_video()
+            render_wall = time.perf_counter() - render_started
+
+        frames, _ = count_frames_and_secs(str(video_path))
+        result.update({
+            "generation_wall": round(generation_wall, 4),
+            "render_wall": round(render_wall, 4),
+            "frames": frames,
+            "render_fps": round(frames / render_wall, 2),
+            "encode_fps": round(frames / timer.wall("encode"), 2) if timer.wall("encode") else None,
+            "images": len(state.photo_links),
+        })
+    except Exception as exc:
+        result["error"] = f"{type(exc).__name__}: {exc}"
+    finally:
+        timer.restore()
+
+    self_rss, children_rss = peak_rss_mb()
+    result.update({
+        "total_wall": round(time.perf_counter() - started, 4),
+        "stages": timer.report(),
+        "peak_rss_mb": self_rss,
+        "children_peak_rss_mb": children_rss,
+        "bytes_downloaded": get_fetcher().bytes_downloaded,
+        "providers": providers.stats(),
+        "workdir": str(workdir),
+    })
+    return result
+
+
+def run_isolated(scenario: Scenario, server_url: str, seed: int) -> Dict:
+    # spawn, not fork: fresh interpreter, fresh module state and an honest peak RSS
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(run_scenario, scenario, server_url, seed).result()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmarks the pipeline and rendering against local fake providers.")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), default=None,
+                        help="scenario to run, can be repeated (default: small, medium)")
+    parser.add_argument("--repeat", type=int, default=1, help="runs of every scenario")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the latency and failure sampling")
+    parser.add_argument("--output", type=Path, default=RESULTS_PATH,
+                        help="jsonl file the results are appended to")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    scenarios = [SCENARIOS[name] for name in (args.scenario or ["small", "medium"])]
+    commit = git_commit()
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+
+    with AssetServer() as server:
+        for scenario in scenarios:
+            for run in range(args.repeat):
+                server.latency = scenario.download_latency
+                print(f"---BENCH {scenario.name} ({run + 1}/{args.repeat})---")
+                result = {
+                    "scenario": scenario.name,
+                    "run": run,
+                    "commit": commit,
+                    "timestamp": time.time(),
+                    "params": scenario.model_dump(),
+                    **run_isolated(scenario, server.base_url, args.seed + run),
+                }
+                with open(args.output, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(result) + "\n")
+                print(f"---BENCH {scenario.name}: total {result['total_wall']:.1f}s, "
+                      f"render fps {result.get('render_fps')}, peak rss {result['peak_rss_mb']} MB, "
+                      f"error: {result['error']}---")
+
+    print(f"results appended to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+import hashlib
+import itertools
+import random
+import threading
+import time
+from types import SimpleNamespace
+from typing import Dict, List, Literal, Optional, Tuple
+
+import soundfile as sf
+from pydantic import BaseModel
+
+from bench.server import audio_url, image_url
+from schemas.schemas import ImagesPromptsOutput, StoryGenerationOutput
+
+# narration pace of the fake TTS and fake transcription
+WORDS_PER_SECOND = 2.5
+
+WORDS = ("the old house stood at the end of a quiet street where nobody ever walked after dark "
+         "until one evening a small dog found the door open and went inside looking for food").split()
+
+
+class FakeProviderError(Exception):
+    pass
+
+
+class Latency(BaseModel):
+    """
+        Response time and failure model of a fake provider.
+
+        constant:  always mean
+        uniform:   mean +- spread
+        lognormal: median mean, spread is sigma of the underlying normal (long tail)
+    """
+    distribution: Literal["constant", "uniform", "lognormal"] = "lognormal"
+    mean: float = 0.5
+    spread: float = 0.3
+    failure_rate: float = 0.0  # generic errors
+    throttle_rate: float = 0.0  # 429 like errors
+
+    def sample(self, rng: random.Random) -> float:
+        if self.distribution == "constant":
+            return self.mean
+        if self.distribution == "uniform":
+            return max(0.0, rng.uniform(self.mean - self.spread, self.mean + self.spread))
+        return self.mean * rng.lognormvariate(0.0, self.spread)
+
+    def wait(self, rng: random.Random, name: str):
+        """
+            Sleeps for a sampled latency, then fails with the configured probability.
+        """
+        time.sleep(self.sample(rng))
+        roll = rng.random()
+        if roll < self.throttle_rate:
+            raise FakeProviderError(f"{name}: HTTP 429 Too Many Requests (fake)")
+        if roll < self.throttle_rate + self.failure_rate:
+            raise FakeProviderError(f"{name}: HTTP 500 Internal Server Error (fake)")
+
+
+def _seed(*parts) -> str:
+    return hashlib.sha256("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:16]
+
+
+def fake_text(n_words: int, offset: int = 0) -> str:
+    words = [WORDS[(offset + i) % len(WORDS)] for i in range(max(1, n_words))]
+    return " ".join(words).capitalize() + "."
+
+
+class _Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+
+    def record(self, failed: bool):
+        with self._lock:
+            self.calls += 1
+            self.failures += int(failed)
+
+    def as_dict(self) -> Dict[str, int]:
+        return {"calls": self.calls, "failures": self.failures}
+
+
+class FakeDspy:
+    """
+        Stands in for the `dspy` module of story/story.py and images/prompt_story.py.
+        Only Predict is used at call time, it answers based on the signature's name.
+    """
+
+    def __init__(self, latency: Latency, story_words: int, scenes: int, seed: int = 0):
+        self.latency = latency
+        self.story_words = story_words
+        self.scenes = scenes
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.stats = _Stats()
+
+    def __wait(self, name: str):
+        with self._rng_lock:
+            rng = random.Random(self._rng.random())
+        try:
+            self.latency.wait(rng, name)
+        except FakeProviderError:
+            self.stats.record(failed=True)
+            raise
+        self.stats.record(failed=False)
+
+    def __story(self, topic: str):
+        story = StoryGenerationOutput(title=topic.capitalize(),
+                                      text=fake_text(self.story_words),
+                                      tldr=fake_text(8))
+        return SimpleNamespace(story=[story])
+
+    def __prompts(self, full_story_text: str):
+        words = full_story_text.split()
+        bounds = [round(i * len(words) / self.scenes) for i in range(self.scenes + 1)]
+        chunks = [
+            ImagesPromptsOutput(text=" ".join(words[start:end]) or fake_text(1),
+                                img_prompt=f"scene {i}: " + " ".join(words[start:end][:12]))
+            for i, (start, end) in enumerate(zip(bounds, bounds[1:]))
+        ]
+        return SimpleNamespace(story=chunks)
+
+    def Predict(self, signature):
+        name = signature.__name__
+
+        def predict(**inputs):
+            self.__wait(name)
+            if "topic" in inputs:
+                return self.__story(inputs["topic"])
+            return self.__prompts(inputs["full_story_text"])
+
+        return predict
+
+
+class _FakeHandle:
+    def __init__(self, client: "FakeFal", application: str, arguments: Dict, request_id: str):
+        self.client = client
+        self.application = application
+        self.arguments = arguments
+        self.request_id = request_id
+
+    def get(self) -> Dict:
+        return self.client.result(self.application, self.request_id)
+
+
+class FakeFal:
+    """
+        Stands in for `fal_client` in images/images.py and audio/audio.py.
+
+        Links point at an AssetServer (at server_url). Images are `image_size` big
+        (or the requested size), narration is as long as the text would take
+        to read at WORDS_PER_SECOND.
+    """
+
+    def __init__(self,
+                 server_url: str,
+                 image_latency: Latency,
+                 tts_latency: Latency,
+                 image_size: Optional[Tuple[int, int]] = None,
+                 seed: int = 0):
+        self.server_url = server_url
+        self.image_latency = image_latency
+        self.tts_latency = tts_latency
+        self.image_size = image_size
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._requests: Dict[str, Tuple[str, Dict]] = {}
+        self.stats = {"image": _Stats(), "tts": _Stats()}
+
+    def submit(self, application: str, arguments: Dict, **kwargs) -> _FakeHandle:
+        with self._lock:
+            request_id = f"fake-{next(self._ids)}"
+            self._requests[request_id] = (application, arguments)
+        return _FakeHandle(self, application, arguments, request_id)
+
+    def result(self, application: str, request_id: str) -> Dict:
+        with self._lock:
+            _, arguments = self._requests.pop(request_id)
+            rng = random.Random(self._rng.random())
+
+        kind = "tts" if "text" in arguments else "image"
+        latency = self.tts_latency if kind == "tts" else self.image_latency
+        try:
+            latency.wait(rng, application)
+        except FakeProviderError:
+            self.stats[kind].record(failed=True)
+            raise
+        self.stats[kind].record(failed=False)
+
+        if kind == "tts":
+            text = arguments["text"]
+            seconds = max(0.5, len(text.split()) / WORDS_PER_SECOND)
+            return {"audio": {"url": audio_url(self.server_url, seconds, _seed(text))}}
+
+        if self.image_size is not None:
+            width, height = self.image_size
+        else:
+            width, height = arguments["image_size"]["width"], arguments["image_size"]["height"]
+        return {"images": [{"url": image_url(self.server_url, width, height, _seed(arguments["prompt"]))}]}
+
+
+class FakeWhisperModel:
+    """
+        Stands in for faster_whisper.WhisperModel: evenly spaced words over the
+        whole audio, grouped in segments of `segment_words` (no model download).
+    """
+
+    def __init__(self, latency: Latency, segment_words: int = 12, seed: int = 0):
+        self.latency = latency
+        self.segment_words = segment_words
+        self._rng = random.Random(seed)
+
+    def transcribe(self, audio_path, word_timestamps: bool = True, **kwargs):
+        self.latency.wait(self._rng, "whisper")
+        duration = sf.info(str(audio_path)).duration
+        n_words = max(1, int(duration * WORDS_PER_SECOND))
+        step = duration / n_words
+
+        words = [
+            SimpleNamespace(start=i * step, end=(i + 1) * step, word=" " + WORDS[i % len(WORDS)])
+            for i in range(n_words)
+        ]
+        segments: List[SimpleNamespace] = [
+            SimpleNamespace(words=words[i:i + self.segment_words])
+            for i in range(0, n_words, self.segment_words)
+        ]
+        return segments, SimpleNamespace(language="en", duration=duration)
+
+
+class FakeProviders:
+    """
+        Swaps the real provider clients for fakes for the duration of the `with` block
+        (see providers.override_providers).
+    """
+
+    def __init__(self, dspy: FakeDspy, fal: FakeFal, whisper: Optional[FakeWhisperModel] = None):
+        self.dspy = dspy
+        self.fal = fal
+        self.whisper = whisper
+        self._saved: List[Tuple[object, str, object]] = []
+        self._overrides = None
+
+    def __patch(self, target, name: str, value):
+        # raw attribute, so classmethods are restored as classmethods
+        self._saved.append((target, name, vars(target)[name]))
+        setattr(target, name, value)
+
+    def __enter__(self):
+        from providers.providers import override_providers
+        self._overrides = override_providers(dspy=self.dspy, fal_client=self.fal)
+        self._overrides.__enter__()
+
+        if self.whisper is not None:
+            from video.transcription import WhisperModelPool
+            whisper = self.whisper
+            self.__patch(WhisperModelPool, "get", classmethod(lambda cls, *args, **kwargs: whisper))
+        return self
+
+    def __exit__(self, *exc):
+        while self._saved:
+            target, name, value = self._saved.pop()
+            setattr(target, name, value)
+        self._overrides.__exit__(*exc)
+        return False
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            "llm": self.dspy.stats.as_dict(),
+            "image": self.fal.stats["image"].as_dict(),
+            "tts": self.fal.stats["tts"].as_dict(),
+        }
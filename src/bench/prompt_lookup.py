@@ -0,0 +1,105 @@
+import argparse
+import json
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from bench.benchmark import RESULTS_PATH, git_commit
+from catalog.catalog import Catalog, IMAGE
+from catalog.similarity import PROMPT_REUSE_THRESHOLD
+
+SUBJECTS = ["fox", "hound", "student", "butterfly", "cat", "owl", "knight", "robot", "sailor", "child", "dragon",
+            "farmer", "deer", "wizard", "bear", "astronaut", "rabbit", "chef", "painter", "horse"]
+ADJECTIVES = ["russet", "grumpy", "tired", "colorful", "ginger", "curious", "ancient", "tiny", "brave", "sleepy",
+              "young", "old", "silver", "muddy", "cheerful", "lonely", "clever", "gentle", "wild", "shy"]
+ACTIONS = ["crouched low", "leaping", "sitting quietly", "running", "resting", "looking up", "reading a book",
+           "climbing", "laughing", "hiding", "dancing", "sleeping", "fishing", "eating berries", "waving"]
+PLACES = ["in a vegetable patch", "by a calm pond", "in a university library", "on a mossy forest floor",
+          "on a busy street", "in a dorm room", "on a snowy mountain", "in a desert", "on a beach", "in a castle",
+          "in a garden", "under a bridge", "in a kitchen", "on a rooftop", "in a meadow"]
+TIMES = ["at golden hour", "at night", "at dawn", "in the rain", "at noon", "in fog", "at sunset", "under stars"]
+STYLES = ["impressionistic art style", "watercolor", "digital art", "photorealistic", "oil painting",
+          "cinematic lighting, highly detailed", "pixel art", "storybook illustration"]
+
+
+def make_prompt(rng: random.Random) -> str:
+    return (f"A {rng.choice(ADJECTIVES)} {rng.choice(SUBJECTS)} {rng.choice(ACTIONS)} {rng.choice(PLACES)} "
+            f"{rng.choice(TIMES)}, with a {rng.choice(ADJECTIVES)} {rng.choice(SUBJECTS)} nearby, "
+            f"{rng.choice(STYLES)}, scene {rng.randrange(10 ** 6)}.")
+
+
+def run(prompts: int, queries: int, seed: int = 0, batch: int = 5000) -> Dict:
+    """
+        Indexes `prompts` synthetic image prompts in a fresh catalog, then times
+        find_similar_prompt for `queries` prompts: half reworded copies of indexed
+        prompts (should be found), half new ones.
+    """
+    rng = random.Random(seed)
+    catalog = Catalog(Path(tempfile.mkdtemp(prefix="bench_prompt_lookup_")) / "catalog.sqlite", enabled=True)
+
+    indexed: List[str] = []
+    started = time.perf_counter()
+    for first in range(0, prompts, batch):
+        rows = []
+        for i in range(first, min(first + batch, prompts)):
+            prompt = make_prompt(rng)
+            indexed.append(prompt)
+            rows.append(dict(slug=f"story_{i // 8}", kind=IMAGE, position=i % 8, prompt=prompt,
+                             url=f"https://cdn.example.com/{i}.png"))
+        catalog.add_assets(rows)
+    index_seconds = time.perf_counter() - started
+
+    latencies, found, expected = [], 0, 0
+    for q in range(queries):
+        if q % 2 == 0:
+            # same scene, different punctuation and boilerplate
+            query = indexed[rng.randrange(len(indexed))].replace(",", "").rstrip(".") + ", 4k"
+            expected += 1
+        else:
+            query = make_prompt(rng)
+        start = time.perf_counter()
+        match = catalog.find_similar_prompt(query, threshold=PROMPT_REUSE_THRESHOLD, exclude_slug="new_story")
+        latencies.append((time.perf_counter() - start) * 1000)
+        found += q % 2 == 0 and match is not None
+
+    latencies.sort()
+    return {
+        "prompts": prompts,
+        "queries": queries,
+        "index_seconds": round(index_seconds, 2),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 2),
+        "max_ms": round(latencies[-1], 2),
+        "recall": round(found / expected, 3) if expected else None,
+        "db_mb": round(catalog.path.stat().st_size / 1024 ** 2, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks similar prompt lookups in the catalog.")
+    parser.add_argument("--prompts", type=int, default=100_000, help="image prompts indexed before querying")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=RESULTS_PATH,
+                        help="jsonl file the results are appended to")
+    args = parser.parse_args()
+
+    result = {
+        "scenario": "prompt_lookup",
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        **run(args.prompts, args.queries, args.seed),
+    }
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "a", encoding="utf-8") as f:
+        f.write(json.dumps(result) + "\n")
+    print(f"---BENCH prompt_lookup: {result['prompts']} prompts, p50 {result['p50_ms']} ms, "
+          f"p95 {result['p95_ms']} ms, max {result['max_ms']} ms, recall {result['recall']}---")
+    print(f"results appended to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
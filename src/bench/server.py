@@ -0,0 +1,156 @@
+import hashlib
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from typing import Dict, Tuple
+
+import numpy as np
+import soundfile as sf
+from PIL import Image
+
+IMAGE_ROUTE = re.compile(r"^/image/(\d+)x(\d+)/(\w+)\.jpg$")
+AUDIO_ROUTE = re.compile(r"^/audio/(\d+(?:\.\d+)?)/(\w+)\.wav$")
+
+SAMPLE_RATE = 24000
+
+
+def image_url(base_url: str, width: int, height: int, seed: str) -> str:
+    return f"{base_url}/image/{width}x{height}/{seed}.jpg"
+
+
+def audio_url(base_url: str, seconds: float, seed: str) -> str:
+    return f"{base_url}/audio/{seconds:.2f}/{seed}.wav"
+
+
+def make_image(width: int, height: int, seed: str) -> bytes:
+    """
+        Deterministic test image with some detail (gradients + noise), so JPEG size and
+        decode cost are closer to a real photo than a flat color.
+    """
+    rng = np.random.default_rng(int(hashlib.sha256(seed.encode()).hexdigest()[:8], 16))
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = rng.uniform(0, 255, size=3)
+    image = np.stack([
+        (base[0] + 120 * np.sin(x / (37 + 13 * c) + c) + 80 * np.cos(y / (53 + 7 * c))) % 255
+        for c in range(3)
+    ], axis=-1)
+    image += rng.normal(0, 12, size=image.shape)
+    buffer = BytesIO()
+    Image.fromarray(np.clip(image, 0, 255).astype(np.uint8)).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def make_audio(seconds: float, seed: str) -> bytes:
+    """
+        Deterministic "speech like" audio: amplitude modulated tones of the given length.
+    """
+    rng = np.random.default_rng(int(hashlib.sha256(seed.encode()).hexdigest()[:8], 16))
+    t = np.arange(int(seconds * SAMPLE_RATE), dtype=np.float32) / SAMPLE_RATE
+    pitch = rng.uniform(110, 220)
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 3.0 * t)
+    signal = 0.3 * envelope * np.sin(2 * np.pi * pitch * t)
+    buffer = BytesIO()
+    sf.write(buffer, signal, SAMPLE_RATE, format="WAV", subtype="PCM_16")
+    return buffer.getvalue()
+
+
+class AssetServer:
+    """
+        Local HTTP server standing in for the provider CDN.
+
+        GET /image/<w>x<h>/<seed>.jpg   generated JPEG
+        GET /audio/<seconds>/<seed>.wav generated WAV
+
+        Assets are generated once and kept in memory, responses carry an ETag
+        (If-None-Match gets a 304) and can be delayed by `latency` seconds.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        self.latency = latency
+        self._assets: Dict[str, Tuple[bytes, str]] = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.bytes_sent = 0
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                server._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __asset(self, path: str) -> Tuple[bytes, str] | None:
+        with self._lock:
+            cached = self._assets.get(path)
+        if cached is not None:
+            return cached
+
+        match = IMAGE_ROUTE.match(path)
+        if match:
+            data, content_type = make_image(int(match[1]), int(match[2]), match[3]), "image/jpeg"
+        else:
+            match = AUDIO_ROUTE.match(path)
+            if not match:
+                return None
+            data, content_type = make_audio(float(match[1]), match[2]), "audio/wav"
+
+        with self._lock:
+            self._assets[path] = (data, content_type)
+        return data, content_type
+
+    def _handle(self, request: BaseHTTPRequestHandler):
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        asset = self.__asset(request.path)
+        if asset is None:
+            request.send_error(404)
+            return
+        data, content_type = asset
+        etag = '"' + hashlib.md5(data).hexdigest() + '"'
+
+        if request.headers.get("If-None-Match") == etag:
+            request.send_response(304)
+            request.send_header("ETag", etag)
+            request.send_header("Content-Length", "0")
+            request.end_headers()
+            return
+
+        request.send_response(200)
+        request.send_header("Content-Type", content_type)
+        request.send_header("Content-Length", str(len(data)))
+        request.send_header("ETag", etag)
+        request.end_headers()
+        request.wfile.write(data)
+        self.bytes_sent += len(data)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
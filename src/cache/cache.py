@@ -0,0 +1,245 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+ROOT_SRC = Path(__file__).resolve().parent.parent
+CACHE_PATH = Path(os.getenv("CONTENT_GEN_CACHE_DIR", ROOT_SRC / "data" / "cache"))
+
+# defaults can be overriden through the environment (.env)
+MAX_CACHE_BYTES = int(os.getenv("CONTENT_GEN_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+MAX_CACHE_AGE = float(os.getenv("CONTENT_GEN_CACHE_MAX_AGE", 30 * 24 * 3600))
+CACHE_ENABLED = os.getenv("CONTENT_GEN_CACHE", "1") != "0"
+
+_MISSING = object()
+
+
+def _normalize(value: Any) -> Any:
+    """
+        Brings inputs to a canonical form, so that irrelevant differences
+        (whitespace, dict ordering, pydantic vs dict) don't change the key.
+    """
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if hasattr(value, "model_dump"):
+        return _normalize(value.model_dump(mode="json"))
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in sorted(value.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, Path):
+        return str(value)
+    return value
+
+
+def make_key(provider: str, model: str, inputs: Any, params: Optional[Dict[str, Any]] = None) -> str:
+    """
+        Content address of a generation call:
+        sha256 over (provider, model, normalized inputs, generation params)
+    """
+    payload = {
+        "provider": provider,
+        "model": model,
+        "inputs": _normalize(inputs),
+        "params": _normalize(params or {}),
+    }
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+class DiskCache:
+    """
+        Persistent, content addressed cache for generation results.
+
+        Values are pickled into <root>/values/<ab>/<key>.pkl, raw bytes
+        (downloaded media) are stored as <root>/blobs/<ab>/<key>.bin.
+        Entries older than max_age are treated as misses, and once the total size
+        exceeds max_bytes the least recently used entries are removed.
+    """
+
+    def __init__(self,
+                 root: Path = CACHE_PATH,
+                 max_bytes: int = MAX_CACHE_BYTES,
+                 max_age: float = MAX_CACHE_AGE,
+                 enabled: bool = CACHE_ENABLED):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        # eviction walks the whole cache, so don't do it on every write
+        self._writes_since_evict = 0
+        self._evict_every = 50
+
+    def __path(self, kind: str, key: str) -> Path:
+        suffix = ".pkl" if kind == "values" else ".bin"
+        return self.root / kind / key[:2] / f"{key}{suffix}"
+
+    def __is_fresh(self, path: Path) -> bool:
+        try:
+            age = time.time() - path.stat().st_mtime
+        except FileNotFoundError:
+            return False
+        if self.max_age and age > self.max_age:
+            path.unlink(missing_ok=True)
+            return False
+        return True
+
+    def __write(self, path: Path, data: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # write to a temporary file first, so concurrent readers never see partial data
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.__written()
+
+    def __written(self):
+        with self._lock:
+            self._writes_since_evict += 1
+            should_evict = self._writes_since_evict >= self._evict_every
+            if should_evict:
+                self._writes_since_evict = 0
+        if should_evict:
+            self.evict()
+
+    def __touch(self, path: Path):
+        # access time drives LRU eviction, mtime drives expiry
+        try:
+            st = path.stat()
+            os.utime(path, (time.time(), st.st_mtime))
+        except OSError:
+            pass
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if not self.enabled:
+            return default
+        path = self.__path("values", key)
+        if not self.__is_fresh(path):
+            return default
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            # corrupted or written by incompatible code, regenerate
+            path.unlink(missing_ok=True)
+            return default
+        self.__touch(path)
+        return value
+
+    def set(self, key: str, value: Any):
+        if not self.enabled:
+            return
+        self.__write(self.__path("values", key), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        if not self.enabled:
+            return None
+        path = self.__path("blobs", key)
+        if not self.__is_fresh(path):
+            return None
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return None
+        self.__touch(path)
+        return data
+
+    def set_bytes(self, key: str, data: bytes):
+        if not self.enabled:
+            return
+        self.__write(self.__path("blobs", key), data)
+
+    def set_file(self, key: str, source: Path) -> Optional[Path]:
+        """
+            Moves a file (e.g. a rendered video) into the cache as a blob, without
+            reading it into memory. Returns its path in the cache.
+        """
+        if not self.enabled:
+            return None
+        path = self.__path("blobs", key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.replace(source, path)
+        except OSError:
+            # different filesystem, copy next to the target first so the swap stays atomic
+            tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            shutil.copyfile(source, tmp_path)
+            os.replace(tmp_path, path)
+            Path(source).unlink(missing_ok=True)
+        self.__written()
+        return path
+
+    def blob_path(self, key: str) -> Optional[Path]:
+        """
+            Returns path of a stored blob, so it can be copied without loading into memory.
+        """
+        if not self.enabled:
+            return None
+        path = self.__path("blobs", key)
+        if not self.__is_fresh(path):
+            return None
+        self.__touch(path)
+        return path
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        value = compute()
+        self.set(key, value)
+        return value
+
+    def evict(self):
+        """
+            Drops expired entries, then least recently used ones until the cache fits in max_bytes.
+        """
+        if not self.root.exists():
+            return
+
+        now = time.time()
+        entries = []
+        total = 0
+        for kind in ("values", "blobs"):
+            for path in (self.root / kind).glob("*/*"):
+                if path.suffix == ".tmp":
+                    continue
+                try:
+                    st = path.stat()
+                except FileNotFoundError:
+                    continue
+                if self.max_age and now - st.st_mtime > self.max_age:
+                    path.unlink(missing_ok=True)
+                    continue
+                entries.append((st.st_atime, st.st_size, path))
+                total += st.st_size
+
+        if not self.max_bytes or total <= self.max_bytes:
+            return
+
+        entries.sort(key=lambda e: e[0])
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+_default_cache: Optional[DiskCache] = None
+_default_lock = threading.Lock()
+
+
+def get_cache() -> DiskCache:
+    """
+        Process wide cache instance shared by all generation calls.
+    """
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = DiskCache()
+        return _default_cache
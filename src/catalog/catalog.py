@@ -0,0 +1,476 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from fetch.fetcher import normalize_url
+from schemas.schemas import GraphState
+from catalog.similarity import FEATURES_VERSION, band_hashes, jaccard, shingles
+
+ROOT_SRC = Path(__file__).resolve().parent.parent
+CATALOG_PATH = Path(os.getenv("CONTENT_GEN_CATALOG_PATH", ROOT_SRC / "data" / "catalog.sqlite"))
+FINAL_STATES_PATH = ROOT_SRC / "data" / "final_states"
+
+# defaults can be overriden through the environment (.env)
+CATALOG_ENABLED = os.getenv("CONTENT_GEN_CATALOG", "1") != "0"
+
+# job lifecycle
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# asset kinds
+IMAGE = "image"
+AUDIO = "audio"
+
+
+def prompt_hash(prompt: str) -> str:
+    """
+        sha256 of the prompt with whitespace normalized (same prompt, same hash).
+    """
+    return hashlib.sha256(" ".join(str(prompt).split()).encode("utf-8")).hexdigest()
+
+
+class Catalog:
+    """
+        Local index of everything the pipeline and the editor produced, across all stories:
+        generation jobs, GraphState snapshots, assets (prompt hash, url, content hash,
+        local path, size) and rendered videos.
+
+        Every lookup goes through a b-tree index (slug, prompt hash, content hash, url,
+        render key), so it stays O(log n) with tens of thousands of videos.
+        Every call opens its own connection, so the catalog can be used from many threads
+        and processes (render workers, batch runner).
+    """
+
+    def __init__(self, path: Path = CATALOG_PATH, enabled: bool = CATALOG_ENABLED):
+        self.path = Path(path)
+        self.enabled = enabled
+        if not enabled:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.__connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    slug TEXT NOT NULL,
+                    topic TEXT NOT NULL,
+                    test INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL,
+                    error TEXT,
+                    started_at REAL NOT NULL,
+                    finished_at REAL
+                );
+                CREATE INDEX IF NOT EXISTS jobs_slug ON jobs (slug, id);
+
+                CREATE TABLE IF NOT EXISTS states (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id INTEGER REFERENCES jobs (id),
+                    slug TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    path TEXT,
+                    created_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS states_slug ON states (slug, id);
+
+                CREATE TABLE IF NOT EXISTS assets (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    slug TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    position INTEGER,
+                    prompt TEXT,
+                    prompt_hash TEXT,
+                    url TEXT,
+                    content_hash TEXT,
+                    local_path TEXT,
+                    size INTEGER,
+                    created_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS assets_slug ON assets (slug, kind, position);
+                CREATE INDEX IF NOT EXISTS assets_prompt_hash ON assets (prompt_hash, id);
+                CREATE INDEX IF NOT EXISTS assets_content_hash ON assets (content_hash, id);
+                CREATE INDEX IF NOT EXISTS assets_url ON assets (url, id);
+                CREATE INDEX IF NOT EXISTS assets_local_path ON assets (local_path, id);
+
+                -- MinHash LSH bands of image prompts (see catalog/similarity.py)
+                CREATE TABLE IF NOT EXISTS prompt_bands (
+                    band INTEGER NOT NULL,
+                    hash INTEGER NOT NULL,
+                    asset_id INTEGER NOT NULL,
+                    PRIMARY KEY (band, hash, asset_id)
+                ) WITHOUT ROWID;
+
+                CREATE TABLE IF NOT EXISTS renders (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    slug TEXT NOT NULL,
+                    render_key TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    content_hash TEXT,
+                    size INTEGER,
+                    width INTEGER,
+                    height INTEGER,
+                    fps INTEGER,
+                    duration REAL,
+                    preview INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS renders_slug ON renders (slug, id);
+                CREATE INDEX IF NOT EXISTS renders_key ON renders (render_key, id);
+                CREATE INDEX IF NOT EXISTS renders_content_hash ON renders (content_hash, id);
+            """)
+            indexed_version = conn.execute("PRAGMA user_version").fetchone()[0]
+        # bands of another version of the features would never match a new prompt
+        if indexed_version != FEATURES_VERSION:
+            self.index_prompts()
+
+    @contextmanager
+    def __connect(self):
+        # autocommit, every statement is its own transaction
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def __one(self, query: str, params: tuple) -> Optional[Dict]:
+        if not self.enabled:
+            return None
+        with self.__connect() as conn:
+            row = conn.execute(query, params).fetchone()
+            return dict(row) if row is not None else None
+
+    def __all(self, query: str, params: tuple) -> List[Dict]:
+        if not self.enabled:
+            return []
+        with self.__connect() as conn:
+            return [dict(row) for row in conn.execute(query, params)]
+
+    # jobs and states
+
+    def start_job(self, slug: str, topic: str, test: bool = False) -> Optional[int]:
+        if not self.enabled:
+            return None
+        with self.__connect() as conn:
+            return conn.execute(
+                "INSERT INTO jobs (slug, topic, test, status, started_at) VALUES (?, ?, ?, ?, ?)",
+                (slug, topic, int(test), RUNNING, time.time()),
+            ).lastrowid
+
+    def finish_job(self, job_id: Optional[int], status: str = DONE, error: str | None = None):
+        if not self.enabled or job_id is None:
+            return
+        with self.__connect() as conn:
+            conn.execute("UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                         (status, error, time.time(), job_id))
+
+    def latest_job(self, slug: str) -> Optional[Dict]:
+        return self.__one("SELECT * FROM jobs WHERE slug = ? ORDER BY id DESC LIMIT 1", (slug,))
+
+    def add_state(self, slug: str, state: GraphState, path: Path | None = None, job_id: int | None = None):
+        if not self.enabled:
+            return
+        with self.__connect() as conn:
+            conn.execute("INSERT INTO states (job_id, slug, state, path, created_at) VALUES (?, ?, ?, ?, ?)",
+                         (job_id, slug, state.model_dump_json(), str(path) if path else None, time.time()))
+
+    def latest_state(self, slug: str) -> Optional[GraphState]:
+        row = self.__one("SELECT state FROM states WHERE slug = ? ORDER BY id DESC LIMIT 1", (slug,))
+        return GraphState(**json.loads(row["state"])) if row is not None else None
+
+    # assets
+
+    def add_asset(self,
+                  slug: str,
+                  kind: str,
+                  position: int | None = None,
+                  prompt: str | None = None,
+                  url: str | None = None,
+                  content_hash: str | None = None,
+                  local_path: Path | None = None,
+                  size: int | None = None) -> Optional[int]:
+        """
+            Rows of the same url are linked: the pipeline records an image with its prompt,
+            the editor with its bytes (content hash, local path), whichever comes first,
+            both rows end up with the prompt's image content.
+        """
+        ids = self.add_assets([dict(slug=slug, kind=kind, position=position, prompt=prompt, url=url,
+                                    content_hash=content_hash, local_path=local_path, size=size)])
+        return ids[0] if ids else None
+
+    def add_assets(self, assets: List[Dict]) -> List[int]:
+        """
+            add_asset for many assets (dicts of its arguments) in one transaction.
+        """
+        if not self.enabled:
+            return []
+        with self.__connect() as conn:
+            conn.execute("BEGIN")
+            try:
+                ids = [self.__insert_asset(conn, **asset) for asset in assets]
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            return ids
+
+    def __insert_asset(self,
+                       conn: sqlite3.Connection,
+                       slug: str,
+                       kind: str,
+                       position: int | None = None,
+                       prompt: str | None = None,
+                       url: str | None = None,
+                       content_hash: str | None = None,
+                       local_path: Path | None = None,
+                       size: int | None = None) -> int:
+        url = normalize_url(url) if url is not None else None
+        local_path = str(local_path) if local_path is not None else None
+        if url is not None and content_hash is None:
+            # a reused image's link is the local copy of an earlier one
+            known = conn.execute("SELECT content_hash, local_path, size FROM assets WHERE url = ? "
+                                 "AND content_hash IS NOT NULL ORDER BY id DESC LIMIT 1", (url,)).fetchone() \
+                or conn.execute("SELECT content_hash, local_path, size FROM assets WHERE local_path = ? "
+                                "AND content_hash IS NOT NULL ORDER BY id DESC LIMIT 1", (url,)).fetchone()
+            if known is not None:
+                content_hash, local_path, size = known["content_hash"], local_path or known["local_path"], \
+                    size or known["size"]
+        elif url is not None:
+            conn.execute("UPDATE assets SET content_hash = ?, local_path = COALESCE(local_path, ?), "
+                         "size = COALESCE(size, ?) WHERE url = ? AND content_hash IS NULL",
+                         (content_hash, local_path, size, url))
+        asset_id = conn.execute(
+            "INSERT INTO assets (slug, kind, position, prompt, prompt_hash, url, content_hash, local_path, "
+            "size, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (slug, kind, position, prompt, prompt_hash(prompt) if prompt is not None else None,
+             url, content_hash, local_path, size, time.time()),
+        ).lastrowid
+        if kind == IMAGE and prompt is not None and url is not None:
+            self.__index_prompt(conn, asset_id, prompt)
+        return asset_id
+
+    def __index_prompt(self, conn: sqlite3.Connection, asset_id: int, prompt: str):
+        conn.executemany("INSERT OR IGNORE INTO prompt_bands (band, hash, asset_id) VALUES (?, ?, ?)",
+                         [(band, value, asset_id) for band, value in enumerate(band_hashes(prompt))])
+
+    def index_prompts(self) -> int:
+        """
+            Rebuilds the similarity index of all image prompts (e.g. after changing the LSH parameters).
+        """
+        if not self.enabled:
+            return 0
+        with self.__connect() as conn:
+            conn.execute("BEGIN")
+            try:
+                conn.execute("DELETE FROM prompt_bands")
+                rows = conn.execute("SELECT id, prompt FROM assets WHERE kind = ? AND prompt IS NOT NULL "
+                                    "AND url IS NOT NULL", (IMAGE,)).fetchall()
+                for row in rows:
+                    self.__index_prompt(conn, row["id"], row["prompt"])
+                conn.execute(f"PRAGMA user_version = {FEATURES_VERSION}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    def assets(self, slug: str, kind: str | None = None) -> List[Dict]:
+        if kind is None:
+            return self.__all("SELECT * FROM assets WHERE slug = ? ORDER BY kind, position, id", (slug,))
+        return self.__all("SELECT * FROM assets WHERE slug = ? AND kind = ? ORDER BY position, id", (slug, kind))
+
+    def find_by_prompt(self, prompt: str, kind: str = IMAGE) -> Optional[Dict]:
+        """
+            Most recent asset generated from the same prompt (any story).
+        """
+        return self.__one("SELECT * FROM assets WHERE prompt_hash = ? AND kind = ? AND url IS NOT NULL "
+                          "ORDER BY id DESC LIMIT 1", (prompt_hash(prompt), kind))
+
+    def find_similar_prompt(self,
+                            prompt: str,
+                            threshold: float,
+                            exclude_slug: str | None = None,
+                            max_candidates: int = 200) -> Optional[Dict]:
+        """
+            Image generated from the most similar earlier prompt, if its similarity (Jaccard of
+            words and word pairs) reaches threshold, with a "similarity" field added.
+
+            An exact match is found by prompt hash; otherwise candidates sharing an LSH band
+            are looked up (one index probe per band) and scored exactly, so a query takes
+            milliseconds however many prompts are indexed. exclude_slug skips the images
+            of one story (a story shouldn't show the same image twice).
+        """
+        if not self.enabled:
+            return None
+        with self.__connect() as conn:
+            exact = conn.execute(
+                "SELECT * FROM assets WHERE prompt_hash = ? AND kind = ? AND url IS NOT NULL AND slug IS NOT ? "
+                "ORDER BY id DESC LIMIT 1", (prompt_hash(prompt), IMAGE, exclude_slug)).fetchone()
+            if exact is not None:
+                return {**dict(exact), "similarity": 1.0}
+
+            candidate_ids = set()
+            for band, value in enumerate(band_hashes(prompt)):
+                candidate_ids.update(row[0] for row in conn.execute(
+                    "SELECT asset_id FROM prompt_bands WHERE band = ? AND hash = ? ORDER BY asset_id DESC LIMIT ?",
+                    (band, value, max_candidates)))
+            if not candidate_ids:
+                return None
+            placeholders = ",".join("?" * len(candidate_ids))
+            candidates = conn.execute(
+                f"SELECT * FROM assets WHERE id IN ({placeholders}) AND slug IS NOT ?",
+                (*candidate_ids, exclude_slug)).fetchall()
+
+        features = shingles(prompt)
+        best, best_similarity = None, threshold
+        for candidate in candidates:
+            similarity = jaccard(features, shingles(candidate["prompt"]))
+            # ties go to the most recent image
+            if similarity > best_similarity or (similarity == best_similarity and
+                                                (best is None or candidate["id"] > best["id"])):
+                best, best_similarity = candidate, similarity
+        return {**dict(best), "similarity": best_similarity} if best is not None else None
+
+    def stored_copy(self, asset: Dict) -> Optional[Path]:
+        """
+            Local file of the asset, if it is still there with exactly the recorded bytes.
+        """
+        if not asset.get("content_hash") or not asset.get("local_path"):
+            return None
+        path = Path(asset["local_path"])
+        try:
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(block)
+        except OSError:
+            return None
+        return path if digest.hexdigest() == asset["content_hash"] else None
+
+    def find_by_content(self, content_hash: str) -> List[Dict]:
+        """
+            Every asset with exactly these bytes (duplicates across stories).
+        """
+        return self.__all("SELECT * FROM assets WHERE content_hash = ? ORDER BY id", (content_hash,))
+
+    def find_by_url(self, url: str) -> Optional[Dict]:
+        return self.__one("SELECT * FROM assets WHERE url = ? AND content_hash IS NOT NULL "
+                          "ORDER BY id DESC LIMIT 1", (normalize_url(url),))
+
+    # renders
+
+    def add_render(self,
+                   slug: str,
+                   render_key: str,
+                   path: Path,
+                   content_hash: str | None = None,
+                   size: int | None = None,
+                   width: int | None = None,
+                   height: int | None = None,
+                   fps: int | None = None,
+                   duration: float | None = None,
+                   preview: bool = False) -> Optional[int]:
+        if not self.enabled:
+            return None
+        with self.__connect() as conn:
+            return conn.execute(
+                "INSERT INTO renders (slug, render_key, path, content_hash, size, width, height, fps, duration, "
+                "preview, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (slug, render_key, str(path), content_hash, size, width, height, fps, duration, int(preview),
+                 time.time()),
+            ).lastrowid
+
+    def find_render(self, render_key: str) -> Optional[Dict]:
+        """
+            Latest video rendered from exactly the same inputs, if its file is still there unchanged.
+        """
+        for render in self.__all("SELECT * FROM renders WHERE render_key = ? ORDER BY id DESC", (render_key,)):
+            path = Path(render["path"])
+            if path.exists() and path.stat().st_size == render["size"]:
+                return render
+        return None
+
+    def renders(self, slug: str) -> List[Dict]:
+        return self.__all("SELECT * FROM renders WHERE slug = ? ORDER BY id", (slug,))
+
+    # existing output
+
+    def index_final_states(self, root: Path = FINAL_STATES_PATH) -> int:
+        """
+            Adds final states saved before the catalog existed (data/final_states/<slug>/<slug>.json),
+            with their image and audio links. Stories already in the catalog are skipped.
+        """
+        added = 0
+        for state_path in sorted(Path(root).glob("*/*.json")):
+            slug = state_path.stem
+            if self.latest_state(slug) is not None:
+                continue
+            try:
+                with open(state_path, "r", encoding="utf-8") as f:
+                    state = GraphState(**json.load(f))
+            except (OSError, ValueError) as e:
+                print(f"Skipping {state_path}: {e}")
+                continue
+            self.add_state(slug, state, path=state_path)
+            photo_links = state.photo_links or []
+            # links of failed images are missing, prompts only line up when all were generated
+            prompts = [p.img_prompt for p in state.image_prompts or []]
+            if len(prompts) != len(photo_links):
+                prompts = [None] * len(photo_links)
+            for position, (url, prompt) in enumerate(zip(photo_links, prompts)):
+                self.add_asset(slug, IMAGE, position=position, prompt=prompt, url=url)
+            if state.audio_path is not None:
+                self.add_asset(slug, AUDIO, url=state.audio_path)
+            added += 1
+        return added
+
+
+_default_catalog: Optional[Catalog] = None
+_default_lock = threading.Lock()
+
+
+def get_catalog() -> Catalog:
+    """
+        Process wide catalog.
+    """
+    global _default_catalog
+    with _default_lock:
+        if _default_catalog is None:
+            _default_catalog = Catalog()
+        return _default_catalog
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Looks up stories, assets and renders in the catalog.")
+    parser.add_argument("--slug", type=str, default=None, help="story to show")
+    parser.add_argument("--content-hash", type=str, default=None, help="assets with exactly these bytes")
+    parser.add_argument("--index-final-states", action="store_true",
+                        help="add final states saved before the catalog existed")
+    parser.add_argument("--index-prompts", action="store_true",
+                        help="rebuild the similarity index of image prompts")
+    parser.add_argument("--similar", type=str, default=None,
+                        help="image generated from the prompt most similar to this one")
+    args = parser.parse_args()
+
+    catalog = get_catalog()
+    if args.index_final_states:
+        print(f"---INDEXED {catalog.index_final_states()} STORIES---")
+    if args.index_prompts:
+        print(f"---INDEXED {catalog.index_prompts()} PROMPTS---")
+    if args.similar is not None:
+        print(json.dumps(catalog.find_similar_prompt(args.similar, threshold=0.0), indent=2, default=str))
+    if args.slug is not None:
+        print(json.dumps({
+            "job": catalog.latest_job(args.slug),
+            "assets": catalog.assets(args.slug),
+            "renders": catalog.renders(args.slug),
+        }, indent=2, default=str))
+    if args.content_hash is not None:
+        print(json.dumps(catalog.find_by_content(args.content_hash), indent=2, default=str))
@@ -0,0 +1,83 @@
+import hashlib
+import os
+import re
+from typing import List, Set
+
+import numpy as np
+
+# defaults can be overriden through the environment (.env)
+# prompts differing only in a few content words (time of day, one animal) score 0.6-0.75,
+# rewordings of the same scene 0.9 and more (see tests/test_similarity.py)
+PROMPT_REUSE_THRESHOLD = float(os.getenv("CONTENT_GEN_PROMPT_REUSE_THRESHOLD", 0.85))
+
+# 16 bands of 4 rows: prompts with a Jaccard similarity of 0.5 share a band with ~64%
+# probability, at 0.7 with ~99%; changing these (or shingles) requires a new FEATURES_VERSION,
+# the catalog then rebuilds its index (catalog.Catalog.index_prompts())
+FEATURES_VERSION = 2
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+_PRIME = (1 << 31) - 1
+# fixed seed, signatures have to stay comparable across processes and runs
+_rng = np.random.default_rng(20240601)
+_A = _rng.integers(1, _PRIME, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, NUM_PERM, dtype=np.uint64)
+
+STOPWORDS = {"a", "an", "the", "of", "and", "or", "with", "in", "on", "at", "to", "by", "for", "is", "its", "it",
+             "are", "as", "from", "into", "their", "his", "her", "this", "that", "while", "very"}
+
+# words image prompts repeat whatever they show, shared by unrelated prompts they would
+# outweigh the few words that tell the scenes apart
+BOILERPLATE = {"lighting", "light", "lit", "style", "art", "artwork", "scene", "image", "picture", "illustration",
+               "photo", "photograph", "shot", "view", "detailed", "highly", "high", "quality", "resolution",
+               "4k", "8k", "hd", "uhd", "digital", "render", "rendering", "cinematic", "realistic",
+               "photorealistic", "hyperrealistic", "vibrant", "beautiful", "stunning", "masterpiece",
+               "composition", "atmosphere", "mood", "colors", "colours", "tones", "background", "foreground",
+               "visible", "showing", "featuring", "depicting"}
+
+
+def shingles(text: str) -> Set[str]:
+    """
+        Words and pairs of neighbouring words of a prompt, lowercased, without punctuation,
+        stopwords and boilerplate.
+    """
+    words = [word for word in re.findall(r"[a-z0-9]+", str(text).lower())
+             if word not in STOPWORDS and word not in BOILERPLATE]
+    return set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def minhash(features: Set[str]) -> np.ndarray | None:
+    """
+        NUM_PERM min-hashes of the features (universal hashing of their 32 bit digests).
+    """
+    if not features:
+        return None
+    digests = np.array([
+        int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=4).digest(), "little")
+        for feature in features
+    ], dtype=np.uint64) % _PRIME
+    # a * x < 2^62, no overflow in uint64
+    hashed = (np.outer(_A, digests) + _B[:, None]) % _PRIME
+    return hashed.min(axis=1)
+
+
+def band_hashes(text: str) -> List[int]:
+    """
+        One signed 64 bit hash per LSH band of the prompt's signature (sqlite INTEGER sized),
+        prompts sharing any band hash are candidates for a close match.
+    """
+    signature = minhash(shingles(text))
+    if signature is None:
+        return []
+    return [
+        int.from_bytes(hashlib.blake2b(signature[band * ROWS:(band + 1) * ROWS].tobytes(), digest_size=8).digest(),
+                       "little", signed=True)
+        for band in range(BANDS)
+    ]
@@ -0,0 +1,395 @@
+import concurrent.futures
+import hashlib
+import io
+import json
+import os
+import random
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+ROOT_SRC = Path(__file__).resolve().parent.parent
+ASSETS_PATH = Path(os.getenv("CONTENT_GEN_ASSETS_DIR", ROOT_SRC / "data" / "assets"))
+
+# defaults can be overriden through the environment (.env)
+FETCH_MAX_CONCURRENCY = int(os.getenv("FETCH_MAX_CONCURRENCY", 8))
+FETCH_RETRIES = int(os.getenv("FETCH_RETRIES", 4))
+
+RETRY_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class RetryableError(Exception):
+    pass
+
+
+def normalize_url(url) -> str:
+    url = str(url)
+    # links stored as Path lose one slash: "https://a" -> "https:/a"
+    for scheme in ("https:/", "http:/"):
+        if url.startswith(scheme) and not url.startswith(scheme + "/"):
+            return url.replace(scheme, scheme + "/", 1)
+    return url
+
+
+class Fetcher:
+    """
+        Shared download subsystem backed by a local asset store.
+
+        - one keep-alive session (connection pool) per host
+        - bounded number of concurrent downloads
+        - retries with exponential backoff (and jitter) on network errors, 429 and 5xx
+        - interrupted downloads are resumed with an HTTP Range request
+        - stored assets are revalidated with If-None-Match / If-Modified-Since,
+          so fetching an unchanged asset again transfers no body;
+          assets without validators are treated as immutable and not requested again
+
+        Assets live in <store>/<ab>/<sha256(url)>.bin with a .json sidecar holding
+        the validators, partial downloads in .part files.
+
+        fetch_buffer downloads into memory instead, the store is written behind
+        in a background thread (see flush).
+    """
+
+    def __init__(self,
+                 store: Path = ASSETS_PATH,
+                 max_concurrency: int = FETCH_MAX_CONCURRENCY,
+                 pool_size: int = 16,
+                 retries: int = FETCH_RETRIES,
+                 backoff: float = 0.5,
+                 timeout=(10, 60),
+                 chunk_size: int = 1024 * 1024):
+
+        self.store = Path(store)
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+
+        self.max_concurrency = max_concurrency
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._sessions: Dict[str, requests.Session] = {}
+        self._sessions_lock = threading.Lock()
+        # one download per url at a time, concurrent callers wait and reuse the result;
+        # [lock, callers holding or waiting for it], removed when the last caller is done
+        self._url_locks: Dict[str, list] = {}
+
+        self.bytes_downloaded = 0
+        self._bytes_lock = threading.Lock()
+
+        self._write_behind: concurrent.futures.ThreadPoolExecutor | None = None
+        # (write, contents) of assets fetched into memory, by url
+        self._pending_writes: Dict[str, Tuple[concurrent.futures.Future, bytes]] = {}
+
+    def __session(self, url: str) -> requests.Session:
+        host = urlsplit(url).netloc
+        with self._sessions_lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._sessions[host] = session
+            return session
+
+    @contextmanager
+    def __url_lock(self, url: str):
+        with self._sessions_lock:
+            entry = self._url_locks.setdefault(url, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._sessions_lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._url_locks[url]
+
+    def __paths(self, url: str):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        base = self.store / key[:2] / key
+        return base.with_suffix(".bin"), base.with_suffix(".part"), base.with_suffix(".json")
+
+    def __read_meta(self, meta_path: Path) -> dict:
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def __count(self, n: int):
+        with self._bytes_lock:
+            self.bytes_downloaded += n
+
+    def __download(self, url: str) -> Path:
+        asset_path, part_path, meta_path = self.__paths(url)
+        asset_path.parent.mkdir(parents=True, exist_ok=True)
+        meta = self.__read_meta(meta_path)
+
+        headers = {}
+        if asset_path.exists():
+            if not meta.get("etag") and not meta.get("last_modified"):
+                return asset_path
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        resume_from = part_path.stat().st_size if part_path.exists() else 0
+        if resume_from:
+            headers["Range"] = f"bytes={resume_from}-"
+            # only resume if the resource didn't change in the meantime
+            if meta.get("partial_etag"):
+                headers["If-Range"] = meta["partial_etag"]
+
+        try:
+            response = self.__session(url).get(url, headers=headers, stream=True, timeout=self.timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise RetryableError(e)
+
+        with response:
+            if response.status_code == 304:
+                os.utime(asset_path)
+                return asset_path
+            if response.status_code == 416:
+                # partial file is broken or already complete, start over
+                part_path.unlink(missing_ok=True)
+                raise RetryableError(f"Range not satisfiable for {url}")
+            if response.status_code in RETRY_STATUS_CODES:
+                raise RetryableError(f"HTTP {response.status_code} for {url}")
+            response.raise_for_status()
+
+            etag = response.headers.get("ETag")
+            if response.status_code == 206:
+                mode = "ab"
+            else:
+                # server ignored Range (or there was none), write from the start
+                mode = "wb"
+                resume_from = 0
+
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump({**meta, "url": url, "partial_etag": etag}, f)
+
+            try:
+                with open(part_path, mode) as f:
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        f.write(chunk)
+                        self.__count(len(chunk))
+            except (requests.ConnectionError, requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError) as e:
+                # keep the .part file, next attempt resumes it
+                raise RetryableError(e)
+
+            expected = response.headers.get("Content-Length")
+            written = part_path.stat().st_size - resume_from
+            if expected is not None and response.headers.get("Content-Encoding") is None \
+                    and written != int(expected):
+                raise RetryableError(f"Incomplete download of {url}: {written}/{expected} bytes")
+
+            os.replace(part_path, asset_path)
+            self.__write_meta(url, asset_path, meta_path, etag, response.headers.get("Last-Modified"))
+            return asset_path
+
+    def __write_meta(self, url: str, asset_path: Path, meta_path: Path, etag: str | None, last_modified: str | None):
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "url": url,
+                "etag": etag,
+                "last_modified": last_modified,
+                "size": asset_path.stat().st_size,
+            }, f)
+
+    def __download_buffer(self, url: str):
+        """
+            Whole response body in memory, returns (body, response headers).
+        """
+        try:
+            response = self.__session(url).get(url, stream=True, timeout=self.timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise RetryableError(e)
+
+        with response:
+            if response.status_code in RETRY_STATUS_CODES:
+                raise RetryableError(f"HTTP {response.status_code} for {url}")
+            response.raise_for_status()
+
+            buffer = io.BytesIO()
+            try:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    buffer.write(chunk)
+                    self.__count(len(chunk))
+            except (requests.ConnectionError, requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError) as e:
+                raise RetryableError(e)
+
+            expected = response.headers.get("Content-Length")
+            if expected is not None and response.headers.get("Content-Encoding") is None \
+                    and buffer.tell() != int(expected):
+                raise RetryableError(f"Incomplete download of {url}: {buffer.tell()}/{expected} bytes")
+            return buffer.getvalue(), response.headers
+
+    def __persist(self, url: str, data: bytes, etag: str | None, last_modified: str | None,
+                  destination: Path | None):
+        asset_path, part_path, meta_path = self.__paths(url)
+        asset_path.parent.mkdir(parents=True, exist_ok=True)
+        # own temporary name, a resumable .part of a concurrent fetch_asset stays intact
+        tmp_path = asset_path.with_suffix(f".{threading.get_ident()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, asset_path)
+        self.__write_meta(url, asset_path, meta_path, etag, last_modified)
+        if destination is not None:
+            self.__place(asset_path, Path(destination))
+
+    def __pending_write(self, url: str):
+        with self._sessions_lock:
+            return self._pending_writes.get(url)
+
+    def __wait_pending_write(self, url: str):
+        pending = self.__pending_write(url)
+        if pending is not None:
+            # a failed write only means the asset is downloaded again
+            concurrent.futures.wait([pending[0]])
+
+    def __write_done(self, url: str, future: concurrent.futures.Future):
+        with self._sessions_lock:
+            if url in self._pending_writes and self._pending_writes[url][0] is future:
+                del self._pending_writes[url]
+        if future.exception() is not None:
+            print(f"Storing {url} failed: {future.exception()}")
+
+    def __retrying(self, url: str, download):
+        for attempt in range(self.retries + 1):
+            try:
+                return download(url)
+            except RetryableError as e:
+                if attempt == self.retries:
+                    raise Exception(f"Error downloading {url}: {e}")
+                delay = self.backoff * (2 ** attempt) * (1 + random.random())
+                print(f"Download of {url} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def fetch_buffer(self, url, destination: Path | None = None) -> bytes:
+        """
+            Asset contents, downloaded straight into memory.
+
+            The copy in the store (and at destination, if given) is written behind in a
+            background thread, callers don't wait for the disk. Assets already in the
+            store are revalidated and read from there, as in fetch_asset.
+        """
+        url = normalize_url(url)
+        if not url.startswith(("http://", "https://")):
+            return self.fetch_asset(url).read_bytes()
+
+        with self.__url_lock(url), self._semaphore:
+            pending = self.__pending_write(url)
+            if pending is not None:
+                # fetched a moment ago, still on its way to the disk
+                future, data = pending
+                if destination is not None:
+                    future.add_done_callback(lambda _: self.__place(self.__paths(url)[0], Path(destination)))
+                return data
+
+            asset_path = self.__paths(url)[0]
+            if asset_path.exists():
+                asset_path = self.__retrying(url, self.__download)
+                if destination is not None:
+                    self.__place(asset_path, Path(destination))
+                return asset_path.read_bytes()
+
+            data, headers = self.__retrying(url, self.__download_buffer)
+            with self._sessions_lock:
+                if self._write_behind is None:
+                    self._write_behind = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+                future = self._write_behind.submit(self.__persist, url, data, headers.get("ETag"),
+                                                   headers.get("Last-Modified"), destination)
+                self._pending_writes[url] = (future, data)
+            future.add_done_callback(lambda done: self.__write_done(url, done))
+            return data
+
+    def flush(self):
+        """
+            Waits for all written behind assets to be on disk.
+        """
+        with self._sessions_lock:
+            pending = [future for future, _ in self._pending_writes.values()]
+        concurrent.futures.wait(pending)
+
+    def fetch_asset(self, url) -> Path:
+        """
+            Makes sure the asset is in the local store and returns its path there.
+        """
+        url = normalize_url(url)
+        self.__wait_pending_write(url)
+
+        # narration is stitched locally, so the link can be a path on disk
+        if not url.startswith(("http://", "https://")):
+            if Path(url).exists():
+                return Path(url)
+            raise Exception(f"Asset {url} does not exist")
+
+        with self.__url_lock(url), self._semaphore:
+            return self.__retrying(url, self.__download)
+
+    def fetch(self, url, destination: Path) -> Path:
+        """
+            Fetches the asset and places a copy of it at destination.
+        """
+        return self.__place(self.fetch_asset(url), Path(destination))
+
+    def __place(self, asset_path: Path, destination: Path) -> Path:
+        if destination.resolve() == asset_path.resolve():
+            return destination
+        destination.unlink(missing_ok=True)
+        try:
+            # no copy when the store is on the same filesystem
+            os.link(asset_path, destination)
+        except OSError:
+            shutil.copyfile(asset_path, destination)
+        return destination
+
+    def resolves(self, url) -> bool:
+        """
+            Whether the link still serves something (e.g. a provider link recorded weeks ago),
+            without downloading it. Local paths resolve when the file exists.
+        """
+        url = normalize_url(url)
+        if not url.startswith(("http://", "https://")):
+            return Path(url).exists()
+        try:
+            with self._semaphore:
+                response = self.__session(url).head(url, allow_redirects=True, timeout=self.timeout)
+                if response.status_code in (405, 501):
+                    # HEAD not supported, the headers of a GET are enough
+                    with self.__session(url).get(url, stream=True, timeout=self.timeout) as response:
+                        return response.status_code < 400
+                return response.status_code < 400
+        except requests.RequestException:
+            return False
+
+    def fetch_bytes(self, url) -> bytes:
+        return self.fetch_asset(url).read_bytes()
+
+
+_default_fetcher: Optional[Fetcher] = None
+_default_lock = threading.Lock()
+
+
+def get_fetcher() -> Fetcher:
+    """
+        Process wide fetcher, shares connection pools and the concurrency limit.
+    """
+    global _default_fetcher
+    with _default_lock:
+        if _default_fetcher is None:
+            _default_fetcher = Fetcher()
+        return _default_fetcher
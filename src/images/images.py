@@ -1,20 +1,12 @@
-from google import genai
-from google.genai import types
-from PIL import Image
-from io import BytesIO
-import requests
-from dotenv import load_dotenv
-
-load_dotenv()
-
-
-from google import genai
-from google.genai import types
-from PIL import Image
-from io import BytesIO
 from pathlib import Path
 
 from consts.test_consts import IMAGE_LINK
+from cache.cache import get_cache, make_key
+from catalog.catalog import get_catalog
+from catalog.similarity import PROMPT_REUSE_THRESHOLD
+from fetch.fetcher import get_fetcher
+from limits.limiter import get_limiter
+from providers.providers import get_fal_client
 
 
 # client = genai.Client()
@@ -36,9 +28,14 @@ from consts.test_consts import IMAGE_LINK
 #         image.save("generated_image.png")
 
 
-import fal_client
-
+ROOT_SRC = Path(__file__).resolve().parent.parent
+DATA_PATH = ROOT_SRC / "data"
 
+IMAGE_MODEL = "fal-ai/flux/dev"
+IMAGE_SIZE = {
+    "width": 1080,
+    "height": 1920
+}
 
 # result = handler.get()
 # print(result)
@@ -52,9 +49,43 @@ import fal_client
 #     image.save("generated_image.png")
 #     print("Image saved as generated_image.png")
 
-def generate_image(prompt: str, test=False) -> str:
+def reuse_image(prompt: str, threshold: float, story_slug: str | None = None) -> str | None:
+    """
+      Link (or local path) of an image generated earlier from a similar prompt of another story.
+      The copy in the catalog is preferred, provider links expire, so a link is only
+      returned after checking it still resolves.
+      A stored copy is placed in this story's images, named after its content, so the story
+      doesn't depend on the other one's files staying around.
+    """
+    catalog = get_catalog()
+    match = catalog.find_similar_prompt(prompt, threshold=threshold, exclude_slug=story_slug)
+    if match is None:
+      return None
+
+    stored = catalog.stored_copy(match)
+    if stored is not None:
+      print(f"---REUSING STORED IMAGE (similarity {match['similarity']:.2f}) OF: {match['prompt']}---")
+      images_dir = DATA_PATH / story_slug / "images" if story_slug else DATA_PATH / "images"
+      images_dir.mkdir(parents=True, exist_ok=True)
+      own_copy = images_dir / f"reused_{match['content_hash'][:16]}{stored.suffix}"
+      # hard link when possible, the bytes aren't stored twice
+      return str(get_fetcher().fetch(stored, own_copy))
+    if get_fetcher().resolves(match["url"]):
+      print(f"---REUSING IMAGE (similarity {match['similarity']:.2f}) OF: {match['prompt']}---")
+      return match["url"]
+    print(f"---SIMILAR IMAGE {match['url']} IS GONE, GENERATING A NEW ONE---")
+    return None
+
+
+def generate_image(prompt: str,
+                   test=False,
+                   reuse_threshold: float | None = PROMPT_REUSE_THRESHOLD,
+                   story_slug: str | None = None) -> str:
     """
       Returns link to the resource
+      With reuse_threshold, the image of an earlier prompt of another story that is at least
+      that similar (see reuse_image) is returned instead of generating one,
+      None always generates.
       TODO:
         - probably we should handle regeneration here
     """
@@ -62,21 +93,37 @@ def generate_image(prompt: str, test=False) -> str:
     if test:
        return IMAGE_LINK
 
-    handler = fal_client.submit(
-      "fal-ai/flux/dev",
-      arguments={
-          "prompt": prompt,
-          "image_size": {
-                "width": 1080,
-                "height": 1920
-            }
-      },
-    )
-
-    result = handler.get()
+    if reuse_threshold is not None:
+      reused = reuse_image(prompt, reuse_threshold, story_slug)
+      if reused is not None:
+        return reused
+
+    cache = get_cache()
+    key = make_key(provider="fal", model=IMAGE_MODEL, inputs={"prompt": prompt},
+                   params={"image_size": IMAGE_SIZE})
+    cached_url = cache.get(key)
+    if cached_url:
+      # provider links expire long before the cache entry does
+      if get_fetcher().resolves(cached_url):
+        return cached_url
+      print(f"---CACHED IMAGE {cached_url} IS GONE, GENERATING A NEW ONE---")
+
+    fal_client = get_fal_client()
+    with get_limiter("fal-flux").slot():
+      handler = fal_client.submit(
+        IMAGE_MODEL,
+        arguments={
+            "prompt": prompt,
+            "image_size": IMAGE_SIZE
+        },
+      )
+
+      result = handler.get()
 
     if 'images' in result and len(result['images']) > 0:
-      return result['images'][0]['url']
+      url = result['images'][0]['url']
+      cache.set(key, url)
+      return url
     else:
        raise Exception("Unable to generate")
       
@@ -0,0 +1,152 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# provider -> (requests per second, initial concurrency, max concurrency, target latency in seconds)
+PROVIDER_LIMITS = {
+    "fal-flux": (5.0, 5, 16, 30.0),
+    "fal-orpheus-tts": (5.0, 4, 16, 30.0),
+    "gemini": (2.0, 2, 8, 60.0),
+}
+DEFAULT_LIMITS = (2.0, 2, 8, None)
+
+THROTTLE_MARKERS = ("429", "rate limit", "ratelimit", "too many requests", "resource_exhausted", "quota")
+
+
+def is_throttled(exc: BaseException) -> bool:
+    status = getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+    if status == 429:
+        return True
+    message = f"{type(exc).__name__} {exc}".lower()
+    return any(marker in message for marker in THROTTLE_MARKERS)
+
+
+class AdaptiveLimiter:
+    """
+        Limits calls to a single provider, shared by all threads of the process.
+
+        - token bucket: at most `rate` calls started per second (bursts up to `burst`)
+        - concurrency limit adjusted with AIMD: every successful call below
+          target_latency grows the limit additively (by ~1 per limit calls),
+          a throttled/failed call halves it (at most once per cooldown),
+          calls much slower than target_latency shrink it slightly.
+    """
+
+    def __init__(self,
+                 name: str,
+                 rate: float,
+                 initial_concurrency: int,
+                 max_concurrency: int,
+                 target_latency: Optional[float] = None,
+                 min_concurrency: int = 1,
+                 burst: Optional[float] = None):
+
+        self.name = name
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+
+        self._limit = float(min(max(initial_concurrency, min_concurrency), max_concurrency))
+        self._in_flight = 0
+        self._tokens = self.burst
+        self._refilled_at = time.monotonic()
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+        self.calls = 0
+        self.throttled = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def __refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def acquire(self):
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self.__refill(now)
+                if self._in_flight < self.limit and self._tokens >= 1:
+                    self._tokens -= 1
+                    self._in_flight += 1
+                    return
+                if self._in_flight >= self.limit:
+                    # woken up by release()
+                    self._condition.wait()
+                else:
+                    # wait for the next token
+                    self._condition.wait(timeout=(1 - self._tokens) / self.rate)
+
+    def release(self, latency: float, error: Optional[BaseException] = None):
+        with self._condition:
+            self._in_flight -= 1
+            self.calls += 1
+            now = time.monotonic()
+
+            if error is not None and is_throttled(error):
+                self.throttled += 1
+                self.__decrease(now, factor=0.5)
+            elif error is not None:
+                # other errors might be an overloaded provider too, back off gently
+                self.__decrease(now, factor=0.8)
+            elif self.target_latency is not None and latency > 2 * self.target_latency:
+                self.__decrease(now, factor=0.9)
+            elif self.target_latency is None or latency <= self.target_latency:
+                self._limit = min(self.max_concurrency, self._limit + 1 / self._limit)
+
+            self._condition.notify_all()
+
+    def __decrease(self, now: float, factor: float):
+        # several calls failing at once are a single congestion event
+        cooldown = self.target_latency or 1.0
+        if now - self._last_decrease < cooldown:
+            return
+        self._last_decrease = now
+        previous = self.limit
+        self._limit = max(self.min_concurrency, self._limit * factor)
+        if self.limit != previous:
+            print(f"---LIMITER {self.name}: concurrency {previous} -> {self.limit}---")
+
+    @contextmanager
+    def slot(self):
+        """
+            with limiter.slot():
+                call_provider()
+        """
+        self.acquire()
+        started = time.monotonic()
+        error = None
+        try:
+            yield
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            self.release(time.monotonic() - started, error)
+
+
+_limiters: Dict[str, AdaptiveLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider: str) -> AdaptiveLimiter:
+    """
+        Process wide limiter of a provider ("fal-flux", "fal-orpheus-tts", "gemini").
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(provider)
+        if limiter is None:
+            rate, initial, maximum, target_latency = PROVIDER_LIMITS.get(provider, DEFAULT_LIMITS)
+            limiter = AdaptiveLimiter(provider,
+                                      rate=rate,
+                                      initial_concurrency=initial,
+                                      max_concurrency=maximum,
+                                      target_latency=target_latency)
+            _limiters[provider] = limiter
+        return limiter
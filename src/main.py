@@ -1,5 +1,6 @@
-from pipeline.pipeline import Pipeline
-from video.editor import Editor
+from batch.queue import JobQueue, QUEUE_PATH
+from providers.providers import load_env
+import argparse
 import json
 from pathlib import Path
 
@@ -8,32 +9,143 @@ ROOT_SRC = Path(__file__).resolve().parent
 INPUT_DATA_PATH = ROOT_SRC / "data" / "final_states"
 DATA_PATH = ROOT_SRC / "data"
 
-if __name__ == "__main__":
-    # will be like
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generates short videos from topics.")
+    parser.add_argument("--batch", type=Path, default=None,
+                        help="jsonl file with one {\"topic\": ...} per line, enqueued and processed in batch")
+    parser.add_argument("--resume-queue", action="store_true",
+                        help="process the jobs left in the batch queue (interrupted, failed or not started)")
+    parser.add_argument("--queue", type=Path, default=QUEUE_PATH,
+                        help="sqlite file holding the batch queue and job statuses")
+    parser.add_argument("--generation-workers", type=int, default=4,
+                        help="jobs generated at the same time (waiting on providers)")
+    parser.add_argument("--render-workers", type=int, default=1,
+                        help="jobs rendered at the same time (CPU bound)")
+    parser.add_argument("--topic", type=str, default="First year of studies",
+                        help="topic of a single video (without --batch)")
+    parser.add_argument("--test", action=argparse.BooleanOptionalAction, default=True,
+                        help="use constant test data instead of calling the providers")
+    parser.add_argument("--playback-speed", type=float, default=1.5)
+    parser.add_argument("--preview", action="store_true",
+                        help="fast, low resolution draft render (same timing and subtitles)")
+    parser.add_argument("--in-memory", action="store_true",
+                        help="keep downloaded and decoded assets in memory, write them to disk in the background")
+    parser.add_argument("--reuse-images", action=argparse.BooleanOptionalAction, default=True,
+                        help="reuse images of earlier stories generated from similar prompts")
+    parser.add_argument("--reuse-threshold", type=float, default=None,
+                        help="similarity (0-1) a prompt needs to reuse an image, default from the environment")
+    parser.add_argument("--no-stream", action="store_true",
+                        help="render only after generation finished, from the saved final state")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve stage timings in the Prometheus text format on this port")
+    parser.add_argument("--startup-profile", action="store_true",
+                        help="print the import time of the pipeline, editor and providers and exit")
+    return parser.parse_args()
+
+
+def reuse_options(args) -> dict:
+    options = {"reuse_images": args.reuse_images}
+    if args.reuse_threshold is not None:
+        options["reuse_threshold"] = args.reuse_threshold
+    return options
+
+
+def run_streaming(args):
+    """
+        Generation and editing in one process: every image is fetched and preprocessed
+        as soon as it's generated, narration is sped up and transcribed as soon as
+        it's ready, so asset preparation overlaps generation.
+    """
+    from pipeline.pipeline import Pipeline
+    from video.editor import Editor
+
+    # 1. run pipeline, handing assets over to the editor as they are ready
+    editor = Editor(title=args.topic, playback_speed=args.playback_speed, preview=args.preview,
+                    in_memory=args.in_memory)
+    pipeline = Pipeline(args.topic,
+                        test=args.test,
+                        on_image_ready=editor.prefetch_image,
+                        on_audio_ready=editor.prefetch_audio,
+                        **reuse_options(args))
+    final_state = pipeline.workflow_compile_and_run()
+
+    # 2. run editor
+    editor.scenes = [prompt.model_dump() for prompt in final_state.image_prompts]
+    editor.image_urls = final_state.photo_links
+    editor.audio_url = str(final_state.audio_path)
+    editor.audio_offsets = final_state.audio_offsets
+    return editor.create_video()
+
+
+def run_from_state(args):
+    """
+        Generation first, then editing from the final state saved by the pipeline.
+    """
+    from pipeline.pipeline import Pipeline
+    from video.editor import Editor
+
     # 1. run pipeline
-    title = "First year of studies"
-    pipeline = Pipeline(title, test=True)
+    pipeline = Pipeline(args.topic, test=args.test, **reuse_options(args))
     pipeline.workflow_compile_and_run()
-    # 2. run editor
 
-    INPUT_DICT_PATH = INPUT_DATA_PATH / pipeline.story_slug / Path(f"{title}.json")
-    movie_data = None
+    # 2. run editor, from the state recorded in the catalog (or the saved file)
+    from catalog.catalog import get_catalog
 
-    try:
-        with open(INPUT_DICT_PATH, 'r') as json_file:
-            movie_data = json.load(json_file)
-    except:
-        raise Exception("file")
-    
-    TITLE = movie_data.get("title", None)
+    state = get_catalog().latest_state(pipeline.story_slug)
+    if state is not None:
+        movie_data = state.model_dump(mode="json")
+    else:
+        INPUT_DICT_PATH = INPUT_DATA_PATH / pipeline.story_slug / Path(f"{pipeline.story_slug}.json")
+        try:
+            with open(INPUT_DICT_PATH, 'r') as json_file:
+                movie_data = json.load(json_file)
+        except (OSError, ValueError) as e:
+            raise Exception(f"Unable to read final state {INPUT_DICT_PATH}: {e}")
 
-    editor = Editor(title=TITLE,
-                    playback_speed=1.5,
+    editor = Editor(title=movie_data["topic"],
+                    playback_speed=args.playback_speed,
                     scenes=movie_data["image_prompts"],
-                    audio_url=movie_data["audio_link"],
-                    image_urls=movie_data["photo_links"])
+                    audio_url=movie_data.get("audio_path") or movie_data.get("audio_link"),
+                    audio_offsets=movie_data.get("audio_offsets"),
+                    image_urls=movie_data["photo_links"],
+                    preview=args.preview,
+                    in_memory=args.in_memory)
     
-    editor.create_video()
+    return editor.create_video()
+
+
+def run_batch(args):
+    from batch.runner import BatchRunner
+
+    queue = JobQueue(args.queue)
+    if args.batch is not None:
+        ids = queue.import_jsonl(args.batch)
+        print(f"---ENQUEUED {len(ids)} JOBS---")
+    runner = BatchRunner(queue,
+                         generation_workers=args.generation_workers,
+                         render_workers=args.render_workers)
+    runner.run()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.startup_profile:
+        from metrics.startup import print_startup_profile
+        print_startup_profile()
+        raise SystemExit(0)
+
+    load_env()
+    if args.metrics_port is not None:
+        from metrics.spans import start_metrics_server
+        start_metrics_server(args.metrics_port)
+    if args.batch is not None or args.resume_queue:
+        run_batch(args)
+        raise SystemExit(0)
+
+    if args.no_stream:
+        run_from_state(args)
+    else:
+        run_streaming(args)
 
 
     # 3. upload video (for now has to be manual)
@@ -0,0 +1,216 @@
+import json
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+ROOT_SRC = Path(__file__).resolve().parent.parent
+SPANS_PATH = Path(os.getenv("CONTENT_GEN_SPANS_PATH", ROOT_SRC / "data" / "metrics" / "spans.jsonl"))
+METRICS_ENABLED = os.getenv("CONTENT_GEN_METRICS", "1") != "0"
+
+
+def _children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _peak_rss() -> int:
+    # ru_maxrss is in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _current_rss() -> int:
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def _bytes_downloaded() -> int:
+    from fetch.fetcher import get_fetcher
+    return get_fetcher().bytes_downloaded
+
+
+class Span:
+    """
+        One timed stage. Attributes can be added while it runs: span.set(frames=240)
+    """
+
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+class MetricsRecorder:
+    """
+        Collects finished spans: appends every span as a json line to `path`
+        and keeps per span name totals for the Prometheus endpoint.
+
+        Render worker processes append to the same file (one write per line),
+        totals only cover spans of the current process.
+    """
+
+    def __init__(self, path: Path = SPANS_PATH, enabled: bool = METRICS_ENABLED):
+        self.path = Path(path)
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._totals: Dict[str, Dict[str, float]] = {}
+
+    def record(self, entry: Dict[str, Any]):
+        if not self.enabled:
+            return
+        line = json.dumps(entry, default=str) + "\n"
+        with self._lock:
+            totals = self._totals.setdefault(entry["name"], {
+                "count": 0, "errors": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0,
+                "children_cpu_seconds": 0.0, "bytes_downloaded": 0, "frames": 0,
+            })
+            totals["count"] += 1
+            totals["errors"] += int(entry["status"] != "ok")
+            totals["wall_seconds"] += entry["wall"]
+            totals["cpu_seconds"] += entry["cpu"]
+            totals["children_cpu_seconds"] += entry["children_cpu"]
+            totals["bytes_downloaded"] += entry["bytes_downloaded"]
+            totals["frames"] += entry["attrs"].get("frames", 0)
+
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def prometheus(self) -> str:
+        """
+            Totals in the Prometheus text exposition format.
+        """
+        metrics = {
+            "count": ("content_gen_span_total", "counter", "Finished spans"),
+            "errors": ("content_gen_span_errors_total", "counter", "Spans that raised"),
+            "wall_seconds": ("content_gen_span_wall_seconds_total", "counter", "Wall time spent in spans"),
+            "cpu_seconds": ("content_gen_span_cpu_seconds_total", "counter", "Process CPU time spent in spans"),
+            "children_cpu_seconds": ("content_gen_span_children_cpu_seconds_total", "counter",
+                                     "CPU time of child processes (ffmpeg, workers) finished during spans"),
+            "bytes_downloaded": ("content_gen_span_bytes_downloaded_total", "counter", "Bytes downloaded during spans"),
+            "frames": ("content_gen_span_frames_total", "counter", "Video frames produced in spans"),
+        }
+        with self._lock:
+            totals = {name: dict(values) for name, values in self._totals.items()}
+
+        lines = []
+        for key, (metric, kind, help_text) in metrics.items():
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for name, values in sorted(totals.items()):
+                lines.append(f'{metric}{{span="{name}"}} {values[key]}')
+        lines.append("# HELP content_gen_peak_rss_bytes Peak resident memory of the process")
+        lines.append("# TYPE content_gen_peak_rss_bytes gauge")
+        lines.append(f"content_gen_peak_rss_bytes {_peak_rss()}")
+        return "\n".join(lines) + "\n"
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """
+            with recorder.span("editor.encode", story=slug) as s:
+                ...
+                s.set(frames=n)
+
+            Records wall time, CPU time of the process and of child processes that
+            finished meanwhile, bytes downloaded by the shared fetcher, current and
+            peak RSS and, when `frames` is set, the frame rate.
+            CPU time and downloaded bytes are process wide, so concurrent spans
+            (images and audio branches) see each other's work.
+        """
+        current = Span(name, dict(attrs))
+        if not self.enabled:
+            yield current
+            return
+
+        bytes_start = _bytes_downloaded()
+        peak_start = _peak_rss()
+        children_start = _children_cpu()
+        started_at = time.time()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        status, error = "ok", None
+        try:
+            yield current
+        except BaseException as exc:
+            status, error = "error", f"{type(exc).__name__}: {exc}"
+            raise
+        finally:
+            wall = time.perf_counter() - wall_start
+            peak = _peak_rss()
+            entry = {
+                "name": name,
+                "start": started_at,
+                "wall": round(wall, 6),
+                "cpu": round(time.process_time() - cpu_start, 6),
+                "children_cpu": round(_children_cpu() - children_start, 6),
+                "bytes_downloaded": _bytes_downloaded() - bytes_start,
+                "rss": _current_rss(),
+                "peak_rss": peak,
+                # how much this span raised the process' high-water mark
+                "peak_rss_growth": peak - peak_start,
+                "pid": os.getpid(),
+                "status": status,
+                "error": error,
+                "attrs": current.attrs,
+            }
+            frames = current.attrs.get("frames")
+            if frames and wall > 0:
+                entry["fps"] = round(frames / wall, 2)
+            self.record(entry)
+
+
+_default_recorder: Optional[MetricsRecorder] = None
+_default_lock = threading.Lock()
+
+
+def get_recorder() -> MetricsRecorder:
+    """
+        Process wide recorder.
+    """
+    global _default_recorder
+    with _default_lock:
+        if _default_recorder is None:
+            _default_recorder = MetricsRecorder()
+        return _default_recorder
+
+
+def span(name: str, **attrs):
+    """
+        Shortcut for get_recorder().span(name, **attrs)
+    """
+    return get_recorder().span(name, **attrs)
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """
+        Serves the recorder's totals at http://host:port/metrics in a daemon thread.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = get_recorder().prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"---METRICS AT http://{host}:{server.server_address[1]}/metrics---")
+    return server
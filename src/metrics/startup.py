@@ -0,0 +1,73 @@
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+ROOT_SRC = Path(__file__).resolve().parent.parent
+
+# what a command has to import before doing anything useful
+IMPORT_GROUPS: Dict[str, List[str]] = {
+    "startup": ["main"],
+    "pipeline": ["pipeline.pipeline"],
+    "editor": ["video.editor"],
+    "providers": ["dspy", "fal_client", "langgraph.graph"],
+    "render": ["video.timeline", "moviepy"],
+    "transcription": ["faster_whisper"],
+}
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def import_profile(modules: List[str], top: int = 10) -> Dict:
+    """
+        Imports `modules` in a fresh interpreter with -X importtime and returns their
+        total import time and the `top` slowest modules they import directly
+        (cumulative, in ms). Interpreter startup (site, encodings) is left out.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(ROOT_SRC), os.getenv("PYTHONPATH")])))
+    code = "; ".join(f"import {module}" for module in modules)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          cwd=ROOT_SRC, env=env, capture_output=True, text=True)
+
+    roots = {module.split(".")[0] for module in modules}
+    requested, direct, children = [], [], []
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        _, cumulative, indent, name = match.groups()
+        ms = int(cumulative) / 1000
+        # two spaces of indent per nesting level, top level imports are one space deep;
+        # children are printed before the module that imported them
+        if len(indent) == 3:
+            children.append((name, ms))
+        elif len(indent) == 1:
+            if name.split(".")[0] in roots:
+                requested.append(ms)
+                direct.extend(children)
+            children = []
+
+    error = None
+    if proc.returncode != 0:
+        error = (proc.stderr.strip().splitlines() or ["import failed"])[-1]
+    return {
+        "modules": modules,
+        "total_ms": round(sum(requested), 1),
+        "slowest": [(name, round(ms, 1)) for name, ms in sorted(direct, key=lambda item: -item[1])[:top]],
+        "error": error,
+    }
+
+
+def print_startup_profile(top: int = 10):
+    """
+        Import cost of every group in IMPORT_GROUPS, each measured in its own interpreter.
+    """
+    for group, modules in IMPORT_GROUPS.items():
+        profile = import_profile(modules, top=top)
+        print(f"---IMPORTS {group} ({', '.join(modules)}): {profile['total_ms']:.1f} ms---")
+        for name, ms in profile["slowest"]:
+            print(f"{ms:10.1f} ms  {name}")
+        if profile["error"]:
+            print(f"  error: {profile['error']}")
@@ -2,30 +2,74 @@
 
 from typing_extensions import TypedDict
 from langgraph.graph import StateGraph, START, END
-from typing import List, Tuple
+from typing import Callable, List, Tuple
 import concurrent.futures
 from pathlib import Path
+import sqlite3
+import time
 import uuid
-from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.sqlite import SqliteSaver
 
 from story.story import generate_story
 from schemas.schemas import ImagesPromptsOutput, GraphState
 from images.prompt_story import generate_images_prompts
 from images.images import generate_image
 from audio.audio import generate_audio
+from limits.limiter import get_limiter
+from metrics.spans import span
+from catalog.catalog import get_catalog, IMAGE, AUDIO, DONE, FAILED
+from catalog.similarity import PROMPT_REUSE_THRESHOLD
+from providers.providers import init_providers
 
 
 
+class _ClosingSaver(SqliteSaver):
+    """
+        SqliteSaver that owns its connection and closes it when leaving the context.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.conn.close()
+        return False
+
+
 class Pipeline:
     ROOT_DATA = Path(__file__).resolve().parent.parent / "data" / "final_states" 
-
-    def __init__(self, topic: str, test: bool =False):
+    CHECKPOINTS_PATH = Path(__file__).resolve().parent.parent / "data" / "checkpoints" / "pipeline.sqlite"
+
+    def __init__(self,
+                 topic: str,
+                 test: bool =False,
+                 on_image_ready: Callable[[int, str], None] | None = None,
+                 on_audio_ready: Callable[[Path], None] | None = None,
+                 reuse_images: bool = True,
+                 reuse_threshold: float = PROMPT_REUSE_THRESHOLD):
         """
             Initializes workflow and it's configuration.
+
+            on_image_ready(index, url) is called as soon as each image is generated,
+            on_audio_ready(path) as soon as the narration is ready, so that a consumer
+            (e.g. Editor.prefetch_image / Editor.prefetch_audio) can start working on
+            them while the rest is still being generated.
+
+            With reuse_images, a prompt at least reuse_threshold similar to one already rendered
+            for another story reuses that image instead of generating a new one
+            (see images.images.generate_image).
         """
         self.topic = topic
         self.story_slug = self.topic.replace(" ", "_").lower()
         self.test = test
+        self.on_image_ready = on_image_ready
+        self.on_audio_ready = on_audio_ready
+        self.reuse_images = reuse_images
+        self.reuse_threshold = reuse_threshold
+        self.job_id: int | None = None
+        if not test:
+            # here and not in the nodes, they run in langgraph's worker threads
+            # (a no-op when the batch runner already configured the providers)
+            init_providers()
         self.workflow = self.__create_workflow()
         self.workflow_initial_state, self.config = self.__configure_workflow()
 
@@ -33,42 +77,108 @@ class Pipeline:
 
     def workflow_compile_and_run(self):
         """
-        Docstring for workflow_compile_and_run
-        
-        :param self: Description
-        :param workflow: Description
-        :param workflow_initial_state: Description
-        :param config: Description
+            Runs the whole workflow from scratch and saves data in a file.
 
-        Runs the whole workflow and saves data in a file.
+            Every run gets its own checkpoint thread (a new thread, not the previous run's,
+            so nothing the previous run generated leaks into this one) and every finished
+            node is checkpointed in sqlite, so a failed run can be continued with resume().
         """
         # TODO:
-        # - this mechanism of storing in the memory could be used to run the graph after exception from some specific node
-        # - or to introduce human in the loop
-        # - at some point we have to implement rerun mechanism for the whole workflow, that omits filled in nodes
-        #   such that we don't need to replicate the whole generation again
-        checkpointer = InMemorySaver()
+        # - checkpoints could be used to introduce human in the loop
+        self.__new_thread()
+        return self.__run(self.workflow_initial_state)
 
-        app = self.workflow.compile(checkpointer=checkpointer)
+    def resume(self):
+        """
+            Restarts the workflow from the last successfully finished node of the
+            previous run for the same story. Nodes that already finished are not run again.
+            When there is no previous run, it behaves like workflow_compile_and_run.
+        """
+        with self.__checkpointer() as checkpointer:
+            row = checkpointer.conn.execute(
+                "SELECT thread_id FROM pipeline_runs WHERE slug = ? ORDER BY rowid DESC LIMIT 1",
+                (self.story_slug,)).fetchone()
+            # runs checkpointed before every run had its own thread
+            self.config = self.__thread_config(row[0] if row else f"story:{self.story_slug}")
+            app = self.workflow.compile(checkpointer=checkpointer)
+            snapshot = app.get_state(self.config)
+
+        if not snapshot.values:
+            print("---NO CHECKPOINT FOUND, STARTING FROM SCRATCH---")
+            return self.workflow_compile_and_run()
+
+        if not snapshot.next:
+            print("---WORKFLOW ALREADY COMPLETED, REUSING FINAL STATE---")
+            final_state_pydantic = GraphState(**snapshot.values)
+            self.__save_final_state(final_state_pydantic)
+            latest_job = get_catalog().latest_job(self.story_slug)
+            get_catalog().add_state(self.story_slug, final_state_pydantic, path=self.final_state_path(),
+                                    job_id=latest_job["id"] if latest_job else None)
+            return final_state_pydantic
+
+        print(f"---RESUMING FROM: {', '.join(snapshot.next)}---")
+        # invoking with None input continues the thread from its latest checkpoint
+        return self.__run(None)
+
+    def __checkpointer(self):
+        """
+            File backed checkpointer, shared by all runs (each story has its own thread).
+        """
+        Pipeline.CHECKPOINTS_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(Pipeline.CHECKPOINTS_PATH, check_same_thread=False)
+        # latest checkpoint thread of every story, for resume()
+        conn.execute("CREATE TABLE IF NOT EXISTS pipeline_runs (slug TEXT NOT NULL, thread_id TEXT NOT NULL, "
+                     "created_at REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS pipeline_runs_slug ON pipeline_runs (slug)")
+        conn.commit()
+        return _ClosingSaver(conn)
+
+    def __thread_config(self, thread_id: str) -> dict:
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+            }
+        }
 
-        initial_state = GraphState(**self.workflow_initial_state)
-        try:
-            final_state = app.invoke(initial_state,self.config)
-        except Exception as e:
-            final_state = app.get_state(self.config).values
-            print(final_state)
-            print(f"Exception happened: {e}")
+    def __new_thread(self):
+        thread_id = f"story:{self.story_slug}:{uuid.uuid4().hex[:12]}"
+        with self.__checkpointer() as checkpointer:
+            checkpointer.conn.execute("INSERT INTO pipeline_runs (slug, thread_id, created_at) VALUES (?, ?, ?)",
+                                      (self.story_slug, thread_id, time.time()))
+            checkpointer.conn.commit()
+        self.config = self.__thread_config(thread_id)
+
+    def __run(self, graph_input):
+        catalog = get_catalog()
+        self.job_id = catalog.start_job(self.story_slug, self.topic, test=self.test)
+        error = None
+        with self.__checkpointer() as checkpointer:
+            app = self.workflow.compile(checkpointer=checkpointer)
+
+            if graph_input is not None:
+                graph_input = GraphState(**graph_input)
+
+            try:
+                final_state = app.invoke(graph_input, self.config)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                final_state = app.get_state(self.config).values
+                print(final_state)
+                print(f"Exception happened: {e}")
+                print("Run Pipeline.resume() to continue from the last finished node.")
 
         final_state_pydantic = GraphState(**final_state)
         self.__save_final_state(final_state_pydantic)
+        catalog.add_state(self.story_slug, final_state_pydantic, path=self.final_state_path(), job_id=self.job_id)
+        catalog.finish_job(self.job_id, status=FAILED if error else DONE, error=error)
+        return final_state_pydantic
 
-    def __save_final_state(self, final_state_pydantic):
-        
-        STATE_OUTPUT_FOLDER = Pipeline.ROOT_DATA / self.story_slug
-        STATE_OUTPUT_FOLDER.mkdir(parents=True, exist_ok=True)
+    def final_state_path(self) -> Path:
+        return Pipeline.ROOT_DATA / self.story_slug / Path(self.story_slug).with_suffix(".json")
 
-        filename = Path(self.story_slug)
-        final_state_path= STATE_OUTPUT_FOLDER / filename.with_suffix(".json")
+    def __save_final_state(self, final_state_pydantic):
+        final_state_path = self.final_state_path()
+        final_state_path.parent.mkdir(parents=True, exist_ok=True)
 
         print("\n---PIPELINE COMPLETE---")
         
@@ -88,24 +198,22 @@ class Pipeline:
         workflow.add_node("generate_image_prompts", self.__generate_image_prompts_node)
         workflow.add_node("generate_images", self.__generate_images_node)
         workflow.add_node("generate_audio", self.__generate_audio_node)
+        workflow.add_node("join_media", self.__join_media_node)
 
         workflow.set_entry_point("generate_story")
 
         workflow.add_edge("generate_story", "generate_image_prompts")
+        # audio only needs the chunk texts, so images and audio are generated at the same time
         workflow.add_edge("generate_image_prompts", "generate_images")
-        workflow.add_edge("generate_images", "generate_audio")
-        workflow.add_edge("generate_audio", END)
+        workflow.add_edge("generate_image_prompts", "generate_audio")
+        # join waits for both branches to finish
+        workflow.add_edge(["generate_images", "generate_audio"], "join_media")
+        workflow.add_edge("join_media", END)
         return workflow
 
 
     def __configure_workflow(self):
 
-        config = {
-            "configurable": {
-                "thread_id": uuid.uuid4(),
-            }
-        }
-
         workflow_initial_state = {
             "topic": self.topic,
             "story_slug": self.story_slug,
@@ -113,26 +221,28 @@ class Pipeline:
             "story": None,
             "image_prompts": None,
             "photo_links": None,
-            "audio_link": None
+            "audio_path": None,
+            "audio_offsets": None
         }
 
-        config = {
-            "configurable": {
-                "thread_id": uuid.uuid4(),
-            }
-        }
+        # thread of the run, set by workflow_compile_and_run (new thread) or resume (latest thread)
+        config = None
 
         return workflow_initial_state, config
 
 
     def __generate_story_node(self, state: GraphState) -> dict:
         print("---NODE: Generating Story---")
-        return {"story": generate_story(topic=state.topic, test=state.test)}
+        with span("pipeline.generate_story", story=state.story_slug):
+            return {"story": generate_story(topic=state.topic, test=state.test)}
 
     def __generate_image_prompts_node(self, state: GraphState) -> dict:
         print("---NODE: Generating prompts for images---")
         story = state.story
-        return {"image_prompts": generate_images_prompts(full_story_text=story, test=state.test)}
+        with span("pipeline.generate_image_prompts", story=state.story_slug) as s:
+            image_prompts = generate_images_prompts(full_story_text=story, test=state.test)
+            s.set(prompts=len(image_prompts))
+        return {"image_prompts": image_prompts}
 
     def __generate_images_node(self, state: GraphState) -> dict:
         print("---NODE: Generating Images & Saving in the cloud---")
@@ -142,28 +252,52 @@ class Pipeline:
 
         photos: List[Tuple[int,str]] = []
 
-        MAX_WORKERS = 5
+        # threads only wait on the provider, the shared limiter decides how many requests run at once
+        MAX_WORKERS = get_limiter("fal-flux").max_concurrency
+        catalog = get_catalog()
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        with span("pipeline.generate_images", story=state.story_slug, prompts=len(prompts)) as s:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
             
-            # mapping future objects to index
-            future_to_index = {
-                # resubmission probably should be on the generate_image side
-                executor.submit(generate_image, prompt=prompt, test=state.test): i 
-                for i, prompt in enumerate(prompts)
-            }
-
-            for future in concurrent.futures.as_completed(future_to_index):
-                i = future_to_index[future]
+                # mapping future objects to index
+                future_to_index = {
+                    # resubmission probably should be on the generate_image side
+                    executor.submit(generate_image, prompt=prompt, test=state.test,
+                                    reuse_threshold=self.reuse_threshold if self.reuse_images else None,
+                                    story_slug=state.story_slug): i 
+                    for i, prompt in enumerate(prompts)
+                }
+
+                for future in concurrent.futures.as_completed(future_to_index):
+                    i = future_to_index[future]
                 
-                try:
-                    # wait for the thread to complete, return a value
-                    url = future.result()
+                    try:
+                        # wait for the thread to complete, return a value
+                        url = future.result()
+                    except Exception as exc:
+                        prompt = prompts[i]
+                        # photos.append("ERROR")
+                        print(f"Image generation for prompt #{i} failed: {exc}. Prompt: '{prompt}'")
+                        continue
                     photos.append((i, url))
-                except Exception as exc:
-                    prompt = prompts[i]
-                    # photos.append("ERROR")
-                    print(f"Image generation for prompt #{i} failed: {exc}. Prompt: '{prompt}'")
+
+                    # the image is generated (and paid for), failures below must not drop it
+                    try:
+                        # test links are placeholders, they must never be found by prompt
+                        catalog.add_asset(state.story_slug, IMAGE, position=i, url=url,
+                                          prompt=None if state.test else prompts[i])
+                    except Exception as exc:
+                        print(f"Cataloging image #{i} failed: {exc}")
+                    if self.on_image_ready is not None:
+                        try:
+                            self.on_image_ready(i, url)
+                        except Exception as exc:
+                            print(f"on_image_ready for image #{i} failed: {exc}")
+            s.set(images=len(photos))
+
+        # raising keeps the node pending in the checkpoint, so resume() generates the images again
+        if not photos:
+            raise Exception(f"No images were generated out of {len(prompts)} prompts")
 
         # sort photos to make sense chronologically
         photos.sort(key=lambda item: item[0])
@@ -174,10 +308,34 @@ class Pipeline:
     def __generate_audio_node(self, state: GraphState) -> dict:
         print("---NODE: Generating Audio---")
         text_to_read = [prompt.text for prompt in state.image_prompts]
-        audio_link = generate_audio(text_to_read=text_to_read,
-                        test=state.test 
-                    )
-        return {"audio_link": audio_link}
+        with span("pipeline.generate_audio", story=state.story_slug, chunks=len(text_to_read)):
+            audio_path, audio_offsets = generate_audio(text_to_read=text_to_read,
+                            story_slug=state.story_slug,
+                            test=state.test 
+                        )
+        # the narration is generated, failures below must not fail the node
+        try:
+            get_catalog().add_asset(state.story_slug, AUDIO, url=audio_path)
+        except Exception as exc:
+            print(f"Cataloging audio failed: {exc}")
+        if self.on_audio_ready is not None:
+            try:
+                self.on_audio_ready(audio_path)
+            except Exception as exc:
+                print(f"on_audio_ready failed: {exc}")
+        return {"audio_path": audio_path, "audio_offsets": audio_offsets}
+
+    def __join_media_node(self, state: GraphState) -> dict:
+        print("---NODE: Joining images & audio---")
+        with span("pipeline.join_media", story=state.story_slug,
+                  images=len(state.photo_links or []), prompts=len(state.image_prompts or [])):
+            if not state.photo_links:
+                raise Exception("No images were generated")
+            if state.audio_path is None:
+                raise Exception("No audio was generated")
+            if len(state.photo_links) != len(state.image_prompts):
+                print(f"Only {len(state.photo_links)} out of {len(state.image_prompts)} images were generated")
+        return {}
 
 
 
@@ -186,6 +344,8 @@ if __name__ == "__main__":
 
     pipeline = Pipeline(topic="short story about a little bird", test=True)
     pipeline.workflow_compile_and_run()
+    # after a failure, the same call with resume() continues from the last finished node
+    # pipeline.resume()
 
 
     
@@ -0,0 +1,84 @@
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict
+
+# shared by story and image prompt generation
+LLM_MODEL = "gemini/gemini-2.5-flash"
+
+_lock = threading.RLock()
+_env_loaded = False
+_initialized = False
+# replacements of provider clients (offline benchmarks), see override_providers
+_overrides: Dict[str, Any] = {}
+
+
+def load_env():
+    """
+        Loads .env once per process. Explicit, so importing a module never has side effects.
+    """
+    global _env_loaded
+    with _lock:
+        if not _env_loaded:
+            from dotenv import load_dotenv
+            load_dotenv()
+            _env_loaded = True
+
+
+def init_providers():
+    """
+        Configures provider clients (API keys from .env, dspy language model).
+        Idempotent and cheap after the first call; call it from the main thread before
+        running the pipeline, dspy settings belong to the thread that configured them.
+    """
+    global _initialized
+    with _lock:
+        if _initialized or "dspy" in _overrides:
+            return
+        load_env()
+        import dspy
+        dspy.configure(lm=dspy.LM(LLM_MODEL), adapter=dspy.JSONAdapter())
+        _initialized = True
+
+
+def get_dspy():
+    """
+        dspy module, imported and configured on first use.
+    """
+    with _lock:
+        if "dspy" in _overrides:
+            return _overrides["dspy"]
+    init_providers()
+    import dspy
+    return dspy
+
+
+def get_fal_client():
+    """
+        fal_client module, imported on first use (reads FAL_KEY from the environment).
+    """
+    with _lock:
+        if "fal_client" in _overrides:
+            return _overrides["fal_client"]
+    load_env()
+    import fal_client
+    return fal_client
+
+
+@contextmanager
+def override_providers(**clients):
+    """
+        with override_providers(dspy=fake_dspy, fal_client=fake_fal):
+            ...  # generation calls go to the fakes
+    """
+    with _lock:
+        saved = {name: _overrides.get(name) for name in clients}
+        _overrides.update(clients)
+    try:
+        yield
+    finally:
+        with _lock:
+            for name, client in saved.items():
+                if client is None:
+                    _overrides.pop(name, None)
+                else:
+                    _overrides[name] = client
@@ -1,7 +1,9 @@
-from pydantic import BaseModel
-from typing import List
+from pydantic import AliasChoices, BaseModel, Field
+from typing import List, Annotated, TypeVar, Tuple
 from pathlib import Path
 
+T = TypeVar("T")
+
 
 
 # STORY
@@ -19,12 +21,72 @@ class ImagesPromptsOutput(BaseModel):
 
 # AUDIO
 
+# VIDEO
+class EncoderProfile(BaseModel):
+    """
+        ffmpeg output settings, lets each deployment trade CPU time against file size.
+    """
+    codec: str = "libx264"  # or libx265
+    preset: str = "medium"  # ultrafast ... veryslow
+    crf: int = 23  # lower is better quality & bigger file
+    threads: int = 0  # 0 lets ffmpeg decide
+    pix_fmt: str = "yuv420p"
+    audio_codec: str = "aac"
+    audio_bitrate: str = "192k"
+
+
+class TimelineScene(BaseModel):
+    image_path: str
+    start: float
+    # time on screen, including the crossfade into the next scene
+    duration: float
+    # time the zoom animation is spread over (scene length without the crossfade)
+    zoom_duration: float
+    # fade in from the previous scene, 0 for the first one
+    crossfade: float
+
+
+class Timeline(BaseModel):
+    """
+        Everything needed to render any frame of a video, without the Editor
+        (it is sent to render worker processes).
+    """
+    size: Tuple[int, int]
+    fps: int
+    duration: float
+    zoom_factor: float
+    scenes: List[TimelineScene]
+    srt_path: str
+    font_path: str
+    font_size: int = 100
+    text_box_height: int = 400
+    # space between the subtitles box and the sides/bottom of the frame
+    subtitle_margin: int = 50
+    # PIL resampling filter used for the zoom: nearest, bilinear, bicubic, lanczos
+    resample: str = "bilinear"
+
+
 # GRAPH STATE
+def keep_latest(current: T | None, update: T | None) -> T | None:
+    """
+        Reducer for fields written by parallel branches of the workflow,
+        an empty update never wipes out a value set by another branch.
+    """
+    return update if update is not None else current
+
+
 class GraphState(BaseModel):
     topic: str
     story_slug: str
     test: bool
     story: StoryGenerationOutput | None
     image_prompts: List [ImagesPromptsOutput] | None
-    photo_links: List[str] | None
-    audio_link: Path | None
\ No newline at end of file
+    photo_links: Annotated[List[str] | None, keep_latest]
+    # local file of the narration, stitched from the generated chunks (not a provider link,
+    # render workers have to run where it was generated or get the file);
+    # final states saved before it was stitched locally call it audio_link
+    audio_path: Annotated[Path | None, keep_latest] = Field(
+        default=None, validation_alias=AliasChoices("audio_path", "audio_link"))
+    # start of every image_prompts chunk in the narration (before the speed up), in seconds,
+    # the editor switches scenes at these times
+    audio_offsets: Annotated[List[float] | None, keep_latest] = None
\ No newline at end of file
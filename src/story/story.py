@@ -1,13 +1,10 @@
-from google import genai
-from google.genai import types
+import functools
 
-import dspy
-from dotenv import load_dotenv
 from schemas.schemas import StoryGenerationOutput
-from typing import List
 from consts.test_consts import STORY
-
-load_dotenv()
+from cache.cache import get_cache, make_key
+from limits.limiter import get_limiter
+from providers.providers import get_dspy, LLM_MODEL
 
 # # The client gets the API key from the environment variable `GEMINI_API_KEY`.
 # client = genai.Client()
@@ -21,14 +18,19 @@ load_dotenv()
 # print(response.text)
 
 
-dspy.configure(lm=dspy.LM("gemini/gemini-2.5-flash"), adapter=dspy.JSONAdapter())
-
+@functools.lru_cache(maxsize=None)
+def story_signature():
+    """
+        dspy signature, built on first use so that importing this module doesn't import dspy.
+    """
+    import dspy
 
+    class GenerateStory(dspy.Signature):
+        """Generate a Reddit-like story post for a given topic."""
+        topic: str = dspy.InputField()
+        story: list[StoryGenerationOutput] = dspy.OutputField(desc="A Reddit-style story with title, text, and TLDR")
 
-class GenerateStory(dspy.Signature):
-    """Generate a Reddit-like story post for a given topic."""
-    topic: str = dspy.InputField()
-    story: list[StoryGenerationOutput] = dspy.OutputField(desc="A Reddit-style story with title, text, and TLDR")
+    return GenerateStory
 
 
 def generate_story(topic: str, test=False) -> StoryGenerationOutput:
@@ -36,7 +38,13 @@ def generate_story(topic: str, test=False) -> StoryGenerationOutput:
     if test:
         return STORY
 
-    predict = dspy.Predict(GenerateStory)
-    return predict(topic=topic).story[0]
+    def _generate() -> StoryGenerationOutput:
+        predict = get_dspy().Predict(story_signature())
+        with get_limiter("gemini").slot():
+            return predict(topic=topic).story[0]
+
+    key = make_key(provider="dspy", model=LLM_MODEL, inputs={"topic": topic},
+                   params={"signature": "GenerateStory"})
+    return get_cache().get_or_compute(key, _generate)
 
 # print(generate_story())
\ No newline at end of file
@@ -0,0 +1,164 @@
+from moviepy import VideoClip
+from PIL import Image
+from bisect import bisect_right
+from typing import Callable, Dict, List, Tuple
+import concurrent.futures
+import threading
+import numpy as np
+
+from schemas.schemas import Timeline, TimelineScene
+from video.kenburns import KenBurnsClip
+
+
+class SceneIndex:
+    """
+        Interval index of the timeline's scenes: which scenes are on screen at time t.
+
+        Scenes are sorted by start; a running maximum of the end times lets the lookup
+        stop at the first scene that (with everything before it) ended before t, so a
+        lookup costs O(log n + active scenes) whatever the number of scenes.
+    """
+
+    def __init__(self, scenes: List[TimelineScene]):
+        self.order = sorted(range(len(scenes)), key=lambda i: scenes[i].start)
+        self.starts = [scenes[i].start for i in self.order]
+        self.ends = [scenes[i].start + scenes[i].duration for i in self.order]
+        self.max_ends = np.maximum.accumulate(self.ends).tolist() if self.ends else []
+
+    def active(self, t: float) -> List[int]:
+        """
+            Indices (into the scenes list) of the scenes shown at t, in start order.
+        """
+        active = []
+        position = bisect_right(self.starts, t) - 1
+        while position >= 0 and self.max_ends[position] > t:
+            if self.ends[position] > t:
+                active.append(self.order[position])
+            position -= 1
+        active.reverse()
+        return active
+
+    def next_start(self, t: float) -> Tuple[int, float] | None:
+        """
+            (index, start) of the first scene starting after t.
+        """
+        position = bisect_right(self.starts, t)
+        if position == len(self.starts):
+            return None
+        return self.order[position], self.starts[position]
+
+
+class TimelineClip(VideoClip):
+    """
+        Renders a Timeline frame by frame, keeping only the scenes on screen in memory.
+
+        Replaces a CompositeVideoClip of every scene: at time t only the active scenes
+        (one, two during a crossfade) are evaluated and blended, the crossfade is a
+        plain weighted sum. A scene's image is loaded `preload` seconds before its
+        window (in a background thread) and released as soon as its window ends,
+        so memory doesn't grow with the number of scenes.
+    """
+
+    def __init__(self,
+                 timeline: Timeline,
+                 overlay: Callable[[np.ndarray, float], np.ndarray] | None = None,
+                 preload: float = 1.0):
+
+        self.timeline = timeline
+        self.scenes = timeline.scenes
+        self.index = SceneIndex(timeline.scenes)
+        self.overlay = overlay
+        self.preload = preload
+        self.resample = Image.Resampling[timeline.resample.upper()]
+
+        self._lock = threading.Lock()
+        self._loaded: Dict[int, KenBurnsClip] = {}
+        self._loading: Dict[int, concurrent.futures.Future] = {}
+        self._loader: concurrent.futures.ThreadPoolExecutor | None = None
+        self.peak_loaded = 0
+
+        super().__init__(frame_function=self.__make_frame, duration=timeline.duration)
+
+    def __load(self, i: int) -> KenBurnsClip:
+        scene = self.scenes[i]
+        # zoom animation, precomputed crop per frame instead of resizing the whole image
+        return KenBurnsClip(scene.image_path,
+                            size=self.timeline.size,
+                            duration=scene.duration,
+                            zoom_factor=self.timeline.zoom_factor,
+                            zoom_duration=scene.zoom_duration,
+                            fps=self.timeline.fps,
+                            resample=self.resample)
+
+    def __clip(self, i: int) -> KenBurnsClip:
+        with self._lock:
+            clip = self._loaded.get(i)
+            future = self._loading.pop(i, None)
+        if clip is not None:
+            return clip
+        clip = future.result() if future is not None else self.__load(i)
+        with self._lock:
+            self._loaded[i] = clip
+            self.peak_loaded = max(self.peak_loaded, len(self._loaded))
+        return clip
+
+    def __preload(self, t: float, active: List[int]):
+        upcoming = self.index.next_start(t)
+        if upcoming is None:
+            return
+        i, start = upcoming
+        if start - t > self.preload:
+            return
+        with self._lock:
+            if i in self._loaded or i in self._loading or i in active:
+                return
+            if self._loader is None:
+                self._loader = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+            self._loading[i] = self._loader.submit(self.__load, i)
+
+    def __release(self, active: List[int]):
+        with self._lock:
+            for i in [i for i in self._loaded if i not in active]:
+                self._loaded.pop(i).close()
+
+    def __make_frame(self, t: float) -> np.ndarray:
+        active = self.index.active(t)
+        self.__release(active)
+
+        width, height = self.timeline.size
+        frame = None
+        for i in active:
+            scene = self.scenes[i]
+            local_t = t - scene.start
+            pixels = self.__clip(i).get_frame(local_t)
+            # crossfade in from what is below, same weights as CrossFadeIn
+            weight = min(local_t / scene.crossfade, 1.0) if scene.crossfade > 0 else 1.0
+            if weight >= 1.0:
+                frame = pixels
+                continue
+            below = frame if frame is not None else np.zeros((height, width, 3), dtype=np.uint8)
+            frame = below.astype(np.float32) * (1.0 - weight) + pixels.astype(np.float32) * weight
+
+        if frame is None:
+            frame = np.zeros((height, width, 3), dtype=np.uint8)
+        elif frame.dtype != np.uint8:
+            frame = np.clip(np.rint(frame), 0, 255).astype(np.uint8)
+
+        self.__preload(t, active)
+        if self.overlay is not None:
+            frame = self.overlay(frame, t)
+        return frame
+
+    def close(self):
+        with self._lock:
+            loader, self._loader = self._loader, None
+            loading, self._loading = self._loading, {}
+            loaded, self._loaded = self._loaded, {}
+        if loader is not None:
+            loader.shutdown(wait=True)
+        for future in loading.values():
+            if future.exception() is None:
+                future.result().close()
+        for clip in loaded.values():
+            clip.close()
+        super().close()
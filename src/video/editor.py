@@ -1,22 +1,27 @@
-from moviepy import ImageClip, TextClip, concatenate_videoclips, AudioFileClip, CompositeVideoClip
-import requests
 from typing import List
 from pathlib import Path
 import json
-import tempfile
 import concurrent.futures
-import numpy as np
-from moviepy.video.fx.CrossFadeIn import CrossFadeIn
-from faster_whisper import WhisperModel
-from moviepy.video.tools.subtitles import SubtitlesClip
-from PIL import ImageFont
-from typing import List, Tuple
+import threading
+from video.transcription import (WhisperModelPool, WHISPER_MODEL_SIZE, WHISPER_COMPUTE_TYPE,
+                                 WHISPER_CPU_THREADS, WHISPER_NUM_WORKERS)
+from video.encoder import FFmpegEncoder, concat_segments
+from video.preprocess import fit_image, resize_and_crop, preprocess_images, processed_path, save_image_array
+from video.shared_frames import SharedFrames
+from video.segments import file_digest, get_segment_cache, segment_keys
+from video.timeline import build_scenes, compose_timeline, segment_frame_ranges, render_frames, total_frames
+from schemas.schemas import EncoderProfile, Timeline
+from typing import Dict, List, Tuple
 import math
-import soundfile as sf
-import pyrubberband as pyrb
 import pysrt
 import os
 import time
+import hashlib
+import shutil
+from fetch.fetcher import get_fetcher
+from audio.stretch import stretch_audio, tempo_filter
+from metrics.spans import span
+from catalog.catalog import get_catalog, IMAGE, AUDIO
 
 ROOT_SRC = Path(__file__).resolve().parent.parent
 INPUT_DATA_PATH = ROOT_SRC / "data" / "final_states"
@@ -30,20 +35,83 @@ class Editor:
 
     def __init__(self, 
                 title: str,
-                scenes: List[str],
-                audio_url: str,
-                playback_speed: float,
-                image_urls: List[str],
+                scenes: List[str] | None = None,
+                audio_url: str | None = None,
+                audio_offsets: List[float] | None = None,
+                playback_speed: float = 1.5,
+                image_urls: List[str] | None = None,
+                whisper_model_size: str = WHISPER_MODEL_SIZE,
+                whisper_compute_type: str = WHISPER_COMPUTE_TYPE,
+                whisper_cpu_threads: int = WHISPER_CPU_THREADS,
+                whisper_num_workers: int = WHISPER_NUM_WORKERS,
+                encoder_profile: EncoderProfile | None = None,
+                render_workers: int = 1,
+                preprocess_workers: int | None = None,
+                stretch_at_mux: bool = False,
+                stretch_method: str = "atempo",
+                segment_cache: bool = True,
+                preview: bool = False,
+                preview_scale: float = 0.5,
+                preview_fps: int = 12,
+                in_memory: bool = False,
                 ):
         
         self.title = title
         self.story_slug = title.lower().replace(" ", "_")
         self.scenes = scenes
         self.audio_url = audio_url
+        # start of every scene's text in the narration (GraphState.audio_offsets), when known
+        self.audio_offsets = audio_offsets
         self.playback_speed = playback_speed
         self.image_urls = image_urls
         self.video_size = (1080, 1920)
         self.zoom_factor = 0.30
+        self.fps = 24
+        self.encoder_profile = encoder_profile or EncoderProfile()
+        # subtitles, scaled together with the video in preview
+        self.font_size = 100
+        self.text_box_height = 400
+        self.subtitle_margin = 50
+        self.resample = "bilinear"
+
+        # draft render to check pacing and image order: same timeline and subtitle
+        # placement, at a fraction of the resolution and frame rate, encoded fast
+        self.preview = preview
+        if preview:
+            self.video_size = tuple(max(2, int(round(side * preview_scale / 2)) * 2) for side in self.video_size)
+            self.fps = preview_fps
+            self.font_size = max(1, round(self.font_size * preview_scale))
+            self.text_box_height = round(self.text_box_height * preview_scale)
+            self.subtitle_margin = round(self.subtitle_margin * preview_scale)
+            self.resample = "nearest"
+            self.encoder_profile = self.encoder_profile.model_copy(update={"preset": "ultrafast", "crf": 30})
+        # > 1 renders scenes in parallel processes (see write_video_parallel)
+        self.render_workers = render_workers
+        # None uses all cores
+        self.preprocess_workers = preprocess_workers
+        # speed change: "atempo" or "rubberband" ffmpeg filter, applied on fetch or at mux time
+        self.stretch_at_mux = stretch_at_mux
+        self.stretch_method = stretch_method
+        # reuse rendered segments whose inputs didn't change (see write_video_parallel)
+        self.segment_cache = segment_cache
+        # images go from the network into memory and are decoded into shared memory
+        # that render workers read from; the disk copies are written behind
+        self.in_memory = in_memory
+        self._frames: SharedFrames | None = None
+
+        # assets handed over while the pipeline is still generating (see prefetch_image/prefetch_audio)
+        self._prefetch_executor: concurrent.futures.ThreadPoolExecutor | None = None
+        self._prefetch_lock = threading.Lock()
+        self._image_futures: Dict[str, concurrent.futures.Future] = {}
+        self._image_indices: set = set()
+        self._audio_future: concurrent.futures.Future | None = None
+        self._prefetched_audio_url: str | None = None
+
+        # transcription model is shared by all editors in the process (see WhisperModelPool)
+        self.whisper_model_size = whisper_model_size
+        self.whisper_compute_type = whisper_compute_type
+        self.whisper_cpu_threads = whisper_cpu_threads
+        self.whisper_num_workers = whisper_num_workers
         
         # output directories
         self.audio_dir = DATA_PATH / self.story_slug / "audio"
@@ -66,37 +134,75 @@ class Editor:
     # fetches remotely stored data, returns path to local file
     def fetch_data(self, url: str, destination: Path, suffix: str, index: int) -> Path:
 
-        if url.startswith("https:/") and not url.startswith("https://"):
-            url = url.replace("https:/", "https://", 1)
+        # exisitng path
+        if destination.is_dir():
+            file_name = Path(f"_{index}{suffix}")
+            final_path = destination / file_name
+        else:
+            # temporary file
+            final_path = destination
 
-        try:
-
-            # exisitng path
-            if destination.is_dir():
-                file_name = Path(f"_{index}{suffix}")
-                final_path = destination / file_name
-            else:
-                # temporary file
-                final_path = destination
-
-
-            response = requests.get(url, stream=True)
-            response.raise_for_status()
-        
-            
-            with open(final_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            return final_path
-        
-        except requests.exceptions.RequestException as e:
-            print(f"Error downloading {url}: {e}")
-            raise Exception(e)
+        # pooled connections, retries, resume and revalidation against the asset store
+        return get_fetcher().fetch(url, final_path)
 
     def transcribe(self, audio_path: Path):
-        model = WhisperModel("small")
+        model = WhisperModelPool.get(model_size=self.whisper_model_size,
+                                     compute_type=self.whisper_compute_type,
+                                     cpu_threads=self.whisper_cpu_threads,
+                                     num_workers=self.whisper_num_workers)
         segments, info = model.transcribe(audio_path, word_timestamps=True)
         return info.language, segments
+
+    def __file_hash(self, path: Path) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def transcribe_words(self, audio_path: Path) -> List[List[Tuple[float, float, str]]]:
+        """
+            Returns word level timestamps grouped by whisper segments:
+            [[(start1, end1, word1), ...], [...]]
+
+            Result is stored next to the audio, keyed by the audio content hash,
+            playback speed and model settings, so re-rendering the same audio skips whisper.
+        """
+        key_source = json.dumps({
+            "audio": self.__file_hash(audio_path),
+            "playback_speed": self.playback_speed,
+            "model_size": self.whisper_model_size,
+            "compute_type": self.whisper_compute_type,
+        }, sort_keys=True)
+        key = hashlib.sha256(key_source.encode("utf-8")).hexdigest()[:16]
+        transcript_path = self.audio_dir / f"transcript_{key}.json"
+
+        if transcript_path.exists():
+            try:
+                with open(transcript_path, "r", encoding="utf-8") as f:
+                    cached = json.load(f)
+                print(f"---REUSING TRANSCRIPT: {transcript_path.name}---")
+                return [[tuple(word) for word in segment] for segment in cached["segments"]]
+            except (OSError, ValueError, KeyError):
+                print(f"Transcript {transcript_path} is corrupted, transcribing again")
+
+        with span("editor.transcribe", story=self.story_slug, model_size=self.whisper_model_size,
+                  compute_type=self.whisper_compute_type) as s:
+            lang, segments = self.transcribe(audio_path)
+            # segments are lazy, transcription happens while iterating
+            # each segment contains Word(start=np.float64(7.76), end=np.float64(7.88), word=' Today', probability=np.float64(0.9799808859825134))
+            words = [
+                [(float(word.start), float(word.end), word.word) for word in segment.words]
+                for segment in segments
+            ]
+            s.set(words=sum(len(segment) for segment in words))
+
+        tmp_path = transcript_path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"language": lang, "segments": words}, f)
+        os.replace(tmp_path, transcript_path)
+
+        return words
     
     def generate_subtitles(self, audio_path: Path, subtitles_chunk_size: int):
         """
@@ -104,14 +210,15 @@ class Editor:
             [(start1, end1, word1), (start2, end2, word2)]
         """
         complete_timestamp_and_words: List[Tuple[float, float, str]] = []
-        lang, segments = self.transcribe(audio_path)
+        segments = self.transcribe_words(audio_path)
+        # timestamps of an audio that is stretched only at mux time have to be scaled
+        time_scale = self.audio_time_scale()
         for segment in segments:
             segment_timestamp_words: List[Tuple[float, float, str]] = []
-            # each segment contains Word(start=np.float64(7.76), end=np.float64(7.88), word=' Today', probability=np.float64(0.9799808859825134))
-            # a list of Word objects
-            for word in segment.words:
+            # a list of (start, end, word) tuples
+            for word_start, word_end, word in segment:
                 # we've got enough subtitles in this part
-                segment_timestamp_words.append((word.start, word.end, word.word))
+                segment_timestamp_words.append((word_start * time_scale, word_end * time_scale, word))
 
                 if len(segment_timestamp_words) >= subtitles_chunk_size:
                     # print(segment_timestamp_words)
@@ -165,41 +272,46 @@ class Editor:
 
     def fetch_audio(self) -> Path:
         """
-            Fetches audio file and speeds it up
-        """
-
-        
-
-        final_output_path = self.audio_dir / "final_audio.wav"
-
-        tmp = tempfile.NamedTemporaryFile(suffix=".wav", delete=False)
-        temp_path = Path(tmp.name)
-
-        # allow fetch data to open
-        tmp.close()
-        try:
+            Fetches audio file and speeds it up.
 
-            self.fetch_data(url=self.audio_url, destination=temp_path, suffix=".wav", index=0)
-
-            # # put file pointer at the beginning
-            # tmp.seek(0)
-
-            # speed up and return wav
-            y, sr = sf.read(temp_path)
-            
-            # Play back at 1.5X speed
-            y_stretch = pyrb.time_stretch(y, sr, self.playback_speed)
-            # Play back two 1.5x tones
-            # y_shift = pyrb.pitch_shift(y, sr, 1.5)
+            With stretch_at_mux the fetched file is returned as is and the speed change
+            is applied by ffmpeg while muxing the video, so no intermediate wav is written.
+        """
+        with span("editor.fetch_audio", story=self.story_slug, stretch_at_mux=self.stretch_at_mux):
+            if self.stretch_at_mux:
+                # muxed straight from the asset store
+                return get_fetcher().fetch_asset(self.audio_url)
+            # a file even with in_memory: ffmpeg reads it block by block, the whole narration
+            # is never held in memory
+            source = get_fetcher().fetch_asset(self.audio_url)
+
+            # the stretched narration stays a file, the muxer and the transcription read it
+            final_output_path = self.audio_dir / "final_audio.wav"
+            # streamed through ffmpeg, memory doesn't grow with narration length
+            stretch_audio(source, final_output_path, self.playback_speed, method=self.stretch_method)
+            try:
+                get_catalog().add_asset(self.story_slug, AUDIO, url=self.audio_url, local_path=final_output_path,
+                                        content_hash=file_digest(final_output_path),
+                                        size=final_output_path.stat().st_size)
+            except Exception as exc:
+                print(f"Cataloging audio failed: {exc}")
+            return final_output_path
 
-            sf.write(final_output_path, y_stretch, sr, format='wav')
+    def audio_filter(self) -> str | None:
+        """
+            Audio filter applied at mux time, if audio wasn't stretched earlier.
+        """
+        if self.stretch_at_mux and self.playback_speed != 1:
+            return tempo_filter(self.playback_speed, method=self.stretch_method)
+        return None
 
-            return final_output_path
-        
-        finally:
-            # because we didn't delete temp file (delete=False)
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+    def audio_time_scale(self) -> float:
+        """
+            Converts timestamps of the fetched audio file into video time.
+        """
+        if self.stretch_at_mux:
+            return 1 / self.playback_speed
+        return 1.0
 
     def fetch_images(self) -> List[str]:
         """
@@ -212,26 +324,30 @@ class Editor:
         data/"story_slug"/images
         """
         # concurrently fetch images
-        MAX_WORKERS = 5
+        # downloads are bounded by the shared fetcher
+        MAX_WORKERS = get_fetcher().max_concurrency
         
         image_files = []
-        with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            # mapping future objects to index
-            future_to_index = {
-                # resubmission probably should be on the generate_image side
-                executor.submit(self.fetch_data, url=url, destination=self.imgs_dir, suffix=".jpg", index=i): i 
-                for i, url in enumerate(self.image_urls)
-            }
-
-        for future in concurrent.futures.as_completed(future_to_index):
-            i = future_to_index[future]
+        with span("editor.fetch_images", story=self.story_slug, images=len(self.image_urls)) as s:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                # mapping future objects to index
+                future_to_index = {
+                    # resubmission probably should be on the generate_image side
+                    executor.submit(self.fetch_data, url=url, destination=self.imgs_dir, suffix=".jpg", index=i): i 
+                    for i, url in enumerate(self.image_urls)
+                }
+
+            for future in concurrent.futures.as_completed(future_to_index):
+                i = future_to_index[future]
             
-            try:
-                # wait for the thread to complete, return a value
-                url = future.result()
-                image_files.append((i, url))
-            except Exception as exc:
-                print(f"Image fetch failed: {exc}.")
+                try:
+                    # wait for the thread to complete, return a value
+                    url = future.result()
+                    image_files.append((i, url))
+                    self.__catalog_image(i, self.image_urls[i], url)
+                except Exception as exc:
+                    print(f"Image fetch failed: {exc}.")
+            s.set(fetched=len(image_files))
 
         image_files.sort(key=lambda elem: elem[0])
 
@@ -300,6 +416,20 @@ class Editor:
         
     #     return time_per_images
 
+    def scene_durations(self, transcript: Path, audio_duration: float) -> List[float]:
+        """
+            Time on screen of every scene: from the chunk offsets of the narration when
+            they are known (exact, every chunk is one scene's text), otherwise estimated
+            from the transcript (determine_time).
+        """
+        offsets = self.audio_offsets
+        if not offsets or len(offsets) != len(self.scenes):
+            return self.determine_time(transcript=transcript, audio_duration=audio_duration)
+        # offsets are in narration time, before the speed up
+        starts = [offset / self.playback_speed for offset in offsets]
+        ends = starts[1:] + [audio_duration]
+        return [end - start for start, end in zip(starts, ends)]
+
     def determine_time(self, transcript: Path, audio_duration: float):
         
         # 1. Calculate how many words are in each SCENE prompt
@@ -373,142 +503,326 @@ class Editor:
     def resize_and_crop_image(self, image_path: str, target_size: Tuple[int, int]) -> str:
         """
         Pre-processes image to fit target size (cover mode) to save RAM during rendering.
-        Returns path to processed image.
+        Returns path to processed image (.npy array, see video/preprocess.py).
         """
-        with ImageClip(image_path) as img:
-            # Resize so that the smallest dimension matches the target
-            w, h = img.size
-            target_w, target_h = target_size
-            
-            # Calculate aspect ratios
-            aspect_ratio = w / h
-            target_aspect = target_w / target_h
-            
-            if aspect_ratio > target_aspect:
-                # Image is wider than target
-                new_h = target_h
-                new_w = int(target_h * aspect_ratio)
+        return resize_and_crop(image_path, target_size)
+
+    def __prefetch_pool(self) -> concurrent.futures.ThreadPoolExecutor:
+        if self._prefetch_executor is None:
+            self._prefetch_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=get_fetcher().max_concurrency + 1)
+        return self._prefetch_executor
+
+    def __catalog_image(self, index: int, url: str, local_path: Path, data: bytes | None = None):
+        # the catalog is bookkeeping, a failure there must not cost the video its image
+        try:
+            if data is not None:
+                content_hash, size = hashlib.sha256(data).hexdigest(), len(data)
             else:
-                # Image is taller/same as target
-                new_w = target_w
-                new_h = int(target_w / aspect_ratio)
-                
-            # Resize once statically
-            img_resized = img.resized(new_size=(new_w, new_h))
-            
-            # Center crop
-            img_cropped = img_resized.cropped(
-                x1=(new_w/2) - (target_w/2),
-                y1=(new_h/2) - (target_h/2),
-                width=target_w,
-                height=target_h
-            )
-            
-            # Save temp file to avoid re-processing every frame
-            temp_processed = Path(image_path).parent / f"processed_{Path(image_path).name}.png"
-            img_cropped.save_frame(str(temp_processed), t=0)
-            return str(temp_processed)
-            
+                content_hash, size = file_digest(local_path), Path(local_path).stat().st_size
+            get_catalog().add_asset(self.story_slug, IMAGE, position=index, url=str(url), content_hash=content_hash,
+                                    local_path=local_path, size=size)
+        except Exception as exc:
+            print(f"Cataloging image #{index} failed: {exc}")
 
-    def create_video(self):
+    def render_key(self, timeline: Timeline, audio_path: Path) -> str:
+        """
+            Content address of the whole video: every frame's inputs (as in segment keys),
+            the narration and how it is muxed.
+        """
+        payload = {
+            "frames": segment_keys(timeline, [(0, total_frames(timeline))], self.encoder_profile),
+            "audio": file_digest(audio_path),
+            "audio_filter": self.audio_filter(),
+        }
+        raw = json.dumps(payload, sort_keys=True).encode("utf-8")
+        return hashlib.sha256(raw).hexdigest()
+
+    def __shared_frames(self) -> SharedFrames:
+        with self._prefetch_lock:
+            if self._frames is None:
+                self._frames = SharedFrames()
+            return self._frames
+
+    def __prepare_image(self, index: int, url: str) -> str:
+        with span("editor.prefetch_image", story=self.story_slug, index=index, in_memory=self.in_memory):
+            if self.in_memory:
+                image_path = self.imgs_dir / f"_{index}.jpg"
+                data = get_fetcher().fetch_buffer(url, destination=image_path)
+                self.__catalog_image(index, url, image_path, data=data)
+                fitted = fit_image(data, self.video_size)
+                shared = self.__shared_frames().share(fitted)
+                if shared is not None:
+                    return shared
+                # /dev/shm is full (see README, --shm-size), workers memory-map the array from disk instead
+                print(f"---NO ROOM IN /dev/shm FOR IMAGE {index}, USING A FILE---")
+                image_path.parent.mkdir(parents=True, exist_ok=True)
+                return save_image_array(fitted, processed_path(str(image_path), self.video_size))
+            image_path = self.fetch_data(url=url, destination=self.imgs_dir, suffix=".jpg", index=index)
+            self.__catalog_image(index, url, image_path)
+            # PIL releases the GIL while decoding and resizing, threads are enough here
+            return resize_and_crop(str(image_path), self.video_size)
+
+    def prefetch_image(self, index: int, url: str) -> concurrent.futures.Future:
+        """
+            Starts fetching and preprocessing a single image in the background,
+            as soon as its link is known (e.g. while other images are still generated).
+            index is the scene's position, used for the file name.
+        """
+        url = str(url)
+        with self._prefetch_lock:
+            future = self._image_futures.get(url)
+            if future is None:
+                future = self.__prefetch_pool().submit(self.__prepare_image, index, url)
+                self._image_futures[url] = future
+                self._image_indices.add(index)
+            return future
+
+    def __prepare_audio(self) -> Path:
+        audio_file = self.fetch_audio()
+        # result is stored next to the audio, generate_subtitles reuses it
+        self.transcribe_words(audio_file)
+        return audio_file
+
+    def prefetch_audio(self, url) -> concurrent.futures.Future:
+        """
+            Starts fetching, speeding up and transcribing the narration in the background.
+        """
+        url = str(url)
+        with self._prefetch_lock:
+            if self._audio_future is None or self._prefetched_audio_url != url:
+                self.audio_url = url
+                self._prefetched_audio_url = url
+                self._audio_future = self.__prefetch_pool().submit(self.__prepare_audio)
+            return self._audio_future
+
+    def __collect_prefetched_images(self) -> List[Tuple[int, str]]:
+        futures = []
+        for position, url in enumerate(self.image_urls):
+            if str(url) not in self._image_futures:
+                # link that wasn't handed over (e.g. the pipeline was resumed), fetch it now
+                # under a file name no prefetched image uses
+                index = position
+                while index in self._image_indices:
+                    index += len(self.image_urls)
+                self.prefetch_image(index, url)
+            futures.append((position, self._image_futures[str(url)]))
 
-        
+        image_files = []
+        for position, future in futures:
+            try:
+                image_files.append((position, future.result()))
+            except Exception as exc:
+                print(f"Image fetch failed: {exc}.")
+        return image_files
+
+    def prepare_images(self) -> List[Tuple[int, str]]:
+        """
+            Fetches images, then decodes, fits and crops all of them in a process pool,
+            so rendering works on arrays of exactly the video size.
+            Images already handed over with prefetch_image are reused.
+
+            With in_memory, images are fetched and decoded one by one in threads
+            (as prefetch_image does) and returned as shared frame references.
+        """
+        if self._image_futures or self.in_memory:
+            return self.__collect_prefetched_images()
+
+        image_files = self.fetch_images()
+        with span("editor.preprocess_images", story=self.story_slug, images=len(image_files)):
+            processed = preprocess_images([img_path for _, img_path in image_files],
+                                          target_size=self.video_size,
+                                          max_workers=self.preprocess_workers)
+        return [(i, processed_path) for (i, _), processed_path in zip(image_files, processed)]
+
+    def create_video(self):
+        try:
+            return self.__create_video()
+        finally:
+            self.__release_frames()
+
+    def __release_frames(self):
+        if self._prefetch_executor is not None:
+            # nothing decodes into blocks that are about to be released
+            self._prefetch_executor.shutdown(wait=True)
+            self._prefetch_executor = None
+        with self._prefetch_lock:
+            frames, self._frames = self._frames, None
+            if frames is not None:
+                # prefetched references point into the released blocks
+                self._image_futures.clear()
+                self._image_indices.clear()
+        if frames is not None:
+            frames.close()
+
+    def __create_video(self):
         # TODO: maybe rewriting it to async would be better, but too much work lol, 
         # it would be cheaper in terms of computing (one thread instead of many)
         # concurrently fetch data
         with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-            future_images = executor.submit(self.fetch_images)
-            future_audio = executor.submit(self.fetch_audio)
+            future_images = executor.submit(self.prepare_images)
+            if self._audio_future is not None and self._prefetched_audio_url == str(self.audio_url):
+                future_audio = self._audio_future
+            else:
+                future_audio = executor.submit(self.fetch_audio)
 
             # wait for resources, returns path to resources
             image_files = future_images.result()
             audio_file = future_audio.result()
 
+        if self._prefetch_executor is not None:
+            self._prefetch_executor.shutdown(wait=True)
+            self._prefetch_executor = None
 
+
+        from moviepy import AudioFileClip
         audio_clip = AudioFileClip(str(audio_file))
-        audio_duration = audio_clip.duration
+        audio_duration = audio_clip.duration * self.audio_time_scale()
 
         # subtitles generated
         timestamp_with_subtitles = self.generate_subtitles(audio_path=audio_file, subtitles_chunk_size=2)
         srt_file = self.create_srt_file(timestamp_with_subtitles)
 
         # determine time for images
-        clean_durations = self.determine_time(transcript=srt_file, audio_duration=audio_clip.duration)
+        with span("editor.determine_time", story=self.story_slug, scenes=len(self.scenes)):
+            clean_durations = self.scene_durations(transcript=srt_file, audio_duration=audio_duration)
 
 
 
         # ADD TRANSITIONS AND ANIMATIONS
         CROSSFADE_DURATION = 1.0
-        final_clips_with_transitions = []
-        current_start_time = 0.0
-        for (idx, img_path), clean_duration in zip(image_files, clean_durations):
-            
-            # fit image exaclty in the frame
-
-           
-            # the clips except for the last one will be extended by an animation
-            is_last = (idx == len(image_files) - 1)
-            actual_duration = clean_duration if is_last else clean_duration + CROSSFADE_DURATION
-
-            clip = ImageClip(img_path).with_duration(actual_duration)
-
-            # Zoom animation with proper closure
-            animated_clip = clip.resized(lambda t, dur=clean_duration: 1 + (self.zoom_factor) * t / dur)
-            centered_clip = animated_clip.with_position("center")
-            animated_clip = CompositeVideoClip([centered_clip], size=self.video_size)
-            
-            # Apply crossfade for clips after the first
-            if idx > 0:
-                animated_clip = CrossFadeIn(CROSSFADE_DURATION).apply(animated_clip)
-            
-            final_clip = animated_clip.with_start(current_start_time)
-
-            final_clips_with_transitions.append(final_clip)
-            current_start_time += clean_duration
-
-
-        # since all clips were added with proper start times we can simply put everything into
-        # clips generation
-        video_track = CompositeVideoClip(final_clips_with_transitions)
-        video_track.with_duration(audio_duration)
-
-        # This prevents the text from being centered in a full-screen box
-        text_box_height = 400 
-
-        generator = lambda text: TextClip(
-                                        font=self.font_path,
-                                        text=text,
-                                        color='white',
-                                        text_align='center',
-                                        font_size=100,
-                                        stroke_color='black',
-                                        # stroke_width=4,
-                                        method='caption',
-                                        size=(video_track.w - 100, text_box_height), 
-                                        )
-
-        subtitles_clip = SubtitlesClip(
-            srt_file,
-            make_textclip=generator, 
-            encoding='utf-8'
+        timeline = Timeline(
+            size=self.video_size,
+            fps=self.fps,
+            duration=audio_duration,
+            zoom_factor=self.zoom_factor,
+            scenes=build_scenes([img_path for _, img_path in image_files], clean_durations, CROSSFADE_DURATION),
+            srt_path=str(srt_file),
+            font_path=str(self.font_path),
+            font_size=self.font_size,
+            text_box_height=self.text_box_height,
+            subtitle_margin=self.subtitle_margin,
+            resample=self.resample,
         )
+        audio_clip.close()
+
+        # save video, audio is muxed by the encoder straight from the file
+        suffix = "_preview" if self.preview else ""
+        final_output_path = self.videos_dir / Path(f"{self.story_slug}{suffix}.mp4")
+
+        # the same inputs were already rendered (by this or any other story)
+        catalog = get_catalog()
+        render_key = self.render_key(timeline, audio_file)
+        existing = catalog.find_render(render_key)
+        if existing is not None:
+            print(f"---REUSING RENDER {existing['path']}---")
+            if Path(existing["path"]).resolve() != final_output_path.resolve():
+                shutil.copyfile(existing["path"], final_output_path)
+                # the copy is this story's video, catalog.renders(slug) has to find it
+                catalog.add_render(self.story_slug, render_key, final_output_path,
+                                   content_hash=existing["content_hash"], size=final_output_path.stat().st_size,
+                                   width=existing["width"], height=existing["height"], fps=existing["fps"],
+                                   duration=existing["duration"], preview=bool(existing["preview"]))
+            return final_output_path
 
-        # Ensure subtitles last as long as the video
-        subtitles_clip = subtitles_clip.with_duration(video_track.duration)
-
-        # Position: 'center' horizontally, and bottom 20% vertically
-        # We subtract the text_box_height to ensure it doesn't bleed off the bottom
-        position_y = self.video_size[1] - text_box_height - 50 
-        subtitles_clip = subtitles_clip.with_position(('center', position_y))
-
-        video = CompositeVideoClip([video_track, subtitles_clip])
+        if self.render_workers > 1 or self.segment_cache:
+            self.write_video_parallel(timeline, audio_path=audio_file, output_path=final_output_path)
+        else:
+            with span("editor.compose", story=self.story_slug, scenes=len(timeline.scenes)):
+                video = compose_timeline(timeline)
+            self.write_video(video, audio_path=audio_file, output_path=final_output_path)
+
+        catalog.add_render(self.story_slug, render_key, final_output_path,
+                           content_hash=file_digest(final_output_path),
+                           size=final_output_path.stat().st_size,
+                           width=self.video_size[0], height=self.video_size[1], fps=self.fps,
+                           duration=timeline.duration, preview=self.preview)
+        return final_output_path
+
+    def write_video_parallel(self, timeline: Timeline, audio_path: Path, output_path: Path) -> Path:
+        """
+            Splits the timeline at scene boundaries, renders segments (in a process pool
+            when render_workers > 1) and joins them without re-encoding.
+            Audio is muxed once, during the join.
 
-        # ADD AUDIO
-        video = video.with_audio(audio_clip)
+            With segment_cache, rendered segments are stored by the hash of their inputs,
+            so after changing one image or one scene's timing only the segments showing it
+            are rendered again.
+        """
+        ranges = segment_frame_ranges(timeline, min_segments=self.render_workers)
+        segments_dir = self.videos_dir / "segments"
+        segments_dir.mkdir(parents=True, exist_ok=True)
+
+        # split the cores between workers, unless the profile pins the thread count
+        profile = self.encoder_profile
+        if profile.threads == 0:
+            threads = max(1, (os.cpu_count() or 1) // self.render_workers)
+            profile = profile.model_copy(update={"threads": threads})
+
+        cache = get_segment_cache() if self.segment_cache else None
+        if cache is not None and cache.enabled:
+            keys = segment_keys(timeline, ranges, profile)
+            segment_paths = [cache.blob_path(key) for key in keys]
+        else:
+            keys = [None] * len(ranges)
+            segment_paths = [None] * len(ranges)
+        missing = [i for i, path in enumerate(segment_paths) if path is None]
+        for i in missing:
+            segment_paths[i] = segments_dir / f"segment_{i:04d}.mp4"
+
+        workers = min(self.render_workers, max(1, len(missing)))
+        print(f"---RENDERING {len(missing)} OF {len(ranges)} SEGMENTS WITH {workers} WORKERS---")
+        start = time.perf_counter()
+        with span("editor.encode", story=self.story_slug, frames=total_frames(timeline),
+                  segments=len(ranges), rendered_segments=len(missing), workers=workers, preset=profile.preset):
+            if workers > 1:
+                with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+                    futures = [
+                        executor.submit(render_frames, timeline, *ranges[i], segment_paths[i], profile)
+                        for i in missing
+                    ]
+                    for future in futures:
+                        future.result()
+            else:
+                for i in missing:
+                    render_frames(timeline, *ranges[i], segment_paths[i], profile)
+
+            for i in missing:
+                if keys[i] is not None:
+                    segment_paths[i] = cache.set_file(keys[i], segment_paths[i])
+
+            concat_segments(segment_paths, output_path, audio_path=audio_path, profile=profile,
+                            audio_filter=self.audio_filter())
+        elapsed = time.perf_counter() - start
+        print(f"---ENCODED {total_frames(timeline)} FRAMES in {elapsed:.1f}s, "
+              f"fps: {total_frames(timeline) / elapsed:.1f}---")
+
+        for segment_path in segment_paths:
+            # cached segments stay in the cache
+            if Path(segment_path).parent == segments_dir:
+                Path(segment_path).unlink(missing_ok=True)
+        return output_path
+
+    def write_video(self, video, audio_path: Path, output_path: Path) -> Path:
+        """
+            Streams composited frames into ffmpeg using self.encoder_profile.
+        """
+        # frames are composited lazily, so this includes compositing time
+        with span("editor.encode", story=self.story_slug, preset=self.encoder_profile.preset) as s, \
+             FFmpegEncoder(output_path,
+                           size=self.video_size,
+                           fps=self.fps,
+                           profile=self.encoder_profile,
+                           audio_path=audio_path,
+                           audio_filter=self.audio_filter()) as encoder:
+            for frame in video.iter_frames(fps=self.fps, dtype="uint8", logger="bar"):
+                encoder.write_frame(frame)
+            s.set(frames=encoder.frames_written)
 
-        # save video
-        final_output_path = self.videos_dir / Path(f"{self.story_slug}.mp4")
-        video.write_videofile(final_output_path, fps=24)
+        print(f"---ENCODED {encoder.frames_written} FRAMES in {encoder.wall_time:.1f}s, "
+              f"encoder fps: {encoder.encoder_fps:.1f} "
+              f"({self.encoder_profile.codec}, preset={self.encoder_profile.preset}, crf={self.encoder_profile.crf})---")
+        return output_path
 
 
 
@@ -529,7 +843,8 @@ if __name__ == "__main__":
     editor = Editor(title=TITLE,
                     playback_speed=1.5,
                     scenes=movie_data["image_prompts"],
-                    audio_url=movie_data["audio_link"],
+                    audio_url=movie_data.get("audio_path") or movie_data.get("audio_link"),
+                    audio_offsets=movie_data.get("audio_offsets"),
                     image_urls=movie_data["photo_links"])
     
     editor.create_video()
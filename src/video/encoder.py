@@ -0,0 +1,221 @@
+import imageio_ffmpeg
+import numpy as np
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from schemas.schemas import EncoderProfile
+
+
+def ffmpeg_executable() -> str:
+    """
+        ffmpeg binary shipped with imageio-ffmpeg (falls back to the system one).
+    """
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+
+class FFmpegEncoder:
+    """
+        Streams raw RGB frames into a single long-lived ffmpeg process over a pipe.
+
+        Frames are copied into one preallocated buffer (only when they are not
+        already contiguous uint8 of the right shape) and written without extra
+        allocations. Audio, if given, is muxed by the same ffmpeg process.
+        Encoder side progress (frames, fps) is read from ffmpeg's -progress output.
+
+        Usage:
+            with FFmpegEncoder(path, size, fps, profile, audio_path) as encoder:
+                for frame in clip.iter_frames(fps=fps, dtype="uint8"):
+                    encoder.write_frame(frame)
+            print(encoder.encoder_fps)
+    """
+
+    def __init__(self,
+                 output_path: Path,
+                 size: Tuple[int, int],
+                 fps: float,
+                 profile: EncoderProfile | None = None,
+                 audio_path: Optional[Path] = None,
+                 audio_filter: Optional[str] = None):
+
+        self.output_path = Path(output_path)
+        self.size = (int(size[0]), int(size[1]))
+        self.fps = fps
+        self.profile = profile or EncoderProfile()
+        self.audio_path = audio_path
+        self.audio_filter = audio_filter
+
+        width, height = self.size
+        self._buffer = np.empty((height, width, 3), dtype=np.uint8)
+        self._process: subprocess.Popen | None = None
+        self._stderr_lines: List[str] = []
+        self._readers: List[threading.Thread] = []
+
+        self.frames_written = 0
+        self.encoder_frames = 0
+        self.encoder_fps = 0.0
+        self.wall_time = 0.0
+        self._started_at = 0.0
+
+    def command(self) -> List[str]:
+        width, height = self.size
+        profile = self.profile
+
+        cmd = [
+            ffmpeg_executable(), "-y",
+            "-loglevel", "error", "-nostats",
+            "-progress", "pipe:1",
+            # raw frames from stdin
+            "-f", "rawvideo",
+            "-pix_fmt", "rgb24",
+            "-s", f"{width}x{height}",
+            "-r", str(self.fps),
+            "-i", "pipe:0",
+        ]
+        if self.audio_path is not None:
+            cmd += ["-i", str(self.audio_path)]
+
+        cmd += ["-map", "0:v:0"]
+        cmd += [
+            "-c:v", profile.codec,
+            "-preset", profile.preset,
+            "-crf", str(profile.crf),
+            "-threads", str(profile.threads),
+            "-pix_fmt", profile.pix_fmt,
+        ]
+        if profile.codec == "libx265":
+            # makes the file playable in quicktime/safari
+            cmd += ["-tag:v", "hvc1"]
+
+        if self.audio_path is not None:
+            cmd += ["-map", "1:a:0", "-c:a", profile.audio_codec, "-b:a", profile.audio_bitrate]
+            if self.audio_filter:
+                cmd += ["-filter:a", self.audio_filter]
+            cmd += ["-shortest"]
+
+        cmd += ["-movflags", "+faststart", str(self.output_path)]
+        return cmd
+
+    def __read_progress(self, stream):
+        for raw in stream:
+            line = raw.decode("utf-8", errors="replace").strip()
+            key, _, value = line.partition("=")
+            try:
+                if key == "frame":
+                    self.encoder_frames = int(value)
+                elif key == "fps":
+                    self.encoder_fps = float(value)
+            except ValueError:
+                pass
+
+    def __read_errors(self, stream):
+        for raw in stream:
+            self._stderr_lines.append(raw.decode("utf-8", errors="replace").rstrip())
+            # keep only the tail, enough to explain a failure
+            del self._stderr_lines[:-50]
+
+    def start(self):
+        self.output_path.parent.mkdir(parents=True, exist_ok=True)
+        self._process = subprocess.Popen(self.command(),
+                                         stdin=subprocess.PIPE,
+                                         stdout=subprocess.PIPE,
+                                         stderr=subprocess.PIPE)
+        self._readers = [
+            threading.Thread(target=self.__read_progress, args=(self._process.stdout,), daemon=True),
+            threading.Thread(target=self.__read_errors, args=(self._process.stderr,), daemon=True),
+        ]
+        for reader in self._readers:
+            reader.start()
+        self._started_at = time.perf_counter()
+        return self
+
+    def write_frame(self, frame: np.ndarray):
+        if (frame.dtype == np.uint8 and frame.shape == self._buffer.shape
+                and frame.flags["C_CONTIGUOUS"]):
+            data = frame
+        else:
+            # drop alpha, cast and make contiguous in the preallocated buffer
+            np.copyto(self._buffer, frame[..., :3], casting="unsafe")
+            data = self._buffer
+
+        try:
+            self._process.stdin.write(memoryview(data).cast("B"))
+        except BrokenPipeError:
+            raise Exception(f"ffmpeg stopped accepting frames: {self.errors()}")
+        self.frames_written += 1
+
+    def errors(self) -> str:
+        return "\n".join(self._stderr_lines)
+
+    def close(self):
+        if self._process is None:
+            return
+        self._process.stdin.close()
+        return_code = self._process.wait()
+        for reader in self._readers:
+            reader.join(timeout=5)
+        self.wall_time = time.perf_counter() - self._started_at
+        self._process = None
+
+        if return_code != 0:
+            raise Exception(f"ffmpeg exited with code {return_code}: {self.errors()}")
+
+        # ffmpeg reports averaged fps, fall back to our measurement when it didn't
+        if not self.encoder_fps and self.wall_time > 0:
+            self.encoder_fps = self.frames_written / self.wall_time
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self._process is not None:
+            self._process.kill()
+            self._process.wait()
+            self._process = None
+            return False
+        self.close()
+        return False
+
+
+def concat_segments(segment_paths: List[Path],
+                    output_path: Path,
+                    audio_path: Optional[Path] = None,
+                    profile: EncoderProfile | None = None,
+                    audio_filter: Optional[str] = None) -> Path:
+    """
+        Joins video segments encoded with identical settings using the concat demuxer
+        (video stream is copied, not re-encoded) and muxes the audio once.
+    """
+    profile = profile or EncoderProfile()
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    list_path = output_path.with_suffix(".concat.txt")
+
+    with open(list_path, "w", encoding="utf-8") as f:
+        for segment in segment_paths:
+            # concat demuxer quoting: single quotes, escaped as '\''
+            escaped = str(Path(segment).resolve()).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+    cmd = [
+        ffmpeg_executable(), "-y", "-loglevel", "error",
+        "-f", "concat", "-safe", "0", "-i", str(list_path),
+    ]
+    if audio_path is not None:
+        cmd += ["-i", str(audio_path), "-map", "0:v:0", "-map", "1:a:0",
+                "-c:a", profile.audio_codec, "-b:a", profile.audio_bitrate]
+        if audio_filter:
+            cmd += ["-filter:a", audio_filter]
+        cmd += ["-shortest"]
+    cmd += ["-c:v", "copy", "-movflags", "+faststart", str(output_path)]
+
+    try:
+        result = subprocess.run(cmd, capture_output=True)
+    finally:
+        list_path.unlink(missing_ok=True)
+
+    if result.returncode != 0:
+        raise Exception(f"ffmpeg concat failed: {result.stderr.decode('utf-8', errors='replace')}")
+    return output_path
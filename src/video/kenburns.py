@@ -0,0 +1,122 @@
+from moviepy import VideoClip
+from PIL import Image
+from pathlib import Path
+from typing import List, Tuple
+import numpy as np
+import math
+
+from video.shared_frames import is_shared_frame, open_shared_frame
+
+
+class KenBurnsClip(VideoClip):
+    """
+        Zoom-in ("Ken Burns") animation of a still image.
+
+        The image is cover-fitted into `size` and scaled by 1 + zoom_factor * t / zoom_duration
+        around its center, same as clip.resized(lambda t: ...) in a CompositeVideoClip,
+        but without resampling the whole image on every frame.
+
+        The source rectangle visible in every frame is precomputed up front. A frame is
+        then produced with a single resample of only that rectangle straight into the
+        output size. With use_pyramid, the rectangle is read from the smallest
+        mip level (source halved k times) that still has at least output resolution.
+    """
+
+    def __init__(self,
+                 image,
+                 size: Tuple[int, int],
+                 duration: float,
+                 zoom_factor: float,
+                 zoom_duration: float,
+                 fps: int = 24,
+                 resample=Image.Resampling.BILINEAR,
+                 use_pyramid: bool = True):
+
+        self.output_size = (int(size[0]), int(size[1]))
+        self.zoom_factor = zoom_factor
+        self.zoom_duration = zoom_duration if zoom_duration > 0 else duration
+        self.animation_fps = fps
+        self.resample = resample
+
+        source = self.__load(image)
+        self.levels: List[Image.Image] = [source]
+        if use_pyramid:
+            self.levels += self.__build_pyramid(source)
+
+        self.rects, self.rect_levels = self.__precompute_rects(duration)
+
+        super().__init__(frame_function=self.__make_frame, duration=duration)
+
+    def __load(self, image) -> Image.Image:
+        if isinstance(image, Image.Image):
+            return image.convert("RGB")
+        if isinstance(image, np.ndarray):
+            return Image.fromarray(image[..., :3].astype(np.uint8, copy=False))
+        if is_shared_frame(image):
+            # decoded by the editor (see video/shared_frames.py); PIL copies RGB arrays,
+            # so the image outlives the attached block
+            with open_shared_frame(image) as frame:
+                return Image.fromarray(frame[..., :3])
+        if Path(image).suffix == ".npy":
+            # preprocessed frame sized array (see video/preprocess.py)
+            return Image.fromarray(np.load(image, mmap_mode="r")[..., :3])
+        with Image.open(Path(image)) as img:
+            return img.convert("RGB")
+
+    def __build_pyramid(self, source: Image.Image) -> List[Image.Image]:
+        """
+            Halves the source while it is still at least 2x bigger than the output.
+        """
+        levels = []
+        current = source
+        out_w, out_h = self.output_size
+        while current.width >= 2 * out_w and current.height >= 2 * out_h:
+            current = current.reduce(2)
+            levels.append(current)
+        return levels
+
+    def __precompute_rects(self, duration: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+            Visible rectangle (x0, y0, x1, y1) in coordinates of the chosen pyramid level,
+            for every frame of the clip.
+        """
+        out_w, out_h = self.output_size
+        src_w, src_h = self.levels[0].size
+
+        n_frames = int(math.ceil(duration * self.animation_fps)) + 1
+        t = np.arange(n_frames, dtype=np.float64) / self.animation_fps
+        scale = 1 + self.zoom_factor * t / self.zoom_duration
+
+        # cover fit: the whole output is always filled with the image
+        cover = max(out_w / src_w, out_h / src_h)
+        rect_w = out_w / (cover * scale)
+        rect_h = out_h / (cover * scale)
+
+        x0 = (src_w - rect_w) / 2
+        y0 = (src_h - rect_h) / 2
+        rects = np.stack([x0, y0, x0 + rect_w, y0 + rect_h], axis=1)
+
+        # deepest level at which the rectangle still has at least output resolution
+        level_idx = np.zeros(n_frames, dtype=np.int64)
+        for level in range(1, len(self.levels)):
+            factor = 2 ** level
+            fits = (rect_w / factor >= out_w) & (rect_h / factor >= out_h)
+            level_idx[fits] = level
+
+        rects = rects / (2.0 ** level_idx)[:, None]
+        return rects, level_idx
+
+    def __make_frame(self, t: float) -> np.ndarray:
+        i = min(max(int(round(t * self.animation_fps)), 0), len(self.rects) - 1)
+        level = self.levels[self.rect_levels[i]]
+        # resize with a box only reads the visible region of the (pre-scaled) source
+        frame = level.resize(self.output_size, resample=self.resample, box=tuple(self.rects[i]))
+        return np.asarray(frame)
+
+    def close(self):
+        # the clip references itself through frame_function, so it is only collected
+        # by the cycle collector; the pixels are released right away
+        for level in self.levels:
+            level.close()
+        self.levels = []
+        super().close()
@@ -0,0 +1,72 @@
+from PIL import Image
+from pathlib import Path
+from typing import List, Tuple
+import concurrent.futures
+import io
+import numpy as np
+
+
+def processed_path(image_path: str, target_size: Tuple[int, int]) -> Path:
+    image_path = Path(image_path)
+    width, height = target_size
+    return image_path.parent / f"processed_{image_path.stem}_{width}x{height}.npy"
+
+
+def fit_image(source: str | bytes, target_size: Tuple[int, int]) -> np.ndarray:
+    """
+        Decodes an image (a file or its encoded bytes), fits it to target size (cover mode)
+        and center crops it. Returns an H x W x 3 uint8 array.
+    """
+    target_w, target_h = target_size
+    with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as img:
+        # lets the JPEG decoder skip resolution we'd throw away anyway (DCT scaling)
+        img.draft("RGB", (target_w, target_h))
+        img = img.convert("RGB")
+
+        # Resize so that the smallest dimension matches the target
+        w, h = img.size
+        scale = max(target_w / w, target_h / h)
+        crop_w, crop_h = target_w / scale, target_h / scale
+
+        # Center crop, done by the resize itself (box is in source coordinates)
+        left = (w - crop_w) / 2
+        top = (h - crop_h) / 2
+        box = (left, top, left + crop_w, top + crop_h)
+        fitted = img.resize((target_w, target_h), resample=Image.Resampling.LANCZOS, box=box)
+    return np.asarray(fitted, dtype=np.uint8)
+
+
+def resize_and_crop(image_path: str, target_size: Tuple[int, int]) -> str:
+    """
+        fit_image, with the result stored as an uncompressed .npy array, which render
+        workers can memory-map instead of decoding a JPEG.
+        Returns path to processed image, already processed images are reused.
+    """
+    output_path = processed_path(image_path, target_size)
+    if output_path.exists() and output_path.stat().st_mtime >= Path(image_path).stat().st_mtime:
+        return str(output_path)
+
+    return save_image_array(fit_image(image_path, target_size), output_path)
+
+
+def save_image_array(fitted: np.ndarray, output_path: Path) -> str:
+    """
+        Stores an already fitted image as .npy, returns its path.
+    """
+    # write to a temporary file first, a reader never sees a partial array
+    tmp_path = Path(output_path).with_suffix(".tmp.npy")
+    np.save(tmp_path, fitted)
+    tmp_path.replace(output_path)
+    return str(output_path)
+
+
+def preprocess_images(image_paths: List[str], target_size: Tuple[int, int], max_workers: int | None = None) -> List[str]:
+    """
+        Runs resize_and_crop for all images in a process pool (decoding and resampling are CPU bound).
+        Keeps the order of image_paths.
+    """
+    if not image_paths:
+        return []
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(resize_and_crop, image_paths, [tuple(target_size)] * len(image_paths)))
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from cache.cache import DiskCache
+from schemas.schemas import EncoderProfile, Timeline
+from video.shared_frames import is_shared_frame, parse_frame_ref
+
+ROOT_SRC = Path(__file__).resolve().parent.parent
+SEGMENTS_PATH = Path(os.getenv("CONTENT_GEN_SEGMENTS_DIR", ROOT_SRC / "data" / "segments"))
+
+# defaults can be overriden through the environment (.env)
+MAX_SEGMENTS_BYTES = int(os.getenv("CONTENT_GEN_SEGMENTS_MAX_BYTES", 10 * 1024 ** 3))
+SEGMENTS_ENABLED = os.getenv("CONTENT_GEN_SEGMENTS", "1") != "0"
+
+# bump when rendering changes in a way the inputs below don't capture
+RENDER_VERSION = 2
+
+_digests: Dict[Tuple[str, int, int], str] = {}
+_digests_lock = threading.Lock()
+
+
+def file_digest(path) -> str:
+    """
+        sha256 of a file, remembered per (path, size, mtime) for the lifetime of the process.
+    """
+    path = str(path)
+    st = os.stat(path)
+    memo_key = (path, st.st_size, st.st_mtime_ns)
+    with _digests_lock:
+        digest = _digests.get(memo_key)
+    if digest is not None:
+        return digest
+
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(block)
+    digest = sha.hexdigest()
+    with _digests_lock:
+        _digests[memo_key] = digest
+    return digest
+
+
+def image_digest(image: str) -> str:
+    """
+        Digest of a scene's pixels source, a file or a shared frame.
+    """
+    if is_shared_frame(image):
+        return parse_frame_ref(image)[2]
+    return file_digest(image)
+
+
+def relative_time(t: float, origin: float) -> float:
+    # rounded, the same offset computed from different absolute times differs in the last bits
+    return round(t - origin, 6)
+
+
+def segment_keys(timeline: Timeline, ranges: List[Tuple[int, int]], profile: EncoderProfile) -> List[str]:
+    """
+        Content address of every [start_frame, end_frame) range of the timeline.
+
+        A key covers everything visible in the range: pixels of the scenes overlapping
+        it (with their timing, zoom and transition), the subtitles shown during it,
+        font, output size/fps and encoder settings. Changing one image or one scene's
+        timing only changes the keys of the ranges that show it.
+
+        Times are taken relative to the first frame of the range, so a segment whose
+        content only moved (an earlier scene got longer or shorter) keeps its key.
+    """
+    from moviepy.video.tools.subtitles import file_to_subtitles
+    subtitles = file_to_subtitles(timeline.srt_path, encoding="utf-8")
+    common = {
+        "version": RENDER_VERSION,
+        "size": list(timeline.size),
+        "fps": timeline.fps,
+        "zoom_factor": timeline.zoom_factor,
+        "font": file_digest(timeline.font_path),
+        "font_size": timeline.font_size,
+        "text_box_height": timeline.text_box_height,
+        "subtitle_margin": timeline.subtitle_margin,
+        "resample": timeline.resample,
+        # threads don't change the picture, they're tuned per number of workers
+        "profile": profile.model_dump(exclude={"threads"}),
+    }
+
+    keys = []
+    for start_frame, end_frame in ranges:
+        # frame i is shown at i / fps
+        t0 = start_frame / timeline.fps
+        t1 = (end_frame - 1) / timeline.fps
+        scenes = [
+            {
+                "image": image_digest(scene.image_path),
+                "start": relative_time(scene.start, t0),
+                "duration": scene.duration,
+                "zoom_duration": scene.zoom_duration,
+                "crossfade": scene.crossfade,
+            }
+            for scene in timeline.scenes
+            if scene.start <= t1 and scene.start + scene.duration > t0
+        ]
+        shown = [
+            [relative_time(start, t0), relative_time(end, t0), text]
+            for (start, end), text in subtitles
+            if start <= t1 and end > t0
+        ]
+        payload = {**common, "frames": end_frame - start_frame, "scenes": scenes, "subtitles": shown}
+        raw = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        keys.append(hashlib.sha256(raw).hexdigest())
+    return keys
+
+
+_default_segments: Optional[DiskCache] = None
+_default_lock = threading.Lock()
+
+
+def get_segment_cache() -> DiskCache:
+    """
+        Rendered segments shared by all stories, kept apart from the generation cache
+        (they're bigger and cheap to rebuild compared to provider calls).
+    """
+    global _default_segments
+    with _default_lock:
+        if _default_segments is None:
+            _default_segments = DiskCache(root=SEGMENTS_PATH, max_bytes=MAX_SEGMENTS_BYTES,
+                                          enabled=SEGMENTS_ENABLED)
+        return _default_segments
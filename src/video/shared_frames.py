@@ -0,0 +1,115 @@
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, Tuple
+
+import numpy as np
+
+# references look like shm://<block name>/<height>x<width>x<channels>/<sha256 of the pixels>
+SHM_SCHEME = "shm://"
+
+SHM_PATH = "/dev/shm"
+# defaults can be overriden through the environment (.env)
+# left free in /dev/shm for everything else using it (ffmpeg, multiprocessing queues)
+SHM_RESERVE_BYTES = int(os.getenv("CONTENT_GEN_SHM_RESERVE_BYTES", 16 * 1024 ** 2))
+
+
+def shm_free_bytes() -> int | None:
+    """
+        Free space of the shared memory filesystem, None where it isn't a mounted
+        filesystem (shared memory is then only limited by RAM).
+    """
+    try:
+        stats = os.statvfs(SHM_PATH)
+    except (OSError, AttributeError):
+        return None
+    return stats.f_bavail * stats.f_frsize
+
+
+def is_shared_frame(ref) -> bool:
+    return isinstance(ref, str) and ref.startswith(SHM_SCHEME)
+
+
+def parse_frame_ref(ref: str) -> Tuple[str, Tuple[int, ...], str]:
+    """
+        (block name, array shape, content digest) of a shared frame reference.
+    """
+    name, shape, digest = ref[len(SHM_SCHEME):].split("/")
+    return name, tuple(int(side) for side in shape.split("x")), digest
+
+
+@contextmanager
+def open_shared_frame(ref: str):
+    """
+        with open_shared_frame(ref) as frame:
+            ...  # uint8 array backed by the shared block, valid inside the block only
+
+        Works in any process while the owning SharedFrames is open. Attaching
+        from a worker is tracked by the parent's resource tracker (workers inherit it),
+        so the block is unlinked by its owner only.
+    """
+    name, shape, _ = parse_frame_ref(ref)
+    block = SharedMemory(name=name)
+    try:
+        frame = np.ndarray(shape, dtype=np.uint8, buffer=block.buf)
+        yield frame
+        del frame
+    finally:
+        block.close()
+
+
+class SharedFrames:
+    """
+        Decoded frames kept in shared memory blocks, so render workers read the
+        pixels the editor decoded instead of receiving pickled copies or reading files.
+        Blocks live until close() (or the end of the `with` block).
+
+        /dev/shm is a tmpfs of limited size (64 MB by default in Docker): creating a block
+        larger than the free space succeeds, but writing into it kills the process with
+        SIGBUS. share() checks the free space first and returns None when the frame doesn't fit.
+    """
+
+    def __init__(self):
+        self._blocks: Dict[str, SharedMemory] = {}
+        self._lock = threading.Lock()
+
+    def share(self, frame: np.ndarray) -> str | None:
+        """
+            Copies the frame into a new block, returns its reference,
+            or None when /dev/shm doesn't have room for it.
+        """
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        # check and create together, so concurrent calls don't both take the last free bytes
+        with self._lock:
+            free = shm_free_bytes()
+            if free is not None and free - frame.nbytes < SHM_RESERVE_BYTES:
+                return None
+            block = SharedMemory(create=True, size=max(1, frame.nbytes))
+            self._blocks[block.name] = block
+        shared = np.ndarray(frame.shape, dtype=np.uint8, buffer=block.buf)
+        shared[...] = frame
+        del shared
+
+        # segment cache keys are computed from the pixels, not from the (random) block name
+        digest = hashlib.sha256(frame.data).hexdigest()
+        return f"{SHM_SCHEME}{block.name}/{'x'.join(str(side) for side in frame.shape)}/{digest}"
+
+    def nbytes(self) -> int:
+        with self._lock:
+            return sum(block.size for block in self._blocks.values())
+
+    def close(self):
+        with self._lock:
+            blocks, self._blocks = self._blocks, {}
+        for block in blocks.values():
+            block.close()
+            block.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,171 @@
+from moviepy import TextClip
+from moviepy.video.tools.subtitles import file_to_subtitles
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import List, Tuple
+import numpy as np
+import threading
+import os
+
+# defaults can be overriden through the environment (.env)
+SUBTITLE_CACHE_MAX_BYTES = int(os.getenv("CONTENT_GEN_SUBTITLE_CACHE_MAX_BYTES", 256 * 1024 ** 2))
+
+
+class SubtitleSprite:
+    """
+        Pre-rasterized subtitle, cropped to the pixels that are actually drawn.
+        Colors are stored premultiplied by alpha, so blending is a single multiply-add.
+    """
+
+    def __init__(self, rgb: np.ndarray, alpha: np.ndarray):
+        # tight bounding box of visible pixels
+        rows = np.flatnonzero(alpha.max(axis=1) > 0)
+        cols = np.flatnonzero(alpha.max(axis=0) > 0)
+        if len(rows) == 0:
+            self.x, self.y = 0, 0
+            self.premultiplied = np.zeros((0, 0, 3), dtype=np.float32)
+            self.inverse_alpha = np.ones((0, 0, 1), dtype=np.float32)
+            return
+
+        y0, y1 = rows[0], rows[-1] + 1
+        x0, x1 = cols[0], cols[-1] + 1
+        alpha = alpha[y0:y1, x0:x1, None].astype(np.float32)
+
+        self.x, self.y = int(x0), int(y0)
+        self.premultiplied = rgb[y0:y1, x0:x1, :3].astype(np.float32) * alpha
+        self.inverse_alpha = 1.0 - alpha
+
+    @property
+    def empty(self) -> bool:
+        return self.premultiplied.size == 0
+
+    @property
+    def nbytes(self) -> int:
+        return self.premultiplied.nbytes + self.inverse_alpha.nbytes
+
+    def blend(self, frame: np.ndarray, x: int, y: int) -> np.ndarray:
+        """
+            Alpha blends the sprite onto frame with its box placed at (x, y).
+            Only the sprite region of the frame is touched.
+        """
+        if self.empty:
+            return frame
+        h, w = self.premultiplied.shape[:2]
+        top, left = y + self.y, x + self.x
+        # clip to the frame
+        bottom, right = min(top + h, frame.shape[0]), min(left + w, frame.shape[1])
+        if bottom <= top or right <= left:
+            return frame
+
+        if not frame.flags.writeable:
+            frame = frame.copy()
+        region = frame[top:bottom, left:right, :3]
+        sprite_h, sprite_w = bottom - top, right - left
+        blended = (region.astype(np.float32) * self.inverse_alpha[:sprite_h, :sprite_w]
+                   + self.premultiplied[:sprite_h, :sprite_w])
+        region[...] = np.clip(blended, 0, 255).astype(frame.dtype)
+        return frame
+
+
+class SubtitleSpriteCache:
+    """
+        Process wide cache of rasterized subtitles keyed by (text, font, font size, box),
+        every distinct subtitle pays for font layout and stroking only once.
+
+        Render workers are reused across videos, so the cache is an LRU bounded to
+        max_bytes of sprite pixels; a video only needs the sprites of its own subtitles.
+    """
+    _sprites: "OrderedDict[Tuple, SubtitleSprite]" = OrderedDict()
+    _nbytes = 0
+    max_bytes = SUBTITLE_CACHE_MAX_BYTES
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, text: str, font_path: str, font_size: int, box: Tuple[int, int]) -> SubtitleSprite:
+        key = (text, str(font_path), font_size, tuple(box))
+        with cls._lock:
+            sprite = cls._sprites.get(key)
+            if sprite is not None:
+                cls._sprites.move_to_end(key)
+                return sprite
+
+        sprite = cls.rasterize(text, font_path, font_size, box)
+        with cls._lock:
+            if key in cls._sprites:
+                cls._sprites.move_to_end(key)
+                return cls._sprites[key]
+            cls._sprites[key] = sprite
+            cls._nbytes += sprite.nbytes
+            # least recently used first, the sprite just added always stays
+            while cls._nbytes > cls.max_bytes and len(cls._sprites) > 1:
+                _, evicted = cls._sprites.popitem(last=False)
+                cls._nbytes -= evicted.nbytes
+        return sprite
+
+    @staticmethod
+    def rasterize(text: str, font_path: str, font_size: int, box: Tuple[int, int]) -> SubtitleSprite:
+        text_clip = TextClip(
+                        font=font_path,
+                        text=text,
+                        color='white',
+                        text_align='center',
+                        font_size=font_size,
+                        stroke_color='black',
+                        # stroke_width=4,
+                        method='caption',
+                        size=box,
+                        )
+        rgb = text_clip.get_frame(0)
+        alpha = text_clip.mask.get_frame(0) if text_clip.mask is not None else np.ones(rgb.shape[:2])
+        text_clip.close()
+        return SubtitleSprite(rgb, alpha)
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._sprites.clear()
+            cls._nbytes = 0
+
+    @classmethod
+    def nbytes(cls) -> int:
+        return cls._nbytes
+
+
+class SubtitleOverlay:
+    """
+        Draws subtitles from an srt file onto already composited frames.
+        Replaces SubtitlesClip + CompositeVideoClip, which re-created a TextClip
+        per subtitle and composited a full frame RGBA layer for every frame.
+    """
+
+    def __init__(self,
+                 srt_path: str,
+                 font_path: str,
+                 font_size: int,
+                 box: Tuple[int, int],
+                 position: Tuple[int, int],
+                 encoding: str = "utf-8"):
+
+        subtitles = file_to_subtitles(srt_path, encoding=encoding)
+        subtitles.sort(key=lambda s: s[0][0])
+        self.starts: List[float] = [start for (start, _), _ in subtitles]
+        self.subtitles = subtitles
+        self.font_path = str(font_path)
+        self.font_size = font_size
+        self.box = (int(box[0]), int(box[1]))
+        self.position = (int(position[0]), int(position[1]))
+
+    def sprite_at(self, t: float) -> SubtitleSprite | None:
+        i = bisect_right(self.starts, t) - 1
+        if i < 0:
+            return None
+        (start, end), text = self.subtitles[i]
+        if not (start <= t < end):
+            return None
+        return SubtitleSpriteCache.get(text, self.font_path, self.font_size, self.box)
+
+    def apply(self, frame: np.ndarray, t: float) -> np.ndarray:
+        sprite = self.sprite_at(t)
+        if sprite is None:
+            return frame
+        return sprite.blend(frame, *self.position)
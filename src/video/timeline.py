@@ -0,0 +1,111 @@
+from pathlib import Path
+from typing import List, Tuple
+import math
+
+from schemas.schemas import Timeline, TimelineScene, EncoderProfile
+from video.encoder import FFmpegEncoder
+from metrics.spans import span
+
+
+def build_scenes(image_paths: List[str], durations: List[float], crossfade: float) -> List[TimelineScene]:
+    """
+        Places scenes one after another, every scene except for the last one
+        is extended by the crossfade into the next one.
+    """
+    scenes = []
+    current_start_time = 0.0
+    for position, (img_path, clean_duration) in enumerate(zip(image_paths, durations)):
+        is_last = position == len(image_paths) - 1
+        scenes.append(TimelineScene(
+            image_path=str(img_path),
+            start=current_start_time,
+            duration=clean_duration if is_last else clean_duration + crossfade,
+            zoom_duration=clean_duration,
+            crossfade=0.0 if position == 0 else crossfade,
+        ))
+        current_start_time += clean_duration
+    return scenes
+
+
+def compose_timeline(timeline: Timeline):
+    """
+        Builds the composited clip (scenes with transitions and subtitles), without audio.
+        Only the scenes on screen are kept in memory (see TimelineClip).
+    """
+    # moviepy takes a while to import, only processes that render pay for it
+    from video.compositor import TimelineClip
+    from video.subtitles import SubtitleOverlay
+
+    # This prevents the text from being centered in a full-screen box
+    text_box_height = timeline.text_box_height
+
+    # Position: 'center' horizontally, and bottom 20% vertically
+    # We subtract the text_box_height to ensure it doesn't bleed off the bottom
+    margin = timeline.subtitle_margin
+    box = (timeline.size[0] - 2 * margin, text_box_height)
+    position = ((timeline.size[0] - box[0]) // 2, timeline.size[1] - text_box_height - margin)
+
+    # subtitles are rasterized once and blended onto the composited frames
+    overlay = SubtitleOverlay(timeline.srt_path,
+                              font_path=timeline.font_path,
+                              font_size=timeline.font_size,
+                              box=box,
+                              position=position)
+
+    return TimelineClip(timeline, overlay=overlay.apply)
+
+
+def total_frames(timeline: Timeline) -> int:
+    # same frame count as clip.iter_frames
+    return int(timeline.duration * timeline.fps)
+
+
+def segment_frame_ranges(timeline: Timeline, min_segments: int = 1, min_frames: int = 48) -> List[Tuple[int, int]]:
+    """
+        Splits the timeline into [start_frame, end_frame) ranges at scene boundaries.
+
+        Boundaries are placed on the frame grid (frame i is shown at i / fps), so a
+        crossfade overlapping a boundary is simply rendered by the segment its frames
+        fall into. When there are fewer scenes than min_segments, the longest ranges
+        are halved (down to min_frames) to keep all workers busy.
+    """
+    n_frames = total_frames(timeline)
+    boundaries = sorted({
+        min(n_frames, int(math.ceil(scene.start * timeline.fps)))
+        for scene in timeline.scenes
+    } | {0, n_frames})
+
+    ranges = [(a, b) for a, b in zip(boundaries, boundaries[1:]) if b > a]
+
+    while len(ranges) < min_segments:
+        longest = max(range(len(ranges)), key=lambda i: ranges[i][1] - ranges[i][0])
+        start, end = ranges[longest]
+        if end - start < 2 * min_frames:
+            break
+        middle = (start + end) // 2
+        ranges[longest:longest + 1] = [(start, middle), (middle, end)]
+
+    return ranges
+
+
+def render_frames(timeline: Timeline,
+                  start_frame: int,
+                  end_frame: int,
+                  output_path: Path,
+                  profile: EncoderProfile,
+                  audio_path: Path | None = None) -> Path:
+    """
+        Renders [start_frame, end_frame) of the timeline into output_path.
+        Module level, so it can run in a worker process.
+    """
+    with span("render.segment", frames=end_frame - start_frame, start_frame=start_frame):
+        video = compose_timeline(timeline)
+        with FFmpegEncoder(output_path,
+                           size=timeline.size,
+                           fps=timeline.fps,
+                           profile=profile,
+                           audio_path=audio_path) as encoder:
+            for i in range(start_frame, end_frame):
+                encoder.write_frame(video.get_frame(i / timeline.fps))
+        video.close()
+    return Path(output_path)
@@ -0,0 +1,65 @@
+from typing import TYPE_CHECKING, Dict, Tuple
+import threading
+import os
+
+# defaults can be overriden through the environment (.env)
+WHISPER_MODEL_SIZE = os.getenv("WHISPER_MODEL_SIZE", "small")
+WHISPER_DEVICE = os.getenv("WHISPER_DEVICE", "cpu")
+# int8 is the fastest option on CPU with barely noticeable accuracy loss
+WHISPER_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+# 0 lets ctranslate2 decide
+WHISPER_CPU_THREADS = int(os.getenv("WHISPER_CPU_THREADS", 0))
+WHISPER_NUM_WORKERS = int(os.getenv("WHISPER_NUM_WORKERS", 1))
+
+if TYPE_CHECKING:
+    from faster_whisper import WhisperModel
+
+
+class WhisperModelPool:
+    """
+        Process wide registry of loaded Whisper models.
+
+        Loading weights is the most expensive part of a short transcription, so every
+        model configuration is loaded once (on first use) and then shared by all
+        Editor instances and jobs running in the same process.
+        WhisperModel.transcribe is safe to call from multiple threads, num_workers
+        controls how many of those calls can run in parallel.
+    """
+    _models: Dict[Tuple, "WhisperModel"] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls,
+            model_size: str = WHISPER_MODEL_SIZE,
+            device: str = WHISPER_DEVICE,
+            compute_type: str = WHISPER_COMPUTE_TYPE,
+            cpu_threads: int = WHISPER_CPU_THREADS,
+            num_workers: int = WHISPER_NUM_WORKERS) -> "WhisperModel":
+
+        key = (model_size, device, compute_type, cpu_threads, num_workers)
+        model = cls._models.get(key)
+        if model is not None:
+            return model
+
+        with cls._lock:
+            # another thread could have loaded it while we were waiting
+            model = cls._models.get(key)
+            if model is None:
+                # imported here, workers that never transcribe don't pay for ctranslate2
+                from faster_whisper import WhisperModel
+                print(f"---LOADING WHISPER MODEL: {model_size} ({device}, {compute_type})---")
+                model = WhisperModel(model_size,
+                                     device=device,
+                                     compute_type=compute_type,
+                                     cpu_threads=cpu_threads,
+                                     num_workers=num_workers)
+                cls._models[key] = model
+            return model
+
+    @classmethod
+    def clear(cls):
+        """
+            Releases all loaded models.
+        """
+        with cls._lock:
+            cls._models.clear()
@@ -0,0 +1,59 @@
+import os
+import time
+
+from cache.cache import DiskCache, make_key
+
+
+def value_path(cache: DiskCache, key: str):
+    return cache.root / "values" / key[:2] / f"{key}.pkl"
+
+
+def test_key_ignores_whitespace_and_ordering():
+    assert (make_key("fal", "flux", {"prompt": "a  fox\n"}, {"w": 1, "h": 2})
+            == make_key("fal", "flux", {"prompt": "a fox"}, {"h": 2, "w": 1}))
+    assert make_key("fal", "flux", "a fox") != make_key("fal", "flux", "a cat")
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = DiskCache(root=tmp_path, max_bytes=0, max_age=60)
+    cache.set("ab01", "fresh")
+    cache.set("ab02", "stale")
+    hour_ago = time.time() - 3600
+    os.utime(value_path(cache, "ab02"), (hour_ago, hour_ago))
+
+    assert cache.get("ab01") == "fresh"
+    assert cache.get("ab02", "missing") == "missing"
+    assert not value_path(cache, "ab02").exists()
+
+
+def test_eviction_drops_least_recently_used(tmp_path):
+    cache = DiskCache(root=tmp_path, max_bytes=0, max_age=0)
+    keys = [f"cd{i:02d}" for i in range(4)]
+    for key in keys:
+        cache.set_bytes(key, b"x" * 100)
+    # cd00 was written first but read last
+    now = time.time()
+    for age, key in zip([10, 40, 30, 20], keys):
+        path = cache.root / "blobs" / key[:2] / f"{key}.bin"
+        os.utime(path, (now - age, now))
+
+    cache.max_bytes = 250
+    cache.evict()
+
+    assert [cache.get_bytes(key) is not None for key in keys] == [True, False, False, True]
+
+
+def test_reads_keep_an_entry_from_being_evicted(tmp_path):
+    cache = DiskCache(root=tmp_path, max_bytes=0, max_age=0)
+    cache.set("ef01", "a" * 100)
+    cache.set("ef02", "b" * 100)
+    past = time.time() - 100
+    for key in ("ef01", "ef02"):
+        os.utime(value_path(cache, key), (past, past))
+
+    assert cache.get("ef01") == "a" * 100
+    cache.max_bytes = value_path(cache, "ef01").stat().st_size
+    cache.evict()
+
+    assert cache.get("ef01") == "a" * 100
+    assert cache.get("ef02") is None
@@ -0,0 +1,73 @@
+import hashlib
+
+import pytest
+
+import catalog.catalog
+import images.images
+from bench.server import AssetServer, image_url
+from catalog.catalog import Catalog, IMAGE
+from images.images import reuse_image
+
+PROMPT = ("A russet fox, Flicker, crouched low in a vegetable patch, amber eyes focused on a tiny grey field mouse, "
+          "green plants around.")
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = Catalog(tmp_path / "catalog.sqlite", enabled=True)
+    monkeypatch.setattr(catalog.catalog, "_default_catalog", store)
+    return store
+
+
+@pytest.fixture(scope="module")
+def server():
+    with AssetServer() as server:
+        yield server
+
+
+def add_image(store: Catalog, tmp_path, url: str, data: bytes = b"fox pixels"):
+    # pipeline records the prompt, the editor the downloaded bytes
+    store.add_asset("earlier_story", IMAGE, position=0, prompt=PROMPT, url=url)
+    local_path = tmp_path / "earlier_story_0.jpg"
+    local_path.write_bytes(data)
+    store.add_asset("earlier_story", IMAGE, position=0, url=url, content_hash=hashlib.sha256(data).hexdigest(),
+                    local_path=local_path, size=len(data))
+    return local_path
+
+
+def test_prompt_rows_are_linked_to_their_content(store, tmp_path):
+    local_path = add_image(store, tmp_path, "https://cdn.example.com/fox.png")
+
+    match = store.find_similar_prompt(PROMPT, threshold=0.85)
+    assert match["content_hash"] == hashlib.sha256(b"fox pixels").hexdigest()
+    assert store.stored_copy(match) == local_path
+
+
+def test_reuse_prefers_the_stored_copy(store, tmp_path, monkeypatch):
+    monkeypatch.setattr(images.images, "DATA_PATH", tmp_path / "data")
+    # the provider link expired long ago, the bytes are still here
+    local_path = add_image(store, tmp_path, "https://cdn.example.com/expired.png")
+
+    reused = reuse_image(PROMPT, threshold=0.85, story_slug="new_story")
+    # the new story gets its own copy, the earlier story's file can go away
+    assert reused.startswith(str(tmp_path / "data" / "new_story" / "images"))
+    local_path.unlink()
+    assert open(reused, "rb").read() == b"fox pixels"
+
+
+def test_reuse_checks_the_link_when_there_is_no_stored_copy(store, tmp_path, server):
+    live = image_url(server.base_url, 8, 8, "fox")
+    local_path = add_image(store, tmp_path, live)
+    local_path.write_bytes(b"changed on disk")
+    assert reuse_image(PROMPT, threshold=0.85, story_slug="new_story") == live
+
+    dead = f"{server.base_url}/expired/fox.jpg"
+    store.add_asset("other_story", IMAGE, position=0, prompt=PROMPT, url=dead)
+    assert reuse_image(PROMPT, threshold=0.85, story_slug="new_story") is None
+
+
+def test_prompt_lookup_benchmark_finds_reworded_prompts():
+    from bench.prompt_lookup import run
+
+    result = run(prompts=2000, queries=40)
+    assert result["recall"] == 1.0
@@ -0,0 +1,54 @@
+import random
+
+from schemas.schemas import TimelineScene
+from video.compositor import SceneIndex
+
+
+def scene(start: float, duration: float) -> TimelineScene:
+    return TimelineScene(image_path="scene.jpg", start=start, duration=duration, zoom_duration=duration, crossfade=0.0)
+
+
+def brute_force(scenes, t: float):
+    return [i for i, s in sorted(enumerate(scenes), key=lambda e: e[1].start) if s.start <= t < s.start + s.duration]
+
+
+def test_one_scene_or_two_during_a_crossfade():
+    index = SceneIndex([scene(0.0, 2.5), scene(2.0, 3.5), scene(5.0, 1.5)])
+    assert index.active(0.0) == [0]
+    assert index.active(2.0) == [0, 1]
+    assert index.active(2.5) == [1]
+    assert index.active(5.25) == [1, 2]
+    assert index.active(6.5) == []
+    assert index.active(-1.0) == []
+
+
+def test_scenes_are_returned_in_start_order_whatever_their_order_in_the_list():
+    index = SceneIndex([scene(4.0, 2.0), scene(0.0, 5.0), scene(3.0, 1.0)])
+    assert index.active(3.5) == [1, 2]
+    assert index.active(4.5) == [1, 0]
+
+
+def test_a_long_scene_is_found_behind_short_ones():
+    # the running maximum of ends keeps the lookup going past scenes that already ended
+    index = SceneIndex([scene(0.0, 100.0)] + [scene(float(i), 0.5) for i in range(1, 50)])
+    assert index.active(30.75) == [0]
+    assert index.active(30.25) == [0, 30]
+
+
+def test_matches_a_linear_scan():
+    rng = random.Random(7)
+    scenes = [scene(rng.uniform(0, 60), rng.uniform(0.1, 10)) for _ in range(200)]
+    index = SceneIndex(scenes)
+    for _ in range(500):
+        t = rng.uniform(-1, 75)
+        assert index.active(t) == brute_force(scenes, t)
+
+
+def test_next_start():
+    index = SceneIndex([scene(0.0, 2.5), scene(2.0, 3.5), scene(5.0, 1.5)])
+    assert index.next_start(-1.0) == (0, 0.0)
+    assert index.next_start(0.0) == (1, 2.0)
+    assert index.next_start(4.9) == (2, 5.0)
+    assert index.next_start(5.0) is None
+    assert SceneIndex([]).next_start(0.0) is None
+    assert SceneIndex([]).active(0.0) == []
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from video.kenburns import KenBurnsClip
+
+
+def gradient(width: int, height: int) -> Image.Image:
+    x = np.linspace(0, 255, width, dtype=np.uint8)
+    y = np.linspace(0, 255, height, dtype=np.uint8)
+    pixels = np.stack([np.tile(x, (height, 1)), np.tile(y[:, None], (1, width)), np.full((height, width), 128, np.uint8)],
+                      axis=-1)
+    return Image.fromarray(pixels)
+
+
+def test_first_frame_shows_the_whole_cover_fitted_image():
+    clip = KenBurnsClip(gradient(400, 100), size=(100, 100), duration=1.0, zoom_factor=0.5, zoom_duration=1.0,
+                        fps=4, use_pyramid=False)
+    # wider than the output: the height fills it, the sides are cropped evenly
+    assert clip.rects[0] == pytest.approx([150, 0, 250, 100])
+    clip.close()
+
+
+def test_rectangles_shrink_around_the_center():
+    clip = KenBurnsClip(gradient(200, 400), size=(100, 200), duration=1.0, zoom_factor=0.5, zoom_duration=1.0,
+                        fps=4, use_pyramid=False)
+    assert len(clip.rects) == 5
+    # scale 1 + 0.5 * t, the visible part is 1 / scale of the image
+    for i, t in enumerate([0, 0.25, 0.5, 0.75, 1.0]):
+        scale = 1 + 0.5 * t
+        w, h = 200 / scale, 400 / scale
+        assert clip.rects[i] == pytest.approx([(200 - w) / 2, (400 - h) / 2, (200 + w) / 2, (400 + h) / 2])
+    clip.close()
+
+
+def test_zoom_keeps_its_pace_past_zoom_duration():
+    # the crossfade tail (duration - zoom_duration) keeps zooming at the same pace
+    clip = KenBurnsClip(gradient(200, 400), size=(100, 200), duration=1.5, zoom_factor=0.5, zoom_duration=1.0,
+                        fps=2, use_pyramid=False)
+    widths = clip.rects[:, 2] - clip.rects[:, 0]
+    assert widths == pytest.approx([200, 200 / 1.25, 200 / 1.5, 200 / 1.75])
+    clip.close()
+
+
+def test_pyramid_level_keeps_output_resolution():
+    clip = KenBurnsClip(gradient(400, 800), size=(100, 200), duration=1.0, zoom_factor=1.0, zoom_duration=1.0,
+                        fps=4)
+    assert [level.size for level in clip.levels] == [(400, 800), (200, 400), (100, 200)]
+    for i, (rect, level) in enumerate(zip(clip.rects, clip.rect_levels)):
+        # rectangle in level coordinates, at least as big as the output
+        assert rect[2] - rect[0] >= 100 - 1e-6
+        assert rect[3] - rect[1] >= 200 - 1e-6
+        assert (rect[2] - rect[0]) * 2 ** level == pytest.approx(400 / (1 + i / 4))
+    assert clip.rect_levels[0] == 2
+    assert clip.rect_levels[-1] == 1
+    clip.close()
+
+
+def test_pyramid_frames_match_full_resolution_frames():
+    image = gradient(400, 800)
+    fast = KenBurnsClip(image, size=(100, 200), duration=1.0, zoom_factor=0.3, zoom_duration=1.0, fps=4)
+    exact = KenBurnsClip(image, size=(100, 200), duration=1.0, zoom_factor=0.3, zoom_duration=1.0, fps=4,
+                         use_pyramid=False)
+    for t in (0, 0.5, 1.0):
+        frame = fast.get_frame(t)
+        assert frame.shape == (200, 100, 3)
+        assert np.abs(frame.astype(int) - exact.get_frame(t).astype(int)).max() <= 3
+    fast.close()
+    exact.close()
@@ -0,0 +1,70 @@
+import pytest
+
+from limits.limiter import AdaptiveLimiter, is_throttled
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+def call(limiter: AdaptiveLimiter, latency: float = 0.1, error: BaseException | None = None):
+    limiter.acquire()
+    limiter.release(latency, error)
+
+
+@pytest.fixture
+def limiter():
+    return AdaptiveLimiter("test", rate=1000.0, initial_concurrency=4, max_concurrency=6, target_latency=1.0)
+
+
+def test_successes_grow_the_limit_by_about_one_per_limit_calls(limiter):
+    # 4 + 1/4 + 1/4.25 + ... crosses 5 on the fifth call
+    for _ in range(4):
+        call(limiter)
+    assert limiter.limit == 4
+    call(limiter)
+    assert limiter.limit == 5
+
+    for _ in range(100):
+        call(limiter)
+    assert limiter.limit == 6
+
+
+def test_throttling_halves_the_limit_once_per_cooldown(limiter):
+    call(limiter, error=RateLimited())
+    assert limiter.limit == 2
+    assert limiter.throttled == 1
+
+    # the same congestion event, reported by another call
+    call(limiter, error=RateLimited())
+    assert limiter.limit == 2
+
+    limiter._last_decrease -= 2 * limiter.target_latency
+    call(limiter, error=RateLimited())
+    assert limiter.limit == 1
+    limiter._last_decrease -= 2 * limiter.target_latency
+    call(limiter, error=RateLimited())
+    assert limiter.limit == limiter.min_concurrency
+
+
+def test_slow_calls_and_other_errors_back_off_gently(limiter):
+    call(limiter, latency=3 * limiter.target_latency)
+    assert limiter.limit == 3  # 4 * 0.9
+
+    limiter._last_decrease -= 2 * limiter.target_latency
+    call(limiter, error=ConnectionError("reset by peer"))
+    assert limiter.limit == 2  # 3.6 * 0.8
+    assert limiter.throttled == 0
+
+
+def test_calls_slower_than_target_dont_grow_the_limit(limiter):
+    for _ in range(20):
+        call(limiter, latency=1.5 * limiter.target_latency)
+    assert limiter.limit == 4
+
+
+def test_throttling_is_recognized_from_status_or_message():
+    assert is_throttled(RateLimited())
+    assert is_throttled(Exception("429 Too Many Requests"))
+    assert is_throttled(Exception("RESOURCE_EXHAUSTED: quota exceeded"))
+    assert not is_throttled(Exception("500 internal error"))
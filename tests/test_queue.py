@@ -0,0 +1,94 @@
+import json
+import sqlite3
+
+import pytest
+
+from batch.queue import JobQueue, QUEUED, GENERATING, GENERATED, RENDERING, DONE, FAILED, DUPLICATE
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(tmp_path / "queue.sqlite")
+
+
+def test_a_topic_is_queued_once_while_unfinished(queue):
+    first = queue.enqueue("A Lost Kitten", playback_speed=1.5)
+    # same slug
+    assert queue.enqueue("a lost kitten") == first
+    assert queue.counts() == {QUEUED: 1}
+
+    queue.claim(QUEUED, GENERATING)
+    assert queue.enqueue("A Lost Kitten") == first
+
+    queue.update(first, DONE, video_path="kitten.mp4")
+    second = queue.enqueue("A Lost Kitten")
+    assert second != first
+    assert queue.counts() == {DONE: 1, QUEUED: 1}
+
+
+def test_enqueueing_a_failed_topic_requeues_it(queue):
+    job_id = queue.enqueue("storm at sea", playback_speed=1.5)
+    queue.claim(QUEUED, GENERATING)
+    queue.update(job_id, FAILED, error="generation: boom")
+
+    assert queue.enqueue("storm at sea", playback_speed=2.0) == job_id
+    job = queue.get(job_id)
+    assert job["status"] == QUEUED
+    assert job["attempts"] == 0
+    assert job["options"] == {"playback_speed": 2.0}
+
+
+def test_import_skips_topics_already_queued(queue, tmp_path):
+    queue.enqueue("storm at sea")
+    jsonl = tmp_path / "topics.jsonl"
+    jsonl.write_text("\n".join(json.dumps(entry) for entry in [
+        {"topic": "storm at sea"},
+        {"topic": "a quiet library", "test": True},
+        {"topic": "A Quiet Library"},
+    ]) + "\n", encoding="utf-8")
+
+    ids = queue.import_jsonl(jsonl)
+    assert len(ids) == 1
+    assert queue.get(ids[0])["options"] == {"test": True}
+
+
+def test_failed_jobs_are_retried_until_out_of_attempts(queue):
+    job_id = queue.enqueue("storm at sea")
+    for attempt in range(1, 4):
+        job = queue.claim(QUEUED, GENERATING)
+        assert job["attempts"] == attempt
+        queue.update(job_id, FAILED, error="boom")
+        assert queue.requeue_failed(max_attempts=3) == (1 if attempt < 3 else 0)
+    assert queue.get(job_id)["status"] == FAILED
+
+
+def test_interrupted_jobs_are_recovered(queue):
+    generating = queue.enqueue("one")
+    rendering = queue.enqueue("two")
+    queue.claim(QUEUED, GENERATING)
+    queue.claim(QUEUED, GENERATING)
+    queue.update(rendering, GENERATED, state_path="two.json")
+    queue.claim(GENERATED, RENDERING)
+
+    assert queue.recover_interrupted() == 2
+    assert queue.get(generating)["status"] == QUEUED
+    assert queue.get(rendering)["status"] == GENERATED
+
+
+def test_queues_without_slugs_are_migrated(tmp_path):
+    path = tmp_path / "queue.sqlite"
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, topic TEXT NOT NULL, options TEXT NOT NULL DEFAULT '{}',
+            status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, error TEXT, state_path TEXT,
+            video_path TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)
+    """)
+    for topic, status in [("Storm at sea", DONE), ("storm at sea", QUEUED), ("Storm At Sea", FAILED)]:
+        conn.execute("INSERT INTO jobs (topic, status, created_at, updated_at) VALUES (?, ?, 0, 0)", (topic, status))
+    conn.commit()
+    conn.close()
+
+    queue = JobQueue(path)
+    assert [queue.get(i)["status"] for i in (1, 2, 3)] == [DONE, QUEUED, DUPLICATE]
+    assert queue.enqueue("storm at sea") == 2
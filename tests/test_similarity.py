@@ -0,0 +1,69 @@
+import pytest
+
+from catalog.catalog import Catalog, IMAGE
+from catalog.similarity import PROMPT_REUSE_THRESHOLD, jaccard, shingles
+
+GOLDEN_POND = ("A colorful butterfly resting gently on a lily pad, its wings glowing in sunlight, with Whiskers "
+               "the ginger cat sitting peacefully nearby, purring softly, by a calm pond, serene and heartwarming "
+               "scene, golden hour lighting, impressionistic art style.")
+
+# same style and most of the words, but a different picture
+NEAR_MISSES = [
+    (GOLDEN_POND,
+     "A colorful butterfly resting gently on a lily pad, its wings glowing, with Whiskers the ginger cat sitting "
+     "peacefully nearby, purring softly, by a calm pond at night, serene and heartwarming scene, moonlight "
+     "lighting, impressionistic art style."),
+    (GOLDEN_POND,
+     "A colorful butterfly resting gently on a lily pad, its wings glowing in sunlight, with Rex the brown dog "
+     "sitting peacefully nearby, by a calm pond, serene and heartwarming scene, golden hour lighting, "
+     "impressionistic art style."),
+    ("A russet fox, Flicker, crouched low in a vegetable patch, amber eyes focused on a tiny grey field mouse, "
+     "highly detailed, cinematic lighting, digital art style.",
+     "A russet fox, Flicker, leaping over a low fence into the deep woods, chased by a hound dog, "
+     "highly detailed, cinematic lighting, digital art style."),
+    ("A young student standing in front of a bustling university campus on the first day, the sun is rising, "
+     "vibrant colors, photorealistic style, 4k.",
+     "A tired student sitting alone in an empty university library late at night, the moon is rising, "
+     "vibrant colors, photorealistic style, 4k."),
+]
+
+# the same scene, reworded or with different boilerplate
+DUPLICATES = [
+    (GOLDEN_POND,
+     "A colorful butterfly resting gently on a lily pad, wings glowing in the sunlight, with Whiskers the ginger "
+     "cat sitting peacefully nearby and purring softly by a calm pond. Serene, heartwarming scene, golden hour "
+     "lighting, impressionistic art style."),
+    (GOLDEN_POND,
+     "A colorful butterfly resting gently on a lily pad, its wings glowing in sunlight, with Whiskers the ginger "
+     "cat sitting peacefully nearby, purring softly, by a calm pond, serene and heartwarming, golden hour, "
+     "impressionistic style, highly detailed, 4k."),
+]
+
+
+@pytest.mark.parametrize("prompt,other", NEAR_MISSES)
+def test_near_misses_score_below_the_default_threshold(prompt, other):
+    assert jaccard(shingles(prompt), shingles(other)) < PROMPT_REUSE_THRESHOLD
+
+
+@pytest.mark.parametrize("prompt,other", DUPLICATES)
+def test_rewordings_reach_the_default_threshold(prompt, other):
+    assert jaccard(shingles(prompt), shingles(other)) >= PROMPT_REUSE_THRESHOLD
+
+
+def test_boilerplate_is_ignored():
+    assert shingles("a calm pond, golden hour lighting, highly detailed") == \
+        shingles("calm pond golden hour, cinematic 4k")
+
+
+def test_catalog_reuses_only_close_prompts(tmp_path):
+    catalog = Catalog(tmp_path / "catalog.sqlite", enabled=True)
+    catalog.add_asset("earlier_story", IMAGE, position=0, prompt=GOLDEN_POND, url="https://example.com/golden.png")
+
+    for _, near_miss in NEAR_MISSES[:2]:
+        assert catalog.find_similar_prompt(near_miss, threshold=PROMPT_REUSE_THRESHOLD) is None
+
+    match = catalog.find_similar_prompt(DUPLICATES[0][1], threshold=PROMPT_REUSE_THRESHOLD)
+    assert match is not None and match["url"] == "https://example.com/golden.png"
+    # never the story's own images
+    assert catalog.find_similar_prompt(GOLDEN_POND, threshold=PROMPT_REUSE_THRESHOLD,
+                                       exclude_slug="earlier_story") is None
@@ -0,0 +1,48 @@
+from schemas.schemas import Timeline
+from video.timeline import build_scenes, segment_frame_ranges, total_frames
+
+
+def make_timeline(durations, crossfade: float = 0.5, fps: int = 24) -> Timeline:
+    scenes = build_scenes([f"{i}.jpg" for i in range(len(durations))], durations, crossfade)
+    return Timeline(size=(108, 192), fps=fps, duration=sum(durations), zoom_factor=0.1, scenes=scenes,
+                    srt_path="subtitles.srt", font_path="font.ttf")
+
+
+def test_scenes_overlap_by_the_crossfade():
+    scenes = make_timeline([2.0, 3.0, 1.5]).scenes
+    assert [scene.start for scene in scenes] == [0.0, 2.0, 5.0]
+    assert [scene.duration for scene in scenes] == [2.5, 3.5, 1.5]
+    assert [scene.zoom_duration for scene in scenes] == [2.0, 3.0, 1.5]
+    assert [scene.crossfade for scene in scenes] == [0.0, 0.5, 0.5]
+
+
+def test_ranges_split_at_scene_starts_on_the_frame_grid():
+    timeline = make_timeline([2.0, 3.0, 1.5])
+    assert total_frames(timeline) == 156
+    assert segment_frame_ranges(timeline) == [(0, 48), (48, 120), (120, 156)]
+
+    # a start between two frames belongs to the next frame
+    timeline = make_timeline([1.01, 1.0])
+    assert segment_frame_ranges(timeline) == [(0, 25), (25, 48)]
+
+
+def test_ranges_cover_every_frame_once():
+    timeline = make_timeline([0.7, 2.3, 1.1, 0.05, 4.0], fps=30)
+    ranges = segment_frame_ranges(timeline, min_segments=8, min_frames=10)
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == total_frames(timeline)
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+    assert all(end > start for start, end in ranges)
+
+
+def test_longest_ranges_are_halved_for_more_workers():
+    timeline = make_timeline([10.0])
+    assert segment_frame_ranges(timeline, min_segments=4, min_frames=48) == [
+        (0, 60), (60, 120), (120, 180), (180, 240)]
+
+
+def test_ranges_are_not_halved_below_min_frames():
+    timeline = make_timeline([4.0])
+    # 96 frames: one halving leaves 48 per range, another would go below min_frames
+    assert segment_frame_ranges(timeline, min_segments=4, min_frames=48) == [(0, 48), (48, 96)]
+    assert segment_frame_ranges(timeline, min_segments=4, min_frames=49) == [(0, 96)]